@@ -0,0 +1,115 @@
+"""
+Synthetic media corpus for benchmarks.
+
+Generates a reproducible tree of JPEGs with varied EXIF, byte-identical duplicates and MOV/MP4 files with real
+moov headers (mvhd creation time, udta make/model) in front of a filler mdat of configurable size.
+"""
+import os
+import time
+import random
+import shutil
+import struct
+from PIL import Image, ImageDraw
+from src.video import QUICKTIME_EPOCH_OFFSET
+
+CAMERAS = [('FUJIFILM', 'X-T4'), ('Canon', 'Canon EOS R5'), ('NIKON CORPORATION', 'NIKON Z 6'), ('SONY', 'ILCE-7M3'),
+           ('Apple', 'iPhone 13 Pro')]
+
+# Capture dates are spread over this many days before FIRST_CAPTURE_TIME
+FIRST_CAPTURE_TIME = 1694000000
+CAPTURE_DAYS = 60
+
+WRITE_CHUNK_BYTES = 1024 * 1024
+
+
+def corpus_directory(root, rng, depth):
+    """Return a random nested card/DCIM-style folder under root."""
+    parts = [f"card{rng.randrange(4)}"] + [f"{100 + rng.randrange(5)}MEDIA" for _ in range(depth - 1)]
+    return os.path.join(root, *parts)
+
+
+def make_jpeg(file_path, rng, size, camera, taken):
+    """Write a JPEG with Make, Model and DateTime in its EXIF."""
+    image = Image.new('RGB', size, tuple(rng.randrange(256) for _ in range(3)))
+    draw = ImageDraw.Draw(image)
+    # Some structure, so the files compress more like photos than flat fills
+    for _ in range(24):
+        x, y = rng.randrange(size[0]), rng.randrange(size[1])
+        draw.rectangle((x, y, x + rng.randrange(size[0] // 2), y + rng.randrange(size[1] // 2)),
+                       fill=tuple(rng.randrange(256) for _ in range(3)))
+    exif = Image.Exif()
+    exif[0x010f], exif[0x0110] = camera
+    exif[0x0132] = time.strftime("%Y:%m:%d %H:%M:%S", time.localtime(taken))
+    image.save(file_path, 'JPEG', quality=90, exif=exif)
+
+
+def _box(box_type, payload):
+    return struct.pack('>I4s', 8 + len(payload), box_type) + payload
+
+
+def _text_atom(atom, text):
+    text = text.encode('utf-8')
+    return _box(atom, struct.pack('>HH', len(text), 0) + text)
+
+
+def make_video(file_path, rng, size, camera, taken):
+    """Write a QuickTime file whose moov carries the creation time and make/model, padded to about `size` bytes."""
+    creation_time = taken + QUICKTIME_EPOCH_OFFSET
+    mvhd = _box(b'mvhd', bytes(4) + struct.pack('>II', creation_time, creation_time) + bytes(88))
+    udta = _box(b'udta', _text_atom(b'\xa9mak', camera[0]) + _text_atom(b'\xa9mod', camera[1]))
+    header = _box(b'ftyp', b'qt  ' + bytes(4) + b'qt  ') + _box(b'moov', mvhd + udta)
+    filler_size = max(0, size - len(header) - 8)
+    with open(file_path, 'wb') as f:
+        f.write(header)
+        f.write(struct.pack('>I4s', 8 + filler_size, b'mdat'))
+        while filler_size > 0:
+            chunk = min(filler_size, WRITE_CHUNK_BYTES)
+            f.write(rng.randbytes(chunk))
+            filler_size -= chunk
+
+
+def generate_corpus(root, images=200, videos=10, image_size=(1600, 1200), video_bytes=8 * 1024 * 1024,
+                    duplicate_fraction=0.1, depth=3, seed=0):
+    """Create the corpus under root, which must be missing or empty, and return the paths of the files written.
+
+    The same arguments always produce the same files and modification times.
+    """
+    if os.path.isdir(root) and os.listdir(root):
+        raise FileExistsError(f"{root} is not empty; the corpus is only generated into a new folder")
+    rng = random.Random(seed)
+    paths = []
+    for kind, count in (('image', images), ('video', videos)):
+        for index in range(count):
+            directory = corpus_directory(root, rng, depth)
+            os.makedirs(directory, exist_ok=True)
+            camera = rng.choice(CAMERAS)
+            taken = FIRST_CAPTURE_TIME - rng.randrange(CAPTURE_DAYS * 86400)
+            if kind == 'image':
+                file_path = os.path.join(directory, f"IMG_{index:05d}.JPG")
+                make_jpeg(file_path, rng, image_size, camera, taken)
+            else:
+                file_path = os.path.join(directory, f"MOV_{index:05d}.{rng.choice(['MOV', 'MP4'])}")
+                make_video(file_path, rng, video_bytes, camera, taken)
+            os.utime(file_path, (taken, taken))
+            paths.append(file_path)
+
+    # Byte-identical copies, as left behind by importing the same card twice
+    for file_path in rng.sample(paths, int(len(paths) * duplicate_fraction)):
+        directory = corpus_directory(root, rng, depth)
+        os.makedirs(directory, exist_ok=True)
+        copy_path = os.path.join(directory, "copy_" + os.path.basename(file_path))
+        shutil.copy2(file_path, copy_path)
+        paths.append(copy_path)
+    return paths
+
+
+def change_corpus(paths, fraction=0.1, seed=1):
+    """Modify a fraction of the files in place (appending bytes and bumping mtime) and return the paths changed."""
+    rng = random.Random(seed)
+    changed = rng.sample(paths, int(len(paths) * fraction))
+    for file_path in changed:
+        file_stat = os.stat(file_path)
+        with open(file_path, 'ab') as f:
+            f.write(rng.randbytes(16))
+        os.utime(file_path, ns=(file_stat.st_atime_ns, file_stat.st_mtime_ns + 1_000_000_000))
+    return changed
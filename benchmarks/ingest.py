@@ -0,0 +1,165 @@
+"""
+Ingest benchmarks.
+
+    python -m benchmarks.ingest --images 500 --videos 20 --json bench_output.json
+
+Generates a synthetic corpus in a scratch folder and times organize_files (or stream_organize_files) on a cold
+file cache, a warm file cache and after changing part of the corpus, then times hash_file, output_image_path
+and output_video_path on their own. Reports files/s, MB/s, cache hit rate and time per pipeline stage.
+
+"Cold" means a new file_cache.db and output folder; the OS page cache is left alone, so the first run still
+reads the freshly generated files from memory.
+"""
+import os
+import json
+import time
+import shutil
+import logging
+import argparse
+import tempfile
+from src.main import organize_files, output_image_path, output_video_path, media_kind, DEFAULT_WORKERS
+from src.stream import stream_organize_files
+from src.metrics import METRICS
+from src.hashing import hash_file, resolve_hash_algorithm, HASH_ALGORITHMS, DEFAULT_HASH_ALGORITHM
+from benchmarks.corpus import generate_corpus, change_corpus
+
+def corpus_size(source_folder):
+    """Return (media file count, total bytes) under the source folder."""
+    files = total_bytes = 0
+    for directory, _, names in os.walk(source_folder):
+        for name in names:
+            if media_kind(name) is not None:
+                files += 1
+                total_bytes += os.path.getsize(os.path.join(directory, name))
+    return files, total_bytes
+
+
+def run_scenario(name, organize, source_folder, output_folder, cache_path, options):
+    """Run one organize pass and return its measurements, with stage times and counters from METRICS."""
+    files, total_bytes = corpus_size(source_folder)
+    METRICS.reset()
+    start = time.perf_counter()
+    organize(source_folder=source_folder, output_folder=output_folder, cache_path=cache_path, **options)
+    seconds = time.perf_counter() - start
+    metrics = METRICS.as_dict()
+    counters = metrics['counters']
+    lookups = counters.get('cache_hits', 0) + counters.get('cache_misses', 0)
+    return {'scenario': name, 'files': files, 'bytes': total_bytes, 'seconds': seconds,
+            'files_per_second': files / seconds, 'mb_per_second': total_bytes / seconds / 1e6,
+            'cache_hit_rate': counters.get('cache_hits', 0) / lookups if lookups else 0.0,
+            'stages': metrics['stages'], 'counters': counters}
+
+
+def run_microbenchmarks(paths):
+    """Time hash_file per algorithm and the image/video metadata readers on their own."""
+    results = []
+    total_bytes = sum(os.path.getsize(file_path) for file_path in paths)
+    for algorithm in sorted(HASH_ALGORITHMS):
+        start = time.perf_counter()
+        for file_path in paths:
+            hash_file(file_path, algorithm)
+        seconds = time.perf_counter() - start
+        results.append({'benchmark': f'hash_file[{algorithm}]', 'files': len(paths), 'seconds': seconds,
+                        'files_per_second': len(paths) / seconds, 'mb_per_second': total_bytes / seconds / 1e6})
+    for extractor, kind in ((output_image_path, 'image'), (output_video_path, 'video')):
+        kind_paths = [file_path for file_path in paths if media_kind(file_path) == kind]
+        if not kind_paths:
+            continue
+        start = time.perf_counter()
+        for file_path in kind_paths:
+            extractor(file_path)
+        seconds = time.perf_counter() - start
+        results.append({'benchmark': extractor.__name__, 'files': len(kind_paths), 'seconds': seconds,
+                        'files_per_second': len(kind_paths) / seconds})
+    return results
+
+
+def print_report(scenarios, microbenchmarks):
+    print(f"{'scenario':<16}{'files':>8}{'seconds':>10}{'files/s':>10}{'MB/s':>10}{'cache hits':>12}")
+    for result in scenarios:
+        print(f"{result['scenario']:<16}{result['files']:>8}{result['seconds']:>10.2f}{result['files_per_second']:>10.1f}"
+              f"{result['mb_per_second']:>10.1f}{result['cache_hit_rate']:>11.0%}")
+        for stage, seconds in sorted(result['stages'].items(), key=lambda item: -item[1]):
+            print(f"    {stage:<24}{seconds:>8.2f}s")
+    print()
+    print(f"{'benchmark':<28}{'files':>8}{'seconds':>10}{'files/s':>10}{'MB/s':>10}")
+    for result in microbenchmarks:
+        mb_per_second = f"{result['mb_per_second']:>10.1f}" if 'mb_per_second' in result else f"{'':>10}"
+        print(f"{result['benchmark']:<28}{result['files']:>8}{result['seconds']:>10.2f}{result['files_per_second']:>10.1f}{mb_per_second}")
+
+
+def remove_scratch(root, source_folder, output_folder, cache_path, temporary):
+    """Delete what the benchmark wrote: the whole folder if it came from mkdtemp, else only its own files."""
+    if temporary:
+        shutil.rmtree(root, ignore_errors=True)
+        return
+    shutil.rmtree(source_folder, ignore_errors=True)
+    shutil.rmtree(output_folder, ignore_errors=True)
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(cache_path + suffix):
+            os.remove(cache_path + suffix)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark photo-flow ingest on a synthetic corpus.")
+    parser.add_argument('--root', help="Empty or new scratch folder for the corpus, cache and output (default: a new temporary folder).")
+    parser.add_argument('--keep', action='store_true', help="Keep the corpus, cache and output afterwards.")
+    parser.add_argument('--images', type=int, default=200, help="Number of JPEGs to generate.")
+    parser.add_argument('--videos', type=int, default=10, help="Number of MOV/MP4 files to generate.")
+    parser.add_argument('--image-size', default='1600x1200', help="JPEG dimensions, WIDTHxHEIGHT.")
+    parser.add_argument('--video-mb', type=float, default=8, help="Size of each video in MB.")
+    parser.add_argument('--duplicates', type=float, default=0.1, help="Fraction of files copied a second time.")
+    parser.add_argument('--depth', type=int, default=3, help="Folder nesting depth.")
+    parser.add_argument('--changed', type=float, default=0.1, help="Fraction of files modified before the partially-changed run.")
+    parser.add_argument('--seed', type=int, default=0, help="Corpus seed; the same seed gives the same corpus.")
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help="Number of hashing threads and metadata processes.")
+    parser.add_argument('--hash', dest='hash_algorithm', default=DEFAULT_HASH_ALGORITHM, choices=['auto', *sorted(HASH_ALGORITHMS)],
+                        help="Content hash algorithm for the organize runs.")
+    parser.add_argument('--stream', action='store_true', help="Benchmark stream_organize_files instead of organize_files.")
+    parser.add_argument('--skip-micro', action='store_true', help="Skip the hash_file and metadata reader benchmarks.")
+    parser.add_argument('--json', help="Also write the results to this JSON file.")
+    parser.add_argument('--log-level', default='WARNING', choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'],
+                        help="Log level of the organizer while it is being timed.")
+    args = parser.parse_args()
+    logging.basicConfig(level=args.log_level, format="%(asctime)s %(levelname)s %(message)s", datefmt="%H:%M:%S")
+
+    if args.root and os.path.exists(args.root) and (not os.path.isdir(args.root) or os.listdir(args.root)):
+        # Everything the benchmark writes is deleted afterwards, so it never runs in a folder that holds anything else
+        parser.error(f"--root {args.root} must be an empty folder or not exist yet")
+    root = args.root or tempfile.mkdtemp(prefix='photo-flow-bench-')
+    source_folder = os.path.join(root, 'source')
+    output_folder = os.path.join(root, 'output')
+    cache_path = os.path.join(root, 'file_cache.db')
+    width, height = (int(value) for value in args.image_size.split('x'))
+    organize = stream_organize_files if args.stream else organize_files
+    options = {'workers': args.workers, 'hash_algorithm': resolve_hash_algorithm(args.hash_algorithm)}
+    try:
+        print(f"Generating {args.images} images and {args.videos} videos in {source_folder}")
+        start = time.perf_counter()
+        paths = generate_corpus(source_folder, images=args.images, videos=args.videos, image_size=(width, height),
+                                video_bytes=int(args.video_mb * 1024 * 1024), duplicate_fraction=args.duplicates,
+                                depth=args.depth, seed=args.seed)
+        print(f"Generated {len(paths)} files in {time.perf_counter() - start:.1f}s")
+
+        scenarios = []
+        for name in ('cold', 'warm', 'partly changed'):
+            if name == 'cold':
+                shutil.rmtree(output_folder, ignore_errors=True)
+                if os.path.exists(cache_path):
+                    os.remove(cache_path)
+            elif name == 'partly changed':
+                change_corpus(paths, args.changed, seed=args.seed + 1)
+            scenarios.append(run_scenario(name, organize, source_folder, output_folder, cache_path, options))
+        microbenchmarks = [] if args.skip_micro else run_microbenchmarks(paths)
+
+        print_report(scenarios, microbenchmarks)
+        if args.json:
+            with open(args.json, 'w') as f:
+                json.dump({'arguments': vars(args), 'scenarios': scenarios, 'microbenchmarks': microbenchmarks}, f, indent=2)
+    finally:
+        if not args.keep:
+            remove_scratch(root, source_folder, output_folder, cache_path, temporary=not args.root)
+
+
+if __name__ == "__main__":
+    main()
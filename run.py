@@ -2,17 +2,154 @@
 This repo is meant to be cloned into the folder of the dump. This is meant to operate on the parent folder.
 """
 import os
-from src.main import organize_files
+import logging
+import argparse
+from src.main import organize_files, resolve_layout, DEFAULT_WORKERS, LAYOUTS, DEFAULT_LAYOUT
+from src.hashing import HASH_ALGORITHMS, DEFAULT_HASH_ALGORITHM
+from src.cache import FileCache, DEFAULT_CACHE_PATH
+from src.cache_export import export_cache, import_cache
+from src.previews import DEFAULT_PREVIEW_DIR
+from src.stream import stream_organize_files
+from src.watch import watch_files, DEFAULT_SETTLE_SECONDS
+from src.metrics import METRICS
+from src.similar import DEFAULT_SIMILARITY_DISTANCE, np
+from src.catalog import rebuild_output
+from src.materialize import LINK_MODES, DEFAULT_LINK_MODE
 
-# Get the absolute path of the current script
-current_script_path = os.path.abspath(__file__)
 
-# Get the directory containing the script
-current_directory = os.path.dirname(current_script_path)
+def similar_requested(args):
+    return args.similar or args.collapse_similar or args.similar_report is not None
 
-# Get the parent directory of the current directory
-parent_directory = os.path.dirname(current_directory)
-output_directory = os.path.join(parent_directory, 'photo-flow-output')
 
-organize_files(source_folder=parent_directory, output_folder=output_directory)
+def shard_spec(value):
+    """Parse 'I/N' (1-based) into the (index, count) that organize_files takes."""
+    try:
+        index, count = (int(part) for part in value.split('/'))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected I/N, got {value!r}")
+    if not 1 <= index <= count:
+        raise argparse.ArgumentTypeError(f"shard {index} is outside 1..{count}")
+    return index - 1, count
 
+
+def path_mapping(value):
+    old, separator, new = value.partition('=')
+    if not separator or not old or not new:
+        raise argparse.ArgumentTypeError(f"expected FROM=TO, got {value!r}")
+    return old, new
+
+
+if __name__ == "__main__":
+    # Metadata is parsed in worker processes, so the entry point must be import-safe
+    parser = argparse.ArgumentParser(description="Organize the parent folder into photo-flow-output.")
+    parser.add_argument('--verify', action='store_true', help="Re-hash every file even if its stat matches the cache (audit mode).")
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help="Number of hashing threads and metadata processes.")
+    parser.add_argument('--hash', dest='hash_algorithm', default=DEFAULT_HASH_ALGORITHM, choices=['auto', *sorted(HASH_ALGORITHMS)],
+                        help="Content hash algorithm; 'auto' picks the fastest installed backend (xxh3, BLAKE3, then BLAKE2b).")
+    parser.add_argument('--stream', action='store_true', help="Link files as they are processed, in bounded memory, deduplicating against the cache.")
+    parser.add_argument('--watch', action='store_true', help="Keep running and organize new files as they land (inotify on Linux, polling elsewhere).")
+    parser.add_argument('--settle', type=float, default=DEFAULT_SETTLE_SECONDS, help="Seconds a new file must stay unchanged before --watch ingests it.")
+    parser.add_argument('--cache-db', default=DEFAULT_CACHE_PATH, help="Path of the SQLite file cache (default: file_cache.db in the working directory).")
+    parser.add_argument('--previews', action='store_true', help="Also cache screen-size previews and thumbnails of every image for the viewer.")
+    parser.add_argument('--preview-dir', default=DEFAULT_PREVIEW_DIR, help="Folder of the preview cache (default: previews in the working directory).")
+    parser.add_argument('--dry-run', action='store_true', help="Log the folders and links that would be created without touching the output folder.")
+    parser.add_argument('--similar', action='store_true', help="Also group near-duplicate images (bursts, resized or re-encoded copies) by perceptual hash; needs numpy.")
+    parser.add_argument('--similar-distance', type=int, default=DEFAULT_SIMILARITY_DISTANCE,
+                        help="Most bits (of 64) two perceptual hashes may differ by to count as similar.")
+    parser.add_argument('--similar-report', help="Write the groups of similar images to this JSON file (implies --similar).")
+    parser.add_argument('--collapse-similar', action='store_true',
+                        help="Link all but the earliest image of each similar group into a similar/ folder beside it (implies --similar).")
+    parser.add_argument('--layout', default=DEFAULT_LAYOUT,
+                        help=f"Output folder layout: {', '.join(sorted(LAYOUTS))}, or a format such as '{{year}}/{{month}}/{{camera}}'.")
+    parser.add_argument('--link-mode', default=DEFAULT_LINK_MODE, choices=LINK_MODES,
+                        help="How files appear in the output: symlinks, hardlinks, reflinks (copy-on-write clones) or verified copies.")
+    parser.add_argument('--output', help="Output folder (default: photo-flow-output next to the source folder).")
+    parser.add_argument('--rebuild', action='store_true',
+                        help="Link the output from the file cache alone, without reading the sources; combine with the filters below.")
+    parser.add_argument('--camera', action='append', help="With --rebuild, only link files from this camera (repeatable).")
+    parser.add_argument('--from', dest='date_from', help="With --rebuild, only link files taken on or after this date (YYYY-MM-DD).")
+    parser.add_argument('--to', dest='date_to', help="With --rebuild, only link files taken on or before this date (YYYY-MM-DD).")
+    parser.add_argument('--kind', choices=['image', 'video'], help="With --rebuild, only link images or only videos.")
+    parser.add_argument('--prune', action='store_true', help="With --rebuild, remove links in the output that are not part of the new tree.")
+    parser.add_argument('--shard', type=shard_spec, help="Hash and parse only share I of N of the source tree into the cache, without linking (e.g. 2/4).")
+    parser.add_argument('--import-cache', action='append', default=[],
+                        help="Merge a cache export or another file_cache.db into the cache before running (repeatable).")
+    parser.add_argument('--path-map', type=path_mapping, action='append', default=[],
+                        help="With --import-cache, rewrite imported source paths starting with FROM to start with TO (FROM=TO, repeatable).")
+    parser.add_argument('--export-cache', help="Write the cache to this export file after running.")
+    parser.add_argument('--cache-only', action='store_true', help="Only import and export the cache; don't organize anything.")
+    parser.add_argument('--log-level', default='INFO', choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'],
+                        help="DEBUG logs every file; INFO logs stage summaries and shows a progress line.")
+    parser.add_argument('--metrics', help="Write per-stage timings and counters to this JSON file at the end of the run.")
+    args = parser.parse_args()
+    logging.basicConfig(level=args.log_level, format="%(asctime)s %(levelname)s %(message)s", datefmt="%H:%M:%S")
+    log = logging.getLogger('photo-flow')
+    preview_dir = args.preview_dir if args.previews else None
+    try:
+        resolve_layout(args.layout)
+    except ValueError as e:
+        parser.error(str(e))
+    if args.rebuild and (args.stream or args.watch or similar_requested(args)):
+        parser.error("--rebuild cannot be combined with --stream, --watch or the --similar options")
+    if not args.rebuild and (args.camera or args.date_from or args.date_to or args.kind or args.prune):
+        parser.error("--camera, --from, --to, --kind and --prune only apply to --rebuild")
+    if args.dry_run and (args.stream or args.watch):
+        # Streaming records every link in the cache as it goes, so it has no side-effect-free mode
+        parser.error("--dry-run cannot be combined with --stream or --watch")
+    if args.shard and (args.stream or args.watch or args.rebuild or args.dry_run or similar_requested(args)):
+        parser.error("--shard only works with the default mode, without --dry-run or the --similar options")
+    if args.link_mode != 'symlink' and (args.stream or args.watch):
+        # Streaming retracts links to later-found duplicates, which only ever removes symlinks
+        parser.error("--link-mode only applies to the default mode and --rebuild")
+    if args.path_map and not args.import_cache:
+        parser.error("--path-map only applies to --import-cache")
+    similar = similar_requested(args)
+    if similar and (args.stream or args.watch):
+        # Grouping needs every image's hash at once, which the streaming modes never hold
+        parser.error("--similar cannot be combined with --stream or --watch")
+    if similar and np is None:
+        parser.error("--similar needs numpy (pip install numpy)")
+
+    # Get the absolute path of the current script
+    current_script_path = os.path.abspath(__file__)
+
+    # Get the directory containing the script
+    current_directory = os.path.dirname(current_script_path)
+
+    # Get the parent directory of the current directory
+    parent_directory = os.path.dirname(current_directory)
+    output_directory = args.output or os.path.join(parent_directory, 'photo-flow-output')
+
+    if args.import_cache:
+        with FileCache(args.cache_db) as cache:
+            for path in args.import_cache:
+                import_cache(cache, path, dict(args.path_map))
+
+    if args.cache_only:
+        log.info("Skipping organizing (--cache-only)")
+    elif args.rebuild:
+        rebuild_output(output_directory, cache_path=args.cache_db, layout=args.layout, cameras=args.camera,
+                       date_from=args.date_from, date_to=args.date_to, source_folder=parent_directory,
+                       kinds=(args.kind,) if args.kind else ('image', 'video'), prune=args.prune, dry_run=args.dry_run,
+                       link_mode=args.link_mode, workers=args.workers)
+    elif args.watch:
+        watch_files(source_folder=parent_directory, output_folder=output_directory, workers=args.workers,
+                    hash_algorithm=args.hash_algorithm, cache_path=args.cache_db, settle_seconds=args.settle,
+                    preview_dir=preview_dir, layout=args.layout)
+    elif args.stream:
+        stream_organize_files(source_folder=parent_directory, output_folder=output_directory, verify=args.verify,
+                              workers=args.workers, hash_algorithm=args.hash_algorithm, cache_path=args.cache_db,
+                              preview_dir=preview_dir, layout=args.layout)
+    else:
+        organize_files(source_folder=parent_directory, output_folder=output_directory, verify=args.verify, workers=args.workers,
+                       hash_algorithm=args.hash_algorithm, cache_path=args.cache_db, preview_dir=preview_dir,
+                       dry_run=args.dry_run, similar=similar, similar_distance=args.similar_distance,
+                       collapse_similar=args.collapse_similar, similar_report=args.similar_report, layout=args.layout,
+                       shard=args.shard, link_mode=args.link_mode)
+
+    if args.export_cache:
+        with FileCache(args.cache_db) as cache:
+            export_cache(cache, args.export_cache)
+    METRICS.log_summary()
+    if args.metrics:
+        METRICS.dump(args.metrics)
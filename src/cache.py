@@ -0,0 +1,345 @@
+import os
+import time
+import logging
+import sqlite3
+from collections import defaultdict
+from src.hashing import DEFAULT_HASH_ALGORITHM
+from src.metrics import METRICS
+
+log = logging.getLogger(__name__)
+
+DEFAULT_CACHE_PATH = 'file_cache.db'
+
+# SQLite limits the number of bound parameters per statement, so bulk lookups go in chunks
+LOOKUP_CHUNK_SIZE = 500
+
+CACHE_COLUMNS = ['file_path', 'file_hash', 'partial_hash', 'hash_algorithm', 'file_size', 'mtime_ns', 'inode',
+                 'camera_name', 'creation_year', 'creation_date', 'phash']
+
+
+def format_phash(phash):
+    """Return a 64-bit perceptual hash as the hex text stored in the cache (SQLite integers are signed)."""
+    return None if phash is None else f"{phash:016x}"
+
+
+def folder_bounds(folder):
+    """Return the (low, high) file_path bounds, both exclusive, of everything below a folder."""
+    # Everything under folder/ sorts between "folder/" and "folder0", since '0' follows '/'
+    folder = os.path.abspath(folder)
+    return folder + os.sep, folder + chr(ord(os.sep) + 1)
+
+
+def merge_row(local, incoming):
+    """Return (outcome, row to write or None) for a row from another cache against the local row for the same path.
+
+    Rows are in CACHE_COLUMNS order. A row describing a newer version of the file (later mtime) replaces the
+    local one; rows for the same version fill in whatever the local row is missing; hashes of the same
+    algorithm that disagree are a conflict and the local row is kept.
+    """
+    if local is None:
+        return 'added', incoming
+    merged = dict(zip(CACHE_COLUMNS, local))
+    other = dict(zip(CACHE_COLUMNS, incoming))
+    if (other['file_size'], other['mtime_ns']) != (merged['file_size'], merged['mtime_ns']):
+        if (other['mtime_ns'] or 0) > (merged['mtime_ns'] or 0):
+            return 'replaced', incoming
+        return 'kept', None
+    if not (merged['file_hash'] or merged['partial_hash']):
+        merged.update(file_hash=other['file_hash'], partial_hash=other['partial_hash'], hash_algorithm=other['hash_algorithm'])
+    elif other['hash_algorithm'] == merged['hash_algorithm']:
+        for column in ('file_hash', 'partial_hash'):
+            if merged[column] and other[column] and merged[column] != other[column]:
+                return 'conflict', None
+            merged[column] = merged[column] or other[column]
+    for column in ('inode', 'camera_name', 'creation_year', 'creation_date', 'phash'):
+        if merged[column] is None:
+            merged[column] = other[column]
+    row = tuple(merged[column] for column in CACHE_COLUMNS)
+    return ('kept', None) if row == tuple(local) else ('updated', row)
+
+
+class FileCache:
+    """SQLite cache of file hashes and metadata, keyed by source path.
+
+    Writes are buffered and committed together every `batch_size` rows or `batch_seconds` seconds,
+    whichever comes first, and lookups are answered in bulk.
+    """
+
+    def __init__(self, db_path=DEFAULT_CACHE_PATH, batch_size=1000, batch_seconds=5.0, check_same_thread=True):
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.batch_seconds = batch_seconds
+        # Callers sharing the cache between threads must serialize access themselves
+        self.conn = sqlite3.connect(db_path, check_same_thread=check_same_thread)
+        # WAL lets readers (e.g. the viewer) work alongside an ingest, and NORMAL sync is safe under WAL
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.cursor = self.conn.cursor()
+        self._pending = []
+        self._last_flush = time.monotonic()
+        self._create_schema()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _create_schema(self):
+        """Create the file cache table, migrating caches written by older versions."""
+        cursor = self.cursor
+        cursor.execute("PRAGMA table_info(file_cache)")
+        columns = [row[1] for row in cursor.fetchall()]
+        legacy = bool(columns) and 'file_size' not in columns
+        if legacy:
+            # Older caches were keyed by hash alone, so re-key them by path to give every copy its own stat row
+            log.info("Migrating file cache to the stat-keyed schema")
+            cursor.execute("ALTER TABLE file_cache RENAME TO file_cache_legacy")
+        # One row per source path; the stat columns let unchanged files skip hashing entirely
+        cursor.execute('''CREATE TABLE IF NOT EXISTS file_cache (
+                            file_path TEXT PRIMARY KEY,
+                            file_hash TEXT,
+                            file_size INTEGER,
+                            mtime_ns INTEGER,
+                            inode INTEGER,
+                            camera_name TEXT,
+                            creation_year TEXT,
+                            creation_date TEXT,
+                            partial_hash TEXT,
+                            hash_algorithm TEXT,
+                            phash TEXT
+                        )''')
+        # Columns added after the stat-keyed schema shipped
+        cursor.execute("PRAGMA table_info(file_cache)")
+        columns = [row[1] for row in cursor.fetchall()]
+        if 'partial_hash' not in columns:
+            cursor.execute("ALTER TABLE file_cache ADD COLUMN partial_hash TEXT")
+        if 'hash_algorithm' not in columns:
+            # Every hash written before the column existed was an MD5
+            cursor.execute("ALTER TABLE file_cache ADD COLUMN hash_algorithm TEXT")
+            cursor.execute("UPDATE file_cache SET hash_algorithm='md5'")
+        if 'phash' not in columns:
+            cursor.execute("ALTER TABLE file_cache ADD COLUMN phash TEXT")
+        cursor.execute("CREATE INDEX IF NOT EXISTS file_cache_hash ON file_cache (file_hash)")
+        # Catalog queries filter by camera and date range; file_path ranges use the primary key
+        cursor.execute("CREATE INDEX IF NOT EXISTS file_cache_camera_date ON file_cache (camera_name, creation_date)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS file_cache_date ON file_cache (creation_date)")
+        if legacy:
+            cursor.execute("""INSERT OR IGNORE INTO file_cache (file_path, file_hash, hash_algorithm, camera_name, creation_year, creation_date)
+                              SELECT file_path, file_hash, 'md5', camera_name, creation_year, creation_date FROM file_cache_legacy""")
+            cursor.execute("DROP TABLE file_cache_legacy")
+        # Files already ingested into each output folder by streaming runs; link_path is NULL for duplicates
+        cursor.execute('''CREATE TABLE IF NOT EXISTS output_index (
+                            output_folder TEXT,
+                            file_path TEXT,
+                            file_size INTEGER,
+                            mtime_ns INTEGER,
+                            file_hash TEXT,
+                            partial_hash TEXT,
+                            hash_algorithm TEXT,
+                            link_path TEXT,
+                            PRIMARY KEY (output_folder, file_path)
+                        )''')
+        cursor.execute("CREATE INDEX IF NOT EXISTS output_index_size ON output_index (output_folder, file_size)")
+        self.conn.commit()
+
+    def _select_in(self, query, values, extra_params=()):
+        """Run `query` (with one IN (...) placeholder) over `values` in chunks and yield the result rows."""
+        values = list(values)
+        for start in range(0, len(values), LOOKUP_CHUNK_SIZE):
+            chunk = values[start:start + LOOKUP_CHUNK_SIZE]
+            placeholders = ', '.join('?' * len(chunk))
+            self.cursor.execute(query.format(placeholders), (*chunk, *extra_params))
+            yield from self.cursor.fetchall()
+
+    def lookup_paths(self, file_stats):
+        """Return {file_path: (file_hash, partial_hash, hash_algorithm, camera_name, creation_year, creation_date)}
+        for the paths in `file_stats` ({file_path: os.stat_result}) whose size, mtime and inode are unchanged."""
+        hits = {}
+        query = ("SELECT file_path, file_size, mtime_ns, inode, file_hash, partial_hash, hash_algorithm, "
+                 "camera_name, creation_year, creation_date FROM file_cache WHERE file_path IN ({})")
+        for file_path, file_size, mtime_ns, inode, *cached in self._select_in(query, file_stats):
+            file_stat = file_stats[file_path]
+            # Rows imported under a different mount point carry no inode
+            if (file_size, mtime_ns) == (file_stat.st_size, file_stat.st_mtime_ns) and inode in (None, file_stat.st_ino):
+                hits[file_path] = tuple(cached)
+        log.debug("Cache hits for %d of %d paths", len(hits), len(file_stats))
+        return hits
+
+    def lookup_hashes(self, file_hashes, hash_algorithm=DEFAULT_HASH_ALGORITHM):
+        """Return {file_hash: (camera_name, creation_year, creation_date)} for the cached hashes among `file_hashes`."""
+        file_hashes = set(file_hashes)
+        query = ("SELECT file_hash, camera_name, creation_year, creation_date FROM file_cache "
+                 "WHERE file_hash IN ({}) AND hash_algorithm=?")
+        hits = {file_hash: tuple(metadata) for file_hash, *metadata in self._select_in(query, file_hashes, (hash_algorithm,))}
+        log.debug("Cache hits for %d of %d hashes", len(hits), len(file_hashes))
+        return hits
+
+    def lookup_content_hash(self, file_path, file_stat):
+        """Return (file_hash, partial_hash, hash_algorithm) for a file whose size and mtime are unchanged, or None."""
+        self.cursor.execute("SELECT file_hash, partial_hash, hash_algorithm FROM file_cache WHERE file_path=? AND file_size=? AND mtime_ns=?",
+                            (file_path, file_stat.st_size, file_stat.st_mtime_ns))
+        row = self.cursor.fetchone()
+        return tuple(row) if row else None
+
+    def lookup_mtimes(self, file_paths):
+        """Return {file_path: mtime_ns} for the cached paths among file_paths, as of when they were last ingested."""
+        query = "SELECT file_path, mtime_ns FROM file_cache WHERE file_path IN ({}) AND mtime_ns IS NOT NULL"
+        return dict(self._select_in(query, file_paths))
+
+    def query_catalog(self, cameras=None, date_from=None, date_to=None, source_folder=None):
+        """Yield (file_path, file_hash, hash_algorithm, mtime_ns, camera_name, creation_year, creation_date) for every
+        cached file matching all the given filters.
+
+        Dates are inclusive YYYY-MM-DD strings, and source_folder keeps only files below that folder.
+        """
+        conditions = ["creation_date IS NOT NULL"]
+        params = []
+        if cameras:
+            conditions.append(f"camera_name IN ({', '.join('?' * len(cameras))})")
+            params.extend(cameras)
+        if date_from:
+            conditions.append("creation_date >= ?")
+            params.append(date_from)
+        if date_to:
+            conditions.append("creation_date <= ?")
+            params.append(date_to)
+        if source_folder:
+            conditions.append("file_path > ? AND file_path < ?")
+            params.extend(folder_bounds(source_folder))
+        query = ("SELECT file_path, file_hash, hash_algorithm, mtime_ns, camera_name, creation_year, creation_date "
+                 f"FROM file_cache WHERE {' AND '.join(conditions)}")
+        yield from self.conn.execute(query, params)
+
+    def forget_unseen(self, folder, seen_paths):
+        """Delete the rows of files below folder that are not in seen_paths, i.e. files deleted, renamed or moved
+        away since they were cached, and return how many were deleted."""
+        rows = self.conn.execute("SELECT file_path FROM file_cache WHERE file_path > ? AND file_path < ?", folder_bounds(folder))
+        stale = [(file_path,) for (file_path,) in rows if file_path not in seen_paths]
+        with self.conn:
+            self.conn.executemany("DELETE FROM file_cache WHERE file_path=?", stale)
+        METRICS.count('cache_rows_removed', len(stale))
+        return len(stale)
+
+    def update_hashes(self, file_path, file_stat, file_hash, partial_hash, hash_algorithm=DEFAULT_HASH_ALGORITHM):
+        """Fill in hashes computed after a file was cached, as long as the file is unchanged."""
+        self.conn.execute("UPDATE file_cache SET file_hash=?, partial_hash=?, hash_algorithm=? WHERE file_path=? AND file_size=? AND mtime_ns=?",
+                          (file_hash, partial_hash, hash_algorithm, file_path, file_stat.st_size, file_stat.st_mtime_ns))
+
+    def lookup_phashes(self, file_paths):
+        """Return {file_path: phash} for the cached paths among file_paths that have a perceptual hash.
+
+        Only ask for files whose cached stat still matches; rows are rewritten without a phash when a file changes.
+        """
+        query = "SELECT file_path, phash FROM file_cache WHERE file_path IN ({}) AND phash IS NOT NULL"
+        return {file_path: int(phash, 16) for file_path, phash in self._select_in(query, file_paths)}
+
+    def update_phash(self, file_path, file_stat, phash):
+        """Fill in the perceptual hash of a cached file, as long as the file is unchanged."""
+        self.conn.execute("UPDATE file_cache SET phash=? WHERE file_path=? AND file_size=? AND mtime_ns=?",
+                          (format_phash(phash), file_path, file_stat.st_size, file_stat.st_mtime_ns))
+
+    def lookup_indexed(self, output_folder, file_paths):
+        """Return {file_path: (file_size, mtime_ns, link_path)} for the paths already ingested into output_folder."""
+        query = "SELECT file_path, file_size, mtime_ns, link_path FROM output_index WHERE file_path IN ({}) AND output_folder=?"
+        return {file_path: tuple(row) for file_path, *row in self._select_in(query, file_paths, (output_folder,))}
+
+    def take_unlinked_copies(self, output_folder, file_path):
+        """Remove and return the paths indexed into output_folder as duplicates of file_path (same size and full
+        hash, no link of their own), so they can be ingested again when file_path is no longer the linked copy."""
+        rows = self.conn.execute("SELECT copy.file_path FROM output_index AS linked JOIN output_index AS copy "
+                                 "ON copy.output_folder = linked.output_folder AND copy.file_size = linked.file_size "
+                                 "AND copy.file_hash = linked.file_hash AND copy.hash_algorithm = linked.hash_algorithm "
+                                 "WHERE linked.output_folder=? AND linked.file_path=? AND copy.link_path IS NULL "
+                                 "AND copy.file_path != linked.file_path", (output_folder, file_path)).fetchall()
+        copies = [copy_path for (copy_path,) in rows]
+        self.conn.executemany("DELETE FROM output_index WHERE output_folder=? AND file_path=?",
+                              [(output_folder, copy_path) for copy_path in copies])
+        return copies
+
+    def iter_linked(self, output_folder, page_size=1000):
+        """Yield (file_path, link_path) for every file linked into output_folder, a page at a time so rows can be
+        removed along the way."""
+        last_rowid = 0
+        while True:
+            rows = self.conn.execute("SELECT rowid, file_path, link_path FROM output_index "
+                                     "WHERE output_folder=? AND link_path IS NOT NULL AND rowid > ? ORDER BY rowid LIMIT ?",
+                                     (output_folder, last_rowid, page_size)).fetchall()
+            if not rows:
+                return
+            for last_rowid, file_path, link_path in rows:
+                yield file_path, link_path
+
+    def forget_indexed(self, output_folder, file_path):
+        """Remove a file from the output index of output_folder."""
+        self.conn.execute("DELETE FROM output_index WHERE output_folder=? AND file_path=?", (output_folder, file_path))
+
+    def lookup_linked_sizes(self, output_folder, file_sizes):
+        """Return the output_index rows (file_path, file_size, mtime_ns, file_hash, partial_hash, hash_algorithm, link_path)
+        of the files linked into output_folder with one of the given sizes."""
+        query = ("SELECT file_path, file_size, mtime_ns, file_hash, partial_hash, hash_algorithm, link_path FROM output_index "
+                 "WHERE file_size IN ({}) AND output_folder=? AND link_path IS NOT NULL")
+        return list(self._select_in(query, file_sizes, (output_folder,)))
+
+    def index_file(self, output_folder, file_path, file_stat, file_hash, partial_hash, hash_algorithm, link_path):
+        """Record that a file was ingested into output_folder, with the link created for it (None for duplicates)."""
+        self.conn.execute("INSERT OR REPLACE INTO output_index (output_folder, file_path, file_size, mtime_ns, file_hash, partial_hash, hash_algorithm, link_path) "
+                          "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                          (output_folder, file_path, file_stat.st_size, file_stat.st_mtime_ns, file_hash, partial_hash, hash_algorithm, link_path))
+
+    def store(self, file_hash, file_path, file_stat, camera_name, creation_year, creation_date,
+              partial_hash=None, hash_algorithm=DEFAULT_HASH_ALGORITHM, phash=None):
+        """Queue file metadata for the cache. The file hash may be None for files that never collided on size."""
+        self._pending.append((file_path, file_hash, partial_hash, hash_algorithm, file_stat.st_size, file_stat.st_mtime_ns,
+                              file_stat.st_ino, camera_name, creation_year, creation_date, format_phash(phash)))
+        if len(self._pending) >= self.batch_size or time.monotonic() - self._last_flush >= self.batch_seconds:
+            self.flush()
+
+    def flush(self):
+        """Write all queued rows in a single transaction, together with any index updates made since the last flush."""
+        with METRICS.stage('cache write'), self.conn:
+            if self._pending:
+                log.debug("Storing %d rows in cache", len(self._pending))
+                METRICS.count('cache_rows_written', len(self._pending))
+                placeholders = ', '.join('?' * len(CACHE_COLUMNS))
+                self.conn.executemany(f"INSERT OR REPLACE INTO file_cache ({', '.join(CACHE_COLUMNS)}) VALUES ({placeholders})",
+                                      self._pending)
+                self._pending = []
+        self._last_flush = time.monotonic()
+
+    def iter_rows(self):
+        """Yield every file_cache row in CACHE_COLUMNS order."""
+        self.flush()
+        yield from self.conn.execute(f"SELECT {', '.join(CACHE_COLUMNS)} FROM file_cache")
+
+    def merge_rows(self, rows):
+        """Merge rows (in CACHE_COLUMNS order) from another cache into this one, following merge_row.
+
+        Returns {outcome: row count}.
+        """
+        self.flush()
+        counts = defaultdict(int)
+        rows = iter(rows)
+        query = f"SELECT {', '.join(CACHE_COLUMNS)} FROM file_cache WHERE file_path IN ({{}})"
+        placeholders = ', '.join('?' * len(CACHE_COLUMNS))
+        while chunk := [tuple(row) for _, row in zip(range(LOOKUP_CHUNK_SIZE), rows)]:
+            local = {row[0]: row for row in self._select_in(query, [row[0] for row in chunk])}
+            merged = []
+            for row in chunk:
+                outcome, merged_row = merge_row(local.get(row[0]), row)
+                counts[outcome] += 1
+                if outcome == 'conflict':
+                    log.warning("Conflicting hashes for %s, keeping the local ones", row[0])
+                if merged_row is not None:
+                    merged.append(merged_row)
+                    # Later rows for the same path merge against this one
+                    local[row[0]] = merged_row
+            with self.conn:
+                self.conn.executemany(f"INSERT OR REPLACE INTO file_cache ({', '.join(CACHE_COLUMNS)}) VALUES ({placeholders})",
+                                      merged)
+        return dict(counts)
+
+    def close(self):
+        """Flush queued rows and close the connection."""
+        self.flush()
+        self.conn.close()
@@ -0,0 +1,101 @@
+"""
+Exporting file caches and merging them into each other.
+
+An export is gzip-compressed JSON lines: a header naming the format, its version and the columns, then
+one row per cached file. Imports take an export or another file_cache.db, so the caches of several ingest
+machines, or of the shards of one sharded run, can be combined and used to pre-seed a run that then
+hashes and parses nothing it already knows.
+"""
+import os
+import gzip
+import json
+import sqlite3
+import logging
+import urllib.parse
+from src.cache import CACHE_COLUMNS
+
+log = logging.getLogger(__name__)
+
+EXPORT_FORMAT = 'photo-flow-cache'
+EXPORT_VERSION = 1
+
+SQLITE_HEADER = b'SQLite format 3\x00'
+
+
+def export_cache(cache, path):
+    """Write every row of the cache to an export file and return the number of rows written."""
+    rows = 0
+    with gzip.open(path, 'wt', encoding='utf-8') as f:
+        f.write(json.dumps({'format': EXPORT_FORMAT, 'version': EXPORT_VERSION, 'columns': CACHE_COLUMNS}) + '\n')
+        for row in cache.iter_rows():
+            f.write(json.dumps(row, separators=(',', ':')) + '\n')
+            rows += 1
+    log.info("Exported %d cache rows to %s", rows, path)
+    return rows
+
+
+def read_export(path):
+    """Yield the rows of an export file in CACHE_COLUMNS order; columns it does not have are None."""
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        header = json.loads(f.readline() or '{}')
+        if header.get('format') != EXPORT_FORMAT:
+            raise ValueError(f"{path} is not a photo-flow cache export")
+        if header.get('version', 0) > EXPORT_VERSION:
+            raise ValueError(f"{path} is a version {header['version']} export; this version reads up to {EXPORT_VERSION}")
+        positions = [header['columns'].index(column) if column in header['columns'] else None for column in CACHE_COLUMNS]
+        for line in f:
+            values = json.loads(line)
+            yield tuple(None if position is None else values[position] for position in positions)
+
+
+def read_cache_rows(path):
+    """Yield the rows of an export file or of another file_cache.db."""
+    with open(path, 'rb') as f:
+        is_sqlite = f.read(len(SQLITE_HEADER)) == SQLITE_HEADER
+    if not is_sqlite:
+        yield from read_export(path)
+        return
+    yield from read_cache_db(path)
+
+
+def read_cache_db(path):
+    """Yield the file_cache rows of another file_cache.db in CACHE_COLUMNS order; columns it does not have are None.
+
+    The database is opened read-only, so importing from it neither migrates nor otherwise writes to it.
+    """
+    conn = sqlite3.connect(f"file:{urllib.parse.quote(os.path.abspath(path))}?mode=ro", uri=True)
+    try:
+        present = {row[1] for row in conn.execute("PRAGMA table_info(file_cache)")}
+        if not present:
+            raise ValueError(f"{path} has no file_cache table")
+        if 'file_size' not in present:
+            raise ValueError(f"{path} predates stat-keyed caches; open it with this version once to migrate it")
+        # As in FileCache's migration, every hash written before hash_algorithm existed was an MD5
+        defaults = {'hash_algorithm': "'md5'"}
+        columns = ', '.join(column if column in present else defaults.get(column, 'NULL') for column in CACHE_COLUMNS)
+        yield from conn.execute(f"SELECT {columns} FROM file_cache")
+    finally:
+        conn.close()
+
+
+def map_paths(rows, path_map):
+    """Rewrite the source paths of rows by {old prefix: new prefix}, for caches made where the sources were
+    mounted elsewhere. Remapped rows drop their inode, which only means something on the original mount."""
+    inode = CACHE_COLUMNS.index('inode')
+    for row in rows:
+        for old, new in path_map.items():
+            old, new = old.rstrip(os.sep), new.rstrip(os.sep)
+            if row[0] == old or row[0].startswith(old + os.sep):
+                row = (new + row[0][len(old):], *row[1:inode], None, *row[inode + 1:])
+                break
+        yield row
+
+
+def import_cache(cache, path, path_map=None):
+    """Merge an export file or another file_cache.db into the cache and return the counts per merge outcome."""
+    rows = read_cache_rows(path)
+    if path_map:
+        rows = map_paths(rows, path_map)
+    counts = cache.merge_rows(rows)
+    log.info("Imported %s: %s", path, ", ".join(f"{count} {outcome}" for outcome, count in sorted(counts.items())) or "no rows")
+    return counts
@@ -0,0 +1,99 @@
+"""
+Output trees built from the file cache alone.
+
+Every ingest leaves the hash, camera and date of each source file in file_cache, so a new layout or a
+filtered view (one camera, a date range) can be linked straight from the database without walking or
+hashing the sources again. Ingests drop files that are gone from the cache, and a rebuild skips cached files
+that have disappeared since, but files added since the last ingest are only picked up by running one.
+"""
+import os
+import logging
+from src.main import MediaRecord, CAMERA_NAME_ALIASES, DEFAULT_LAYOUT, DEFAULT_WORKERS, media_kind, keep_earliest, link_media, resolve_layout
+from src.cache import FileCache, DEFAULT_CACHE_PATH
+from src.materialize import DEFAULT_LINK_MODE
+from src.metrics import METRICS
+
+log = logging.getLogger(__name__)
+
+
+def camera_names(cameras):
+    """Return the cached camera names to query for folder names as they appear in the output (aliases included)."""
+    names = set(cameras)
+    names.update(name for name, alias in CAMERA_NAME_ALIASES.items() if alias in names)
+    return sorted(names)
+
+
+def catalog_records(cache, cameras=None, date_from=None, date_to=None, source_folder=None, kinds=('image', 'video')):
+    """Return the MediaRecord of the earliest-modified copy of every cached file content matching the filters,
+    and {file_path: (file_hash, hash_algorithm)} of the records that have a full hash.
+
+    Copies are only merged on equal full hashes; files the ingest never had to hash in full are kept apart.
+    Files that no longer exist (renamed or deleted since the last ingest) are left out, so they neither leave
+    dangling links nor claim the link path of the file that replaced them.
+    """
+    media_map = {}
+    missing = 0
+    with METRICS.stage('catalog query'):
+        rows = cache.query_catalog(camera_names(cameras) if cameras else None, date_from, date_to, source_folder)
+        for file_path, file_hash, hash_algorithm, mtime_ns, camera_name, creation_year, creation_date in rows:
+            if media_kind(file_path) not in kinds:
+                continue
+            if not os.path.isfile(file_path):
+                missing += 1
+                continue
+            key = (hash_algorithm, file_hash) if file_hash else file_path
+            keep_earliest(media_map, key, MediaRecord(file_path, mtime_ns or 0, camera_name, creation_year, creation_date))
+    METRICS.count('catalog_records', len(media_map))
+    METRICS.count('catalog_missing', missing)
+    if missing:
+        log.warning("Skipped %d cached files that no longer exist; run an ingest to update the cache", missing)
+    hashes = {record.file_path: key[::-1] for key, record in media_map.items() if isinstance(key, tuple)}
+    return list(media_map.values()), hashes
+
+
+def prune_links(output_folder, keep, dry_run=False):
+    """Remove symlinks under output_folder that are not in `keep`, then the folders left empty.
+
+    Regular files (hardlinks and copies included) are never touched.
+    """
+    removed = 0
+    for directory, _, names in os.walk(output_folder, topdown=False):
+        for name in names:
+            path = os.path.join(directory, name)
+            if path in keep or not os.path.islink(path):
+                continue
+            if dry_run:
+                log.info("remove %s", path)
+            else:
+                os.unlink(path)
+            removed += 1
+        if not dry_run and directory != output_folder:
+            try:
+                os.rmdir(directory)
+            except OSError:
+                pass
+    METRICS.count('links_removed', removed)
+    log.info("%s %d links no longer in the layout", "Would remove" if dry_run else "Removed", removed)
+
+
+def rebuild_output(output_folder, cache_path=DEFAULT_CACHE_PATH, layout=DEFAULT_LAYOUT, cameras=None, date_from=None,
+                   date_to=None, source_folder=None, kinds=('image', 'video'), prune=False, dry_run=False,
+                   link_mode=DEFAULT_LINK_MODE, workers=DEFAULT_WORKERS):
+    """Link the cached files matching the filters into output_folder in the given layout, without reading the sources.
+
+    With prune, links already in output_folder that are not part of the new tree are removed, which turns an
+    existing output into the new layout. With dry_run, the changes are only logged. link_mode 'hardlink',
+    'reflink' or 'copy' materializes the files instead, on `workers` threads, which is how a filtered view is
+    exported for delivery; this does read the sources.
+    """
+    layout = resolve_layout(layout)
+    if not os.path.exists(cache_path):
+        raise FileNotFoundError(f"No file cache at {cache_path}; run an ingest first")
+    with FileCache(cache_path) as cache:
+        records, hashes = catalog_records(cache, cameras, date_from, date_to, source_folder, kinds)
+    log.info("Rebuilding %s from %d cataloged files", output_folder, len(records))
+    plan = link_media(records, output_folder, dry_run=dry_run, layout=layout, link_mode=link_mode, hashes=hashes,
+                      workers=workers)
+    if prune:
+        prune_links(output_folder, {action.link_path for action in plan.actions}, dry_run=dry_run)
+    log.info("Rebuild completed.")
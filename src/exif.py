@@ -0,0 +1,303 @@
+"""
+Header-only EXIF reader.
+
+Reads Make, Model and DateTime straight from the TIFF IFD0 of JPEG, TIFF-based RAW (.cr2, .nef, .arw, .dng, ...)
+and HEIF/HEIC files with a handful of small seeks and reads, without initialising an image decoder. Also locates
+the full-size preview JPEG embedded in TIFF-based RAW files, so viewers can show them without a RAW decoder.
+"""
+import struct
+
+# Tags read from IFD0, named as in PIL.ExifTags.TAGS
+EXIF_TAGS = {0x010f: 'Make', 0x0110: 'Model', 0x0132: 'DateTime'}
+
+# Upper bounds on how much of a file the reader will look at
+JPEG_SCAN_BYTES = 256 * 1024
+MAX_IFD_ENTRIES = 1024
+MAX_STRING_BYTES = 256
+MAX_META_BOX_BYTES = 1024 * 1024
+HEIF_SCAN_BOXES = 32
+
+# Numeric IFD value types (BYTE, SHORT, LONG) and the struct format of one value
+IFD_VALUE_FORMATS = {1: 'B', 3: 'H', 4: 'I'}
+
+# IFD tags used to find embedded preview JPEGs
+TAG_COMPRESSION = 0x0103
+TAG_STRIP_OFFSETS = 0x0111
+TAG_ORIENTATION = 0x0112
+TAG_STRIP_BYTE_COUNTS = 0x0117
+TAG_SUB_IFDS = 0x014a
+TAG_JPEG_OFFSET = 0x0201
+TAG_JPEG_LENGTH = 0x0202
+COMPRESSION_JPEG = 6
+MAX_PREVIEW_IFDS = 16
+
+TIFF_MAGIC = {42, 0x2b, 0x55, 0x4f52, 0x5352}  # TIFF/DNG/NEF/ARW/CR2, BigTIFF marker, RW2, ORF
+
+
+def read_exif_tags(file_path):
+    """Return {'Make', 'Model', 'DateTime'} (whichever are present) from the file's EXIF header.
+
+    Returns an empty dict for a supported file without EXIF, and None when the format is not understood
+    or the header is malformed, so the caller can fall back to a full decoder.
+    """
+    try:
+        with open(file_path, 'rb') as f:
+            head = f.read(12)
+            if head[:2] == b'\xff\xd8':
+                return _read_jpeg(f)
+            if head[:2] in (b'II', b'MM'):
+                return _read_tiff(f, 0)
+            if head[4:8] == b'ftyp':
+                return _read_heif(f)
+    except (OSError, struct.error, ValueError, UnicodeDecodeError):
+        pass
+    return None
+
+
+def _read_jpeg(f):
+    """Find the APP1 Exif segment among the JPEG markers and parse the TIFF block inside it."""
+    f.seek(2)
+    while f.tell() < JPEG_SCAN_BYTES:
+        marker = f.read(2)
+        if len(marker) < 2 or marker[0] != 0xff:
+            return {}
+        if marker[1] == 0xff:
+            # Fill byte; the real marker follows
+            f.seek(-1, 1)
+            continue
+        if marker[1] == 0xd8 or marker[1] == 0x01 or 0xd0 <= marker[1] <= 0xd7:
+            continue
+        if marker[1] in (0xd9, 0xda):
+            # End of image or start of scan: no EXIF before the pixel data
+            return {}
+        length, = struct.unpack('>H', f.read(2))
+        segment_start = f.tell()
+        if marker[1] == 0xe1 and f.read(6) == b'Exif\x00\x00':
+            return _read_tiff(f, segment_start + 6)
+        f.seek(segment_start + length - 2)
+    return {}
+
+
+def _read_tiff(f, base):
+    """Parse IFD0 of the TIFF block starting at `base` and return the tags in EXIF_TAGS."""
+    f.seek(base)
+    header = f.read(8)
+    byte_order = {b'II': '<', b'MM': '>'}.get(header[:2])
+    if byte_order is None:
+        return None
+    magic, ifd_offset = struct.unpack(byte_order + 'HI', header[2:8])
+    if magic not in TIFF_MAGIC or magic == 0x2b:
+        # BigTIFF uses 64-bit offsets; leave it to the full decoder
+        return None
+    f.seek(base + ifd_offset)
+    entry_count, = struct.unpack(byte_order + 'H', f.read(2))
+    if entry_count > MAX_IFD_ENTRIES:
+        return None
+    entries = f.read(12 * entry_count)
+    tags = {}
+    for index in range(entry_count):
+        tag, value_type, count = struct.unpack(byte_order + 'HHI', entries[12 * index:12 * index + 8])
+        if tag not in EXIF_TAGS or value_type != 2:
+            continue
+        value = entries[12 * index + 8:12 * index + 12]
+        if count > 4:
+            value_offset, = struct.unpack(byte_order + 'I', value)
+            f.seek(base + value_offset)
+            value = f.read(min(count, MAX_STRING_BYTES))
+        # Strings are NUL terminated, and some cameras pad them with extra NULs
+        tags[EXIF_TAGS[tag]] = value[:count].split(b'\x00', 1)[0].decode('latin-1')
+    return tags
+
+
+def _iter_boxes(data, offset, end):
+    """Yield (box_type, payload_start, box_end) for the ISO-BMFF boxes in data[offset:end]."""
+    while offset + 8 <= end:
+        size, box_type = struct.unpack('>I4s', data[offset:offset + 8])
+        header = 8
+        if size == 1:
+            size, = struct.unpack('>Q', data[offset + 8:offset + 16])
+            header = 16
+        elif size == 0:
+            size = end - offset
+        if size < header:
+            return
+        yield box_type, offset + header, min(offset + size, end)
+        offset += size
+
+
+def _read_heif(f):
+    """Locate the Exif item through the HEIF meta box (iinf + iloc) and parse the TIFF block it points to."""
+    # Find the top-level meta box without reading the (large) media data
+    f.seek(0)
+    for _ in range(HEIF_SCAN_BOXES):
+        start = f.tell()
+        header = f.read(8)
+        if len(header) < 8:
+            return None
+        size, box_type = struct.unpack('>I4s', header)
+        if size == 1:
+            size, = struct.unpack('>Q', f.read(8))
+        elif size == 0:
+            return None
+        if box_type == b'meta':
+            if size > MAX_META_BOX_BYTES:
+                return None
+            f.seek(start)
+            data = f.read(size)
+            break
+        if size < 8:
+            return None
+        f.seek(start + size)
+    else:
+        return None
+
+    # meta is a full box: skip the header and the version/flags word
+    header = 16 if struct.unpack('>I', data[:4])[0] == 1 else 8
+    exif_item_ids = set()
+    locations = {}
+    for box_type, start, end in _iter_boxes(data, header + 4, len(data)):
+        if box_type == b'iinf':
+            version = data[start]
+            entries_start = start + (6 if version == 0 else 8)
+            for infe_type, infe_start, infe_end in _iter_boxes(data, entries_start, end):
+                infe_version = data[infe_start]
+                if infe_type != b'infe' or infe_version < 2:
+                    continue
+                if infe_version == 2:
+                    item_id, = struct.unpack('>H', data[infe_start + 4:infe_start + 6])
+                    item_type = data[infe_start + 8:infe_start + 12]
+                else:
+                    item_id, = struct.unpack('>I', data[infe_start + 4:infe_start + 8])
+                    item_type = data[infe_start + 10:infe_start + 14]
+                if item_type == b'Exif':
+                    exif_item_ids.add(item_id)
+        elif box_type == b'iloc':
+            locations = _parse_iloc(data, start, end)
+
+    for item_id in exif_item_ids:
+        if item_id not in locations:
+            continue
+        offset = locations[item_id]
+        f.seek(offset)
+        # The Exif item starts with the offset of the TIFF header within it
+        tiff_header_offset, = struct.unpack('>I', f.read(4))
+        return _read_tiff(f, offset + 4 + tiff_header_offset)
+    return {}
+
+
+def _parse_iloc(data, start, end):
+    """Return {item_id: file_offset} for items stored as a file extent in the iloc box."""
+    version = data[start]
+    offset = start + 4
+    offset_size, length_size = data[offset] >> 4, data[offset] & 0x0f
+    base_offset_size, index_size = data[offset + 1] >> 4, data[offset + 1] & 0x0f
+    offset += 2
+    if version < 2:
+        item_count, = struct.unpack('>H', data[offset:offset + 2])
+        offset += 2
+    else:
+        item_count, = struct.unpack('>I', data[offset:offset + 4])
+        offset += 4
+
+    def read_uint(size):
+        nonlocal offset
+        value = int.from_bytes(data[offset:offset + size], 'big')
+        offset += size
+        return value
+
+    locations = {}
+    for _ in range(item_count):
+        if offset >= end:
+            break
+        item_id = read_uint(2 if version < 2 else 4)
+        construction_method = read_uint(2) & 0x0f if version in (1, 2) else 0
+        read_uint(2)  # data_reference_index
+        base_offset = read_uint(base_offset_size)
+        extent_count = read_uint(2)
+        extents = []
+        for _ in range(extent_count):
+            if version in (1, 2) and index_size:
+                read_uint(index_size)
+            extents.append(read_uint(offset_size))
+            read_uint(length_size)
+        # Only items stored directly in the file (not in idat or another file) can be read with a seek
+        if construction_method == 0 and extents:
+            locations[item_id] = base_offset + extents[0]
+    return locations
+
+
+def read_embedded_preview(file_path):
+    """Return (offset, length, orientation) of the largest preview JPEG embedded in a TIFF-based RAW file.
+
+    Orientation is the EXIF orientation of the RAW itself (1 when absent), since previews rarely carry their own.
+    Returns None when the file is not TIFF-based or holds no JPEG preview.
+    """
+    try:
+        with open(file_path, 'rb') as f:
+            return _find_preview(f)
+    except (OSError, struct.error, ValueError):
+        return None
+
+
+def _read_numeric_ifd(f, offset, byte_order):
+    """Return ({tag: tuple of values}, next_ifd_offset) for the numeric entries of the IFD at offset."""
+    f.seek(offset)
+    entry_count, = struct.unpack(byte_order + 'H', f.read(2))
+    if entry_count > MAX_IFD_ENTRIES:
+        raise ValueError("implausible IFD entry count")
+    entries = f.read(12 * entry_count)
+    next_offset, = struct.unpack(byte_order + 'I', f.read(4))
+    values = {}
+    for index in range(entry_count):
+        tag, value_type, count = struct.unpack(byte_order + 'HHI', entries[12 * index:12 * index + 8])
+        value_format = IFD_VALUE_FORMATS.get(value_type)
+        if value_format is None or count > MAX_IFD_ENTRIES:
+            continue
+        value = entries[12 * index + 8:12 * index + 12]
+        size = struct.calcsize(value_format) * count
+        if size > 4:
+            value_offset, = struct.unpack(byte_order + 'I', value)
+            f.seek(value_offset)
+            value = f.read(size)
+        values[tag] = struct.unpack(byte_order + value_format * count, value[:size])
+    return values, next_offset
+
+
+def _find_preview(f):
+    """Walk IFD0, the IFD chain and SubIFDs and pick the largest JPEG stored in any of them."""
+    header = f.read(8)
+    byte_order = {b'II': '<', b'MM': '>'}.get(header[:2])
+    if byte_order is None:
+        return None
+    magic, ifd_offset = struct.unpack(byte_order + 'HI', header[2:8])
+    if magic not in TIFF_MAGIC or magic == 0x2b:
+        return None
+    orientation = 1
+    best = None
+    pending = [ifd_offset]
+    seen = set()
+    while pending and len(seen) < MAX_PREVIEW_IFDS:
+        offset = pending.pop(0)
+        if not offset or offset in seen:
+            continue
+        seen.add(offset)
+        values, next_offset = _read_numeric_ifd(f, offset, byte_order)
+        if offset == ifd_offset and TAG_ORIENTATION in values:
+            orientation = values[TAG_ORIENTATION][0]
+        pending.append(next_offset)
+        pending.extend(values.get(TAG_SUB_IFDS, ()))
+        candidates = []
+        if TAG_JPEG_OFFSET in values and TAG_JPEG_LENGTH in values:
+            candidates.append((values[TAG_JPEG_OFFSET][0], values[TAG_JPEG_LENGTH][0]))
+        # Some RAWs (e.g. CR2) store the preview as a single baseline-JPEG strip instead
+        if values.get(TAG_COMPRESSION) == (COMPRESSION_JPEG,) and len(values.get(TAG_STRIP_OFFSETS, ())) == 1:
+            candidates.append((values[TAG_STRIP_OFFSETS][0], values.get(TAG_STRIP_BYTE_COUNTS, (0,))[0]))
+        for preview_offset, length in candidates:
+            if best is not None and length <= best[1]:
+                continue
+            f.seek(preview_offset)
+            if f.read(2) == b'\xff\xd8':
+                best = (preview_offset, length)
+    if best is None:
+        return None
+    return best[0], best[1], orientation
@@ -0,0 +1,111 @@
+import os
+import hashlib
+import logging
+import threading
+
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+
+try:
+    import blake3
+except ImportError:
+    blake3 = None
+
+log = logging.getLogger(__name__)
+
+# Size of the reusable read buffer; large reads keep the syscall count low on multi-GB video
+READ_BUFFER_BYTES = 4 * 1024 * 1024
+
+# Bytes read from each end of a file for the partial hash
+PARTIAL_HASH_BYTES = 1024 * 1024
+
+# Files at least this large are dropped from the page cache after hashing, so one pass over a video archive
+# doesn't evict everything else
+DROP_BEHIND_BYTES = 64 * 1024 * 1024
+
+# md5 stays the default so existing caches keep matching; pass 'auto' to pick the fastest installed backend
+DEFAULT_HASH_ALGORITHM = 'md5'
+
+HASH_ALGORITHMS = {
+    'md5': hashlib.md5,
+    'sha1': hashlib.sha1,
+    'sha256': hashlib.sha256,
+    'blake2b': hashlib.blake2b,
+}
+if xxhash is not None:
+    HASH_ALGORITHMS['xxh3_128'] = xxhash.xxh3_128
+    HASH_ALGORITHMS['xxh64'] = xxhash.xxh64
+if blake3 is not None:
+    HASH_ALGORITHMS['blake3'] = blake3.blake3
+
+# Preference order for 'auto', fastest first; blake2b is always available through hashlib
+AUTO_HASH_ALGORITHMS = ['xxh3_128', 'blake3', 'blake2b']
+
+_buffers = threading.local()
+
+def resolve_hash_algorithm(algorithm):
+    """Return the concrete algorithm name for `algorithm`, resolving 'auto' to the fastest installed backend."""
+    if algorithm == 'auto':
+        return next(name for name in AUTO_HASH_ALGORITHMS if name in HASH_ALGORITHMS)
+    if algorithm not in HASH_ALGORITHMS:
+        raise ValueError(f"Unsupported hash algorithm {algorithm!r}, available: {', '.join(sorted(HASH_ALGORITHMS))}")
+    return algorithm
+
+def _read_buffer():
+    """Return this thread's reusable read buffer."""
+    buffer = getattr(_buffers, 'buffer', None)
+    if buffer is None:
+        buffer = _buffers.buffer = bytearray(READ_BUFFER_BYTES)
+    return buffer
+
+def _advise(f, advice):
+    """Pass a posix_fadvise hint for the whole file, where the platform supports it."""
+    if not hasattr(os, 'posix_fadvise'):
+        return
+    try:
+        os.posix_fadvise(f.fileno(), 0, 0, getattr(os, advice))
+    except OSError:
+        pass
+
+def _update_from(hasher, f, length=None):
+    """Feed up to `length` bytes (or the rest of the file) into the hasher through the reusable buffer."""
+    buffer = _read_buffer()
+    view = memoryview(buffer)
+    while length is None or length > 0:
+        read = f.readinto(view if length is None else view[:min(length, len(buffer))])
+        if not read:
+            break
+        hasher.update(view[:read])
+        if length is not None:
+            length -= read
+
+def hash_file(file_path, algorithm=DEFAULT_HASH_ALGORITHM):
+    """Compute the hash of a file based on its content."""
+    log.debug("Hashing file: %s", file_path)
+    hasher = HASH_ALGORITHMS[algorithm]()
+    with open(file_path, "rb", buffering=0) as f:
+        _advise(f, 'POSIX_FADV_SEQUENTIAL')
+        _update_from(hasher, f)
+        if f.tell() >= DROP_BEHIND_BYTES:
+            _advise(f, 'POSIX_FADV_DONTNEED')
+    file_hash = hasher.hexdigest()
+    log.debug("File hash for %s: %s", file_path, file_hash)
+    return file_hash
+
+def hash_file_partial(file_path, file_size, algorithm=DEFAULT_HASH_ALGORITHM):
+    """Compute a hash of the size and the first and last PARTIAL_HASH_BYTES of a file.
+
+    Files small enough to be covered by the two ends are hashed in full, so their partial hash is their file hash.
+    """
+    if file_size <= 2 * PARTIAL_HASH_BYTES:
+        return hash_file(file_path, algorithm)
+    log.debug("Partially hashing file: %s", file_path)
+    hasher = HASH_ALGORITHMS[algorithm]()
+    hasher.update(str(file_size).encode())
+    with open(file_path, "rb", buffering=0) as f:
+        _update_from(hasher, f, PARTIAL_HASH_BYTES)
+        f.seek(-PARTIAL_HASH_BYTES, os.SEEK_END)
+        _update_from(hasher, f, PARTIAL_HASH_BYTES)
+    return hasher.hexdigest()
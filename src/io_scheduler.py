@@ -0,0 +1,133 @@
+"""
+Device-aware scheduling of file reads.
+
+Reads are queued per device (st_dev). Rotational disks are read one file at a time in on-disk order
+(the physical offset of each file's first extent from FIEMAP, or the inode number where FIEMAP is not
+supported), so the heads sweep instead of seeking between files. Reads on other devices go straight to
+the executor, which bounds them by its worker count. Each device has its own queue, so a slow archive disk
+never holds back an SSD.
+"""
+import os
+import sys
+import errno
+import queue
+import struct
+import logging
+import threading
+from collections import defaultdict, deque
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+log = logging.getLogger(__name__)
+
+# Concurrent reads per rotational device; more than one makes the heads alternate between files
+ROTATIONAL_READERS = 1
+
+# FS_IOC_FIEMAP: struct fiemap (32 bytes) followed by one struct fiemap_extent (56 bytes)
+FS_IOC_FIEMAP = 0xC020660B
+FIEMAP_HEADER = struct.Struct('=QQLLLL')
+FIEMAP_EXTENT = struct.Struct('=QQQQQLLLL')
+FIEMAP_FLAG_SYNC = 0x1
+
+_rotational = {}
+_rotational_lock = threading.Lock()
+
+
+def is_rotational(device):
+    """Return True if st_dev `device` is a spinning disk, as reported by Linux sysfs; False when unknown."""
+    with _rotational_lock:
+        if device in _rotational:
+            return _rotational[device]
+    rotational = False
+    if sys.platform.startswith('linux'):
+        block = os.path.realpath(f"/sys/dev/block/{os.major(device)}:{os.minor(device)}")
+        # Partitions keep their queue settings on the parent disk
+        for directory in (block, os.path.dirname(block)):
+            try:
+                with open(os.path.join(directory, 'queue', 'rotational')) as f:
+                    rotational = f.read().strip() == '1'
+                break
+            except OSError:
+                continue
+    with _rotational_lock:
+        _rotational[device] = rotational
+    log.debug("Device %s is %s", device, "rotational" if rotational else "not rotational")
+    return rotational
+
+
+def physical_offset(file_path):
+    """Return the on-disk byte offset of the start of a file, or None where FIEMAP is unavailable."""
+    if fcntl is None or not sys.platform.startswith('linux'):
+        return None
+    request = bytearray(FIEMAP_HEADER.size + FIEMAP_EXTENT.size)
+    FIEMAP_HEADER.pack_into(request, 0, 0, 2 ** 64 - 1, FIEMAP_FLAG_SYNC, 0, 1, 0)
+    try:
+        fd = os.open(file_path, os.O_RDONLY)
+    except OSError:
+        return None
+    try:
+        fcntl.ioctl(fd, FS_IOC_FIEMAP, request)
+    except OSError as e:
+        if e.errno not in (errno.ENOTTY, errno.EOPNOTSUPP, errno.EINVAL):
+            log.debug("FIEMAP failed for %s: %s", file_path, e)
+        return None
+    finally:
+        os.close(fd)
+    mapped_extents = FIEMAP_HEADER.unpack_from(request, 0)[3]
+    if not mapped_extents:
+        return None
+    return FIEMAP_EXTENT.unpack_from(request, FIEMAP_HEADER.size)[1]
+
+
+def read_order(jobs):
+    """Sort (file_path, file_stat, payload) jobs of one rotational device into on-disk order."""
+    offsets = {id(job): physical_offset(job[0]) for job in jobs}
+    if any(offset is None for offset in offsets.values()):
+        return sorted(jobs, key=lambda job: job[1].st_ino)
+    return sorted(jobs, key=lambda job: offsets[id(job)])
+
+
+def run_scheduled(jobs, submit):
+    """Start (file_path, file_stat, payload) jobs device by device and yield (payload, future) as each finishes.
+
+    submit(payload) starts the read on an executor and returns its future. Rotational devices run
+    ROTATIONAL_READERS jobs at a time in on-disk order; jobs on other devices are all submitted in the order given.
+    """
+    queues = defaultdict(list)
+    for job in jobs:
+        queues[job[1].st_dev].append(job)
+    limits = {}
+    for device, device_jobs in queues.items():
+        if is_rotational(device):
+            queues[device] = read_order(device_jobs)
+            limits[device] = ROTATIONAL_READERS
+        else:
+            limits[device] = len(device_jobs)
+        queues[device] = deque(queues[device])
+    if len(queues) > 1:
+        log.debug("Scheduling reads on %d devices: %s", len(queues),
+                  ", ".join(f"{device} ({len(device_jobs)} files, {limits[device]} at a time)"
+                            for device, device_jobs in queues.items()))
+
+    # Jobs report back through a queue and the next job of the same device is started from here, so the
+    # executor's callbacks never submit work themselves
+    finished = queue.Queue()
+
+    def start(device):
+        _, _, payload = queues[device].popleft()
+        future = submit(payload)
+        future.add_done_callback(lambda future: finished.put((device, payload, future)))
+
+    remaining = sum(len(device_jobs) for device_jobs in queues.values())
+    for device, limit in limits.items():
+        for _ in range(min(limit, len(queues[device]))):
+            start(device)
+    while remaining:
+        device, payload, future = finished.get()
+        remaining -= 1
+        if queues[device]:
+            start(device)
+        yield payload, future
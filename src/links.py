@@ -0,0 +1,158 @@
+"""
+Planning and applying the symlinks of the output tree.
+
+The link phase works out the whole layout before touching the output folder: each target directory is
+listed once with scandir (or created once if it is missing), so only links that actually need creating
+cost a syscall. This replaces a makedirs and an exists call per file, which adds up on network shares.
+The other link modes (see src.materialize) plan the same way and then hardlink, reflink or copy the files
+on a thread pool, reading each device in on-disk order.
+"""
+import os
+import logging
+import threading
+from collections import namedtuple, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from src.metrics import METRICS, Progress
+from src.hashing import DEFAULT_HASH_ALGORITHM
+from src.io_scheduler import run_scheduled
+from src.materialize import DEFAULT_LINK_MODE, is_up_to_date, materialize
+
+log = logging.getLogger(__name__)
+
+# action is 'create', 'replace' (a dangling link at the same path, or in the other link modes anything that is
+# not already an up-to-date copy of the source) or 'existing' (the path is already taken)
+LinkAction = namedtuple('LinkAction', ['action', 'source', 'link_path'])
+
+# Counter of the files materialized by each method, which is a copy where a link or clone wasn't possible
+METHOD_COUNTERS = {'hardlink': 'files_hardlinked', 'reflink': 'files_reflinked', 'copy': 'files_copied'}
+
+# Directories to create and one action per requested link, in the order the links were given
+LinkPlan = namedtuple('LinkPlan', ['directories', 'actions'])
+
+
+def scan_directory(directory):
+    """Return {name: is_symlink} for the entries of a directory, or None if it does not exist."""
+    try:
+        with os.scandir(directory) as scanner:
+            return {item.name: item.is_symlink() for item in scanner}
+    except (FileNotFoundError, NotADirectoryError):
+        return None
+
+
+def plan_links(links, link_mode=DEFAULT_LINK_MODE):
+    """Plan (source, link_path) symlinks against what the output tree already holds.
+
+    A link path that already exists is left alone, unless it is a symlink whose target is gone; the first
+    source given for a link path claims it. In the other link modes an existing path is replaced unless it
+    already holds the source in that mode.
+    """
+    links = list(links)
+    by_directory = defaultdict(list)
+    for source, link_path in links:
+        by_directory[os.path.dirname(link_path)].append(link_path)
+    snapshots = {}
+    directories = []
+    for directory in by_directory:
+        snapshots[directory] = scan_directory(directory)
+        if snapshots[directory] is None:
+            directories.append(directory)
+            snapshots[directory] = {}
+
+    actions = []
+    claimed = set()
+    for source, link_path in links:
+        name = os.path.basename(link_path)
+        is_symlink = snapshots[os.path.dirname(link_path)].get(name)
+        if link_path in claimed:
+            log.debug("%s is already linked to another file, skipping %s", link_path, source)
+            action = 'existing'
+        elif is_symlink is None:
+            action = 'create'
+        elif link_mode != 'symlink':
+            action = 'existing' if is_up_to_date(source, link_path, link_mode) else 'replace'
+        elif is_symlink and os.readlink(link_path) != source and not os.path.exists(link_path):
+            action = 'replace'
+        else:
+            action = 'existing'
+        claimed.add(link_path)
+        actions.append(LinkAction(action, source, link_path))
+    return LinkPlan(directories, actions)
+
+
+def log_plan(plan):
+    """Log every change a plan would make to the output tree, then a summary."""
+    for directory in plan.directories:
+        log.info("mkdir %s", directory)
+    counts = defaultdict(int)
+    for action in plan.actions:
+        counts[action.action] += 1
+        if action.action != 'existing':
+            log.info("%s %s -> %s", action.action, action.link_path, action.source)
+    log.info("Plan: %d directories to create, %d links to create, %d to replace, %d already in place",
+             len(plan.directories), counts['create'], counts['replace'], counts['existing'])
+
+
+def replace_link(source, link_path):
+    """Point an existing link path at a new source without a moment where the path is missing."""
+    temporary_path = f"{link_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    os.symlink(source, temporary_path)
+    os.replace(temporary_path, link_path)
+
+
+def materialize_files(actions, link_mode, hashes, workers=None):
+    """Hardlink, reflink or copy the files of create and replace actions on a pool of `workers` threads.
+
+    hashes ({source: (file_hash, hash_algorithm)}) holds the full content hashes copies are checked against.
+    Files that fail are logged and left out; the rest of the tree is still materialized.
+    """
+    jobs = []
+    for action in actions:
+        try:
+            jobs.append((action.source, os.stat(action.source), action))
+        except OSError as e:
+            log.error("Could not %s %s: %s", link_mode, action.source, e)
+            METRICS.count('materialize_errors')
+
+    def submit(action):
+        file_hash, hash_algorithm = hashes.get(action.source, (None, DEFAULT_HASH_ALGORITHM))
+        return pool.submit(materialize, action.source, action.link_path, link_mode, file_hash, hash_algorithm)
+    sizes = {id(action): file_stat.st_size for _, file_stat, action in jobs}
+    with ThreadPoolExecutor(max_workers=workers) as pool, Progress(f"Materializing ({link_mode})", len(jobs)) as progress:
+        for action, future in run_scheduled(jobs, submit):
+            try:
+                method = future.result()
+            except OSError as e:
+                log.error("Could not %s %s to %s: %s", link_mode, action.source, action.link_path, e)
+                METRICS.count('materialize_errors')
+                continue
+            log.debug("%s %s to %s", method, action.source, action.link_path)
+            METRICS.count(METHOD_COUNTERS[method])
+            METRICS.count('links_replaced' if action.action == 'replace' else 'links_created')
+            progress.update(nbytes=sizes[id(action)])
+
+
+def apply_links(plan, link_mode=DEFAULT_LINK_MODE, hashes=None, workers=None):
+    """Create the directories and links of a plan, or in the other link modes its hardlinks, reflinks or copies."""
+    for directory in plan.directories:
+        os.makedirs(directory, exist_ok=True)
+    METRICS.count('directories_created', len(plan.directories))
+    pending = [action for action in plan.actions if action.action != 'existing']
+    METRICS.count('links_existing', len(plan.actions) - len(pending))
+    if link_mode != 'symlink':
+        materialize_files(pending, link_mode, hashes or {}, workers)
+        return
+    with Progress('Linking', len(pending)) as progress:
+        for action in pending:
+            log.debug("Linking %s to %s", action.link_path, action.source)
+            if action.action == 'replace':
+                replace_link(action.source, action.link_path)
+                METRICS.count('links_replaced')
+            else:
+                try:
+                    os.symlink(action.source, action.link_path)
+                except FileExistsError:
+                    # Created since the directory was scanned; leave it as it is
+                    METRICS.count('links_existing')
+                    continue
+                METRICS.count('links_created')
+            progress.update()
@@ -1,12 +1,24 @@
 import os
-import hashlib
 import time
-from collections import defaultdict
+import zlib
+import logging
+from collections import defaultdict, namedtuple
 from PIL import Image
 from PIL.ExifTags import TAGS
 from pymediainfo import MediaInfo
-import json
-import sqlite3
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from src.hashing import hash_file, hash_file_partial, resolve_hash_algorithm, DEFAULT_HASH_ALGORITHM, PARTIAL_HASH_BYTES
+from src.cache import FileCache, DEFAULT_CACHE_PATH
+from src.previews import PreviewCache, generate_previews, preview_key
+from src.exif import read_exif_tags
+from src.video import read_video_tags
+from src.metrics import METRICS, Progress
+from src.io_scheduler import run_scheduled
+from src.links import plan_links, apply_links, log_plan
+from src.materialize import DEFAULT_LINK_MODE, PARTIAL_SUFFIX
+from src.similar import compute_phashes, group_similar, write_similar_report, collapsed_folder, DEFAULT_SIMILARITY_DISTANCE
+
+log = logging.getLogger(__name__)
 
 IMAGE_EXTENSIONS = [
     ".jpeg", ".jpg", ".png", ".gif", ".bmp", ".tiff", ".tif", 
@@ -21,145 +33,401 @@ VIDEO_EXTENSIONS = [
 
 CAMERA_NAME_ALIASES = {"FUJIFILM_X-T4": "Fuji_XT4", "FUJIFILM_X-T20": "Fuji_XT20"}
 
-def hash_file(file_path):
-    """Compute the hash of a file based on its content."""
-    print(f"Hashing file: {file_path}")
-    hash_md5 = hashlib.md5()
-    with open(file_path, "rb") as f:
-        while chunk := f.read(4096):
-            hash_md5.update(chunk)
-    file_hash = hash_md5.hexdigest()
-    print(f"File hash for {file_path}: {file_hash}")
-    return file_hash
-
-def check_cache(file_hash, cursor):
-    """Check if the file hash is in the cache."""
-    print(f"Checking cache for hash: {file_hash}")
-    cursor.execute("SELECT camera_name, creation_year, creation_date FROM file_cache WHERE file_hash=?", (file_hash,))
-    result = cursor.fetchone()
-    if result:
-        print(f"Cache hit for hash {file_hash}: {result}")
-    else:
-        print(f"Cache miss for hash {file_hash}")
-    return result
-
-def store_in_cache(file_hash, file_path, camera_name, creation_year, creation_date, cursor, conn):
-    """Store file metadata in the cache."""
-    print(f"Storing in cache: {file_hash}, {file_path}, {camera_name}, {creation_year}, {creation_date}")
-    cursor.execute("INSERT OR REPLACE INTO file_cache (file_hash, file_path, camera_name, creation_year, creation_date) VALUES (?, ?, ?, ?, ?)",
-                   (file_hash, file_path, camera_name, creation_year, creation_date))
-    conn.commit()
+DEFAULT_WORKERS = os.cpu_count() or 4
+
+# Folder layouts of the output tree; --layout also takes a custom format with the same fields
+LAYOUTS = {'camera': '{camera}/{year}/{date}', 'date': '{year}/{date}/{camera}', 'month': '{year}/{month}/{camera}'}
+DEFAULT_LAYOUT = 'camera'
+
+# The copy of a file content that gets linked, with the metadata already extracted for it
+MediaRecord = namedtuple('MediaRecord', ['file_path', 'mtime_ns', 'camera_name', 'creation_year', 'creation_date'])
+
+def content_key(entry):
+    """Return the deduplication key of a file: its full hash, or a size/partial key when it had no collision."""
+    if entry['file_hash']:
+        return entry['file_hash']
+    if entry['partial_hash']:
+        return f"partial:{entry['stat'].st_size}:{entry['partial_hash']}"
+    return f"size:{entry['stat'].st_size}"
+
+def keep_earliest(media_map, key, record):
+    """Keep the earliest-modified copy of each file content in the media map.
+
+    Ties go to the lowest path, so the same copy wins whatever order the files were found in.
+    """
+    current = media_map.get(key)
+    if current is None or (record.mtime_ns, record.file_path) < (current.mtime_ns, current.file_path):
+        media_map[key] = record
+
+def media_kind(file_path):
+    """Return 'image' or 'video' for a media file by its extension, or None for anything else."""
+    extension = os.path.splitext(file_path)[1].lower().strip()
+    if extension in IMAGE_EXTENSIONS:
+        return 'image'
+    if extension in VIDEO_EXTENSIONS:
+        return 'video'
+    return None
+
+def find_media_files(source_folder, excluded=()):
+    """Walk the source folder and yield (file_path, kind) for every media file that is not a symlink.
+
+    Folders in `excluded` are not walked: the output folder usually sits inside the source, and in the other
+    link modes it holds regular files that must not be ingested again. Unfinished .partial copies are skipped.
+    """
+    excluded = {os.path.abspath(folder) for folder in excluded}
+    for path, directories, files in os.walk(source_folder):
+        directories[:] = [name for name in directories if os.path.abspath(os.path.join(path, name)) not in excluded]
+        for file_name in files:
+            if file_name.endswith(PARTIAL_SUFFIX):
+                continue
+            file_path = os.path.join(path, file_name)
+            kind = media_kind(file_path)
+            if kind is None:
+                continue
+            log.debug("Found %s file: %s", kind, file_path)
+            if not os.path.islink(file_path):
+                METRICS.count(f'{kind}s_found')
+                yield file_path, kind
+
+def in_shard(file_path, source_folder, shard):
+    """Return True if a file belongs to shard (index, count), by a checksum of its path below the source folder.
+
+    Every machine given the same source tree splits it the same way.
+    """
+    index, count = shard
+    relative_path = os.path.relpath(file_path, source_folder)
+    return zlib.crc32(relative_path.encode('utf-8', 'surrogateescape')) % count == index
+
+def load_entries(media_files, cache, hash_algorithm, verify=False):
+    """Stat every (file_path, kind) pair and pick up whatever the cache already knows about it.
+
+    Returns one entry dict per file; entries the cache can answer in full are marked unchanged.
+    """
+    entries = []
+    for file_path, kind in media_files:
+        with METRICS.stage('stat'):
+            entries.append({'path': file_path, 'kind': kind, 'stat': os.stat(file_path), 'file_hash': None,
+                            'partial_hash': None, 'metadata': None, 'changed': True})
+    with METRICS.stage('cache lookup'):
+        stat_hits = cache.lookup_paths({entry['path']: entry['stat'] for entry in entries})
+    METRICS.count('cache_hits', len(stat_hits))
+    METRICS.count('cache_misses', len(entries) - len(stat_hits))
+    for entry in entries:
+        stat_cached = stat_hits.get(entry['path'])
+        if stat_cached and verify:
+            entry['cached_hash'] = stat_cached[0] if stat_cached[2] == hash_algorithm else None
+        elif stat_cached and stat_cached[2] != hash_algorithm:
+            # Hashes from another algorithm can't be compared with ours, but the metadata is still good
+            entry['metadata'] = stat_cached[3:]
+        elif stat_cached:
+            entry['file_hash'], entry['partial_hash'] = stat_cached[:2]
+            entry['metadata'] = stat_cached[3:]
+            entry['changed'] = False
+    return entries
+
+def compute_hashes(pool, entries, field, hash_algorithm):
+    """Fill entries[field] with the full or partial hash of each entry, hashing on the pool."""
+    if not entries:
+        return
+    def submit(entry):
+        if field == 'file_hash':
+            return pool.submit(hash_file, entry['path'], hash_algorithm)
+        return pool.submit(hash_file_partial, entry['path'], entry['stat'].st_size, hash_algorithm)
+    jobs = [(entry['path'], entry['stat'], entry) for entry in entries]
+    with METRICS.stage('hash'), Progress('Full hashing' if field == 'file_hash' else 'Partial hashing', len(entries)) as progress:
+        for entry, future in run_scheduled(jobs, submit):
+            entry[field] = future.result()
+            entry['changed'] = True
+            file_size = entry['stat'].st_size
+            if field == 'partial_hash' and file_size <= 2 * PARTIAL_HASH_BYTES:
+                # Small files were hashed in full by the partial stage
+                entry['file_hash'] = entry['partial_hash']
+            bytes_read = file_size if field == 'file_hash' else min(file_size, 2 * PARTIAL_HASH_BYTES)
+            METRICS.count('full_hashes' if field == 'file_hash' else 'partial_hashes')
+            METRICS.count('bytes_hashed', bytes_read)
+            progress.update(nbytes=bytes_read)
+
+def resolve_duplicates(pool, entries, hash_algorithm):
+    """Hash only as much of each file as needed to tell it apart from files of the same size.
+
+    Files with a unique size are not read at all, files with a unique partial hash are read at both ends,
+    and only files that still collide get a full hash.
+    """
+    by_size = defaultdict(list)
+    for entry in entries:
+        by_size[entry['stat'].st_size].append(entry)
+    colliding = [group for group in by_size.values() if len(group) > 1 and not all(entry['file_hash'] for entry in group)]
+    compute_hashes(pool, [entry for group in colliding for entry in group if not entry['partial_hash']], 'partial_hash', hash_algorithm)
+
+    by_partial = defaultdict(list)
+    for group in colliding:
+        for entry in group:
+            by_partial[(entry['stat'].st_size, entry['partial_hash'])].append(entry)
+    needs_full = []
+    for group in by_partial.values():
+        if len(group) < 2:
+            continue
+        needs_full.extend(entry for entry in group if not entry['file_hash'])
+    compute_hashes(pool, needs_full, 'file_hash', hash_algorithm)
 
 def output_image_path(file_path):
     """Retrieve camera name and photo creation date from the file's EXIF metadata."""
-    print(f"Processing image file: {file_path}")
+    log.debug("Processing image file: %s", file_path)
     try:
-        image = Image.open(file_path)
-        exif_data = image._getexif()
-        exif = {TAGS.get(tag): value for tag, value in exif_data.items() if tag in TAGS}
+        # Parse just the EXIF header when we can, and only open the image with Pillow for other formats
+        exif = read_exif_tags(file_path)
+        if exif is None:
+            image = Image.open(file_path)
+            exif_data = image._getexif()
+            exif = {TAGS.get(tag): value for tag, value in exif_data.items() if tag in TAGS}
         camera_make = exif.get('Make')
         camera_model = exif.get('Model')
         camera_name = '_'.join([camera_make, camera_model]) if (camera_make is not None) & (camera_model is not None) else 'UnknownCamera'
         date_taken = exif.get('DateTime', time.strftime("%Y:%m:%d", time.gmtime(os.path.getmtime(file_path))))
         year, month, day = date_taken[:10].split(":")
-        print(f"EXIF data: camera_name={camera_name}, date_taken={date_taken}")
+        log.debug("EXIF data: camera_name=%s, date_taken=%s", camera_name, date_taken)
         return camera_name, year, f"{year}-{month}-{day}"
     except Exception as e:
-        print(f"Could not process EXIF data for {file_path}: {e}")
+        log.warning("Could not process EXIF data for %s: %s", file_path, e)
         return "UnknownCamera", time.strftime("%Y", time.gmtime(os.path.getmtime(file_path))), time.strftime("%Y-%m-%d", time.gmtime(os.path.getmtime(file_path)))
 
+def video_camera_name(tags):
+    """Build the camera folder name from the make/model tags read from a video container."""
+    info = tags.get('info') or ''
+    if info.startswith("FUJIFILM DIGITAL CAMERA "):
+        # Fuji bodies only identify themselves in the info string, e.g. "FUJIFILM DIGITAL CAMERA X-T4"
+        return '_'.join(["FUJIFILM", info[len("FUJIFILM DIGITAL CAMERA "):]])
+    if tags.get('make') and tags.get('model'):
+        return '_'.join([tags['make'], tags['model']]).replace(' ', '_')
+    return "UnknownCamera"
+
 def output_video_path(file_path):
-    """Retrieve camera name and video creation date from the file's metadata using pymediainfo."""
-    print(f"Processing video file: {file_path}")
+    """Retrieve camera name and video creation date from the container header, or from pymediainfo for other formats."""
+    log.debug("Processing video file: %s", file_path)
     try:
+        tags = read_video_tags(file_path, os.path.splitext(file_path)[1].lower())
+        if tags is not None:
+            camera_name = video_camera_name(tags)
+            date_taken = tags.get('creation_date') or time.strftime("%Y-%m-%d", time.localtime(os.path.getmtime(file_path)))
+            year, month, day = date_taken[:10].split("-")
+            log.debug("Metadata: camera_name=%s, date_taken=%s", camera_name, date_taken)
+            return camera_name, year, f"{year}-{month}-{day}"
         media_info = MediaInfo.parse(file_path)
-        data = json.loads(media_info.to_json())
         camera_name = "UnknownCamera"
-        date_taken = time.strftime("%Y:%m:%d", time.gmtime(os.path.getmtime(file_path)))
-        for track in data.get('tracks'):
-            if track.get('track_type') == "General":
-                if track.get('movie_more') == "FUJIFILM DIGITAL CAMERA X-T4":
-                    camera_name = "Fuji_XT4"
-                if track.get('comapplequicktimemake') == 'Apple':
-                    camera_make = track.get('comapplequicktimemake')
-                    camera_model = track.get('comapplequicktimemodel')
-                    camera_name = '_'.join([camera_make, camera_model]).replace(' ', '_')
-                date_taken = track.get('file_last_modification_date__local')
-                year, month, day = date_taken[:10].split("-")
-                print(f"Metadata: camera_name={camera_name}, date_taken={date_taken}")
-                return camera_name, year, f"{year}-{month}-{day}"
+        for track in media_info.general_tracks:
+            if track.movie_more == "FUJIFILM DIGITAL CAMERA X-T4":
+                camera_name = "Fuji_XT4"
+            if track.comapplequicktimemake == 'Apple':
+                camera_make = track.comapplequicktimemake
+                camera_model = track.comapplequicktimemodel
+                camera_name = '_'.join([camera_make, camera_model]).replace(' ', '_')
+            date_taken = track.file_last_modification_date__local
+            year, month, day = date_taken[:10].split("-")
+            log.debug("Metadata: camera_name=%s, date_taken=%s", camera_name, date_taken)
+            return camera_name, year, f"{year}-{month}-{day}"
     except Exception as e:
-        print(f"Could not process metadata for {file_path}: {e}")
+        log.warning("Could not process metadata for %s: %s", file_path, e)
         return "UnknownCamera", time.strftime("%Y", time.gmtime(os.path.getmtime(file_path))), time.strftime("%Y-%m-%d", time.gmtime(os.path.getmtime(file_path)))
 
 
-def organize_files(source_folder, output_folder):
-    """Organize files in the output folder, deduplicating by content and using symlinks."""
-    # Open the database connection inside the function
-    with sqlite3.connect('file_cache.db') as conn:
-        cursor = conn.cursor()
-        # Create a table to store the file hash and associated metadata
-        cursor.execute('''CREATE TABLE IF NOT EXISTS file_cache (
-                            file_hash TEXT PRIMARY KEY, 
-                            file_path TEXT, 
-                            camera_name TEXT, 
-                            creation_year TEXT, 
-                            creation_date TEXT
-                        )''')
-        conn.commit()
-        image_hash_map = defaultdict(list)
-        video_hash_map = defaultdict(list)
-        print(f"Organizing files from {source_folder} to {output_folder}")
-        for path, _, files in os.walk(source_folder):
-            for file_name in files:
-                file_path = os.path.join(path, file_name)
-                extension = os.path.splitext(file_name)[1].lower().strip()
-                if extension in IMAGE_EXTENSIONS:
-                    print(f"Found image file: {file_path}")
-                    if not os.path.islink(file_path):
-                        file_hash = hash_file(file_path)
-                        cached_data = check_cache(file_hash, cursor)  # Pass cursor to cache-checking functions
-                        if cached_data:
-                            camera_name, creation_year, creation_date = cached_data
-                        else:
-                            camera_name, creation_year, creation_date = output_image_path(file_path)
-                            store_in_cache(file_hash, file_path, camera_name, creation_year, creation_date, cursor, conn)
-                        image_hash_map[file_hash].append(file_path)
-                if extension in VIDEO_EXTENSIONS:
-                    print(f"Found video file: {file_path}")
-                    if not os.path.islink(file_path):
-                        file_hash = hash_file(file_path)
-                        cached_data = check_cache(file_hash, cursor)
-                        if cached_data:
-                            camera_name, creation_year, creation_date = cached_data
-                        else:
-                            camera_name, creation_year, creation_date = output_video_path(file_path)
-                            store_in_cache(file_hash, file_path, camera_name, creation_year, creation_date, cursor, conn)
-                        video_hash_map[file_hash].append(file_path)
-        print("Deduplicating and organizing images and videos.")
-        # Deduplicate images
-        for file_hash, file_list in image_hash_map.items():
-            most_recent_file = min(file_list, key=lambda f: os.path.getmtime(f))
-            camera_name, creation_year, creation_date = output_image_path(most_recent_file)
-            camera_name = CAMERA_NAME_ALIASES.get(camera_name, camera_name)
-            target_dir = os.path.join(output_folder, camera_name, creation_year, creation_date)
-            os.makedirs(target_dir, exist_ok=True)
-            target_symlink = os.path.join(target_dir, os.path.basename(most_recent_file))
-            if not os.path.exists(target_symlink):
-                print(f"Creating symlink for {most_recent_file} at {target_symlink}")
-                os.symlink(most_recent_file, target_symlink)
-        # Deduplicate videos
-        for file_hash, file_list in video_hash_map.items():
-            most_recent_file = min(file_list, key=lambda f: os.path.getmtime(f))
-            camera_name, creation_year, creation_date = output_video_path(most_recent_file)
-            camera_name = CAMERA_NAME_ALIASES.get(camera_name, camera_name)
-            target_dir = os.path.join(output_folder, camera_name, creation_year, creation_date)
-            os.makedirs(target_dir, exist_ok=True)
-            target_symlink = os.path.join(target_dir, os.path.basename(most_recent_file))
-            if not os.path.exists(target_symlink):
-                print(f"Creating symlink for {most_recent_file} at {target_symlink}")
-                os.symlink(most_recent_file, target_symlink)
-        print("Organization completed.")
+def resolve_metadata(metadata_pool, entries, cache, hash_algorithm):
+    """Fill in the metadata of every entry from the cache, parsing each unknown file content once on the pool."""
+    extractors = {'image': output_image_path, 'video': output_video_path}
+    pending = defaultdict(list)
+    with METRICS.stage('cache lookup'):
+        hash_hits = cache.lookup_hashes((entry['file_hash'] for entry in entries if entry['metadata'] is None and entry['file_hash']),
+                                        hash_algorithm)
+    for entry in entries:
+        if entry['metadata'] is not None:
+            continue
+        if entry['file_hash'] in hash_hits:
+            entry['metadata'] = hash_hits[entry['file_hash']]
+            METRICS.count('metadata_cache_hits')
+            continue
+        pending[entry['file_hash'] or entry['path']].append(entry)
+    if not pending:
+        return
+
+    def submit(key):
+        entry = pending[key][0]
+        return metadata_pool.submit(extractors[entry['kind']], entry['path'])
+    jobs = [(group[0]['path'], group[0]['stat'], key) for key, group in pending.items()]
+    with METRICS.stage('metadata'), Progress('Reading metadata', len(jobs)) as progress:
+        for key, future in run_scheduled(jobs, submit):
+            for entry in pending[key]:
+                entry['metadata'] = future.result()
+            METRICS.count('metadata_parsed')
+            progress.update()
+
+def verify_hashes(hash_pool, entries, hash_algorithm):
+    """Hash every entry in full and report files whose content no longer matches the cache."""
+    compute_hashes(hash_pool, entries, 'file_hash', hash_algorithm)
+    for entry in entries:
+        if entry.get('cached_hash') and entry['cached_hash'] != entry['file_hash']:
+            log.warning("Cache mismatch for %s: cached %s, actual %s", entry['path'], entry['cached_hash'], entry['file_hash'])
+            METRICS.count('cache_mismatches')
+
+def store_previews(hash_pool, metadata_pool, entries, hash_algorithm, preview_dir):
+    """Generate the cached previews of every image entry on the metadata pool, once per file content.
+
+    Previews are keyed as the viewer looks them up (see preview_key): by the full hash where dedup computed
+    one, and otherwise by path, size and mtime, so no image is read in full just to key its previews.
+    """
+    entries_by_key = {}
+    for entry in entries:
+        if entry['kind'] == 'image':
+            entries_by_key[preview_key(entry['path'], entry['stat'], entry['file_hash'], hash_algorithm)] = entry
+    jobs = [(entry['path'], entry['stat'], key) for key, entry in entries_by_key.items()]
+    created = 0
+    with METRICS.stage('previews'), Progress('Previews', len(jobs)) as progress:
+        for key, future in run_scheduled(jobs, lambda key: metadata_pool.submit(
+                generate_previews, entries_by_key[key]['path'], *key, preview_dir)):
+            created += future.result()
+            progress.update()
+    METRICS.count('previews_created', created)
+    log.debug("Created previews for %d of %d images", created, len(entries_by_key))
+
+def resolve_layout(layout):
+    """Return the folder format of a layout name, or check and return a custom format."""
+    pattern = LAYOUTS.get(layout, layout)
+    try:
+        folder = pattern.format(camera='c', year='y', month='m', date='d')
+    except (KeyError, IndexError, ValueError):
+        folder = None
+    if folder is None or folder == pattern:
+        raise ValueError(f"Unsupported layout {layout!r}: use one of {', '.join(sorted(LAYOUTS))} "
+                         "or a format such as '{camera}/{year}/{date}' (fields: camera, year, month, date)")
+    return pattern
+
+def link_target(record, output_folder, layout=LAYOUTS[DEFAULT_LAYOUT]):
+    """Return where a record is linked in the output tree, given a resolved layout format."""
+    camera_name = CAMERA_NAME_ALIASES.get(record.camera_name, record.camera_name)
+    folder = layout.format(camera=camera_name, year=record.creation_year, month=record.creation_date[:7],
+                           date=record.creation_date)
+    return os.path.join(output_folder, *folder.split('/'), os.path.basename(record.file_path))
+
+def find_similar(image_map, entries, max_distance=DEFAULT_SIMILARITY_DISTANCE):
+    """Return groups of near-duplicate image records by perceptual hash, earliest-modified first in each group."""
+    phashes = {entry['path']: entry['phash'] for entry in entries if entry.get('phash') is not None}
+    records = sorted((record for record in image_map.values() if record.file_path in phashes), key=lambda record: (record.mtime_ns, record.file_path))
+    with METRICS.stage('similar'):
+        groups = group_similar([(record, phashes[record.file_path]) for record in records], max_distance)
+    METRICS.count('similar_groups', len(groups))
+    METRICS.count('similar_images', sum(len(group) for group in groups))
+    log.info("Found %d groups of similar images (%d images)", len(groups), sum(len(group) for group in groups))
+    for group in groups:
+        log.debug("Similar images: %s", ", ".join(record.file_path for record in group))
+    return groups
+
+def link_media(records, output_folder, dry_run=False, collapsed=None, layout=LAYOUTS[DEFAULT_LAYOUT],
+               link_mode=DEFAULT_LINK_MODE, hashes=None, workers=DEFAULT_WORKERS):
+    """Symlink every record into the output layout, or only log the plan with dry_run.
+
+    Records in `collapsed` ({file_path: first record of its similar group}) are linked into the similar
+    folder next to the first record's link instead. With another link_mode the files are hardlinked, reflinked
+    or copied on `workers` threads, and copies are checked against hashes ({file_path: (file_hash, hash_algorithm)}).
+    Returns the plan.
+    """
+    collapsed = collapsed or {}
+    links = []
+    for record in records:
+        first = collapsed.get(record.file_path)
+        if first is None:
+            links.append((record.file_path, link_target(record, output_folder, layout)))
+        else:
+            links.append((record.file_path, os.path.join(collapsed_folder(link_target(first, output_folder, layout)),
+                                                         os.path.basename(record.file_path))))
+    with METRICS.stage('link'):
+        plan = plan_links(links, link_mode)
+        if dry_run:
+            log_plan(plan)
+        else:
+            apply_links(plan, link_mode, hashes, workers)
+    return plan
+
+def organize_files(source_folder, output_folder, verify=False, workers=DEFAULT_WORKERS, hash_algorithm=DEFAULT_HASH_ALGORITHM,
+                   cache_path=DEFAULT_CACHE_PATH, preview_dir=None, dry_run=False, similar=False,
+                   similar_distance=DEFAULT_SIMILARITY_DISTANCE, collapse_similar=False, similar_report=None,
+                   layout=DEFAULT_LAYOUT, shard=None, link_mode=DEFAULT_LINK_MODE):
+    """Organize files in the output folder, deduplicating by content and using symlinks.
+
+    Files whose path, size, mtime and inode match the cache are not re-hashed, and files are only hashed
+    far enough to separate them from files of the same size; verify forces a full hash of every file.
+    Hashes cached under a different hash_algorithm are recomputed; their metadata is kept.
+    Hashing runs on a pool of `workers` threads and metadata parsing on a pool of `workers` processes;
+    the calling thread only talks to the SQLite cache at cache_path and creates the symlinks.
+    With a preview_dir, screen-size previews and thumbnails of every image are cached there for the viewer.
+    With dry_run, the links that would be created are logged instead; the file cache is still updated.
+    With similar, images are also grouped by perceptual hash (within similar_distance bits); the groups can be
+    written to the JSON file similar_report, and with collapse_similar only the earliest image of each group
+    stays in its date folder, with the others linked into a similar/ folder beside it.
+    layout names one of LAYOUTS or gives a custom folder format.
+    With shard (index, count), only that share of the source tree is hashed and parsed into the cache and
+    nothing is linked; merging the shard caches and running once more without a shard links the whole tree,
+    hashing only files that collide across shards.
+    link_mode 'hardlink', 'reflink' or 'copy' materializes the output instead of symlinking it; files already
+    materialized are skipped and copies are verified against their content hash.
+    """
+    layout = resolve_layout(layout)
+    with FileCache(cache_path) as cache:
+        hash_algorithm = resolve_hash_algorithm(hash_algorithm)
+        log.info("Organizing files from %s to %s with %d workers, hashing with %s", source_folder, output_folder, workers, hash_algorithm)
+        with ThreadPoolExecutor(max_workers=workers) as hash_pool, ProcessPoolExecutor(max_workers=workers) as metadata_pool:
+            # Stage 1: stat every file and pick up whatever the cache already knows about it
+            media_files = find_media_files(source_folder, excluded=[output_folder])
+            if shard:
+                media_files = (item for item in media_files if in_shard(item[0], source_folder, shard))
+            entries = load_entries(METRICS.timed_iter(media_files, 'walk'), cache, hash_algorithm, verify=verify)
+            log.info("Found %d media files", len(entries))
+
+            # Stage 2: hash only what is needed to tell duplicates apart
+            if verify:
+                verify_hashes(hash_pool, entries, hash_algorithm)
+            else:
+                resolve_duplicates(hash_pool, entries, hash_algorithm)
+
+            # Stage 3: resolve metadata from the cache and queue one parse per unknown file content
+            resolve_metadata(metadata_pool, entries, cache, hash_algorithm)
+
+            if preview_dir:
+                store_previews(hash_pool, metadata_pool, entries, hash_algorithm, preview_dir)
+
+            if similar:
+                compute_phashes(metadata_pool, entries, cache)
+
+        if preview_dir:
+            PreviewCache(preview_dir).evict()
 
+        # Stage 4: store new and updated rows, and keep one record per file content
+        media_maps = {'image': {}, 'video': {}}
+        for entry in entries:
+            if entry['changed']:
+                cache.store(entry['file_hash'], entry['path'], entry['stat'], *entry['metadata'],
+                            partial_hash=entry['partial_hash'], hash_algorithm=hash_algorithm, phash=entry.get('phash'))
+            elif entry.get('phash_computed'):
+                cache.update_phash(entry['path'], entry['stat'], entry['phash'])
+            record = MediaRecord(entry['path'], entry['stat'].st_mtime_ns, *entry['metadata'])
+            keep_earliest(media_maps[entry['kind']], content_key(entry), record)
+        cache.flush()
+        if not shard:
+            # A shard only walks its share of the tree, so it can't tell which files are gone
+            removed = cache.forget_unseen(source_folder, {entry['path'] for entry in entries})
+            if removed:
+                log.info("Removed %d files from the cache that are no longer in %s", removed, source_folder)
+        if shard:
+            log.info("Shard %d of %d cached; merge the shard caches and run again to link", shard[0] + 1, shard[1])
+            return
 
+        collapsed = {}
+        if similar:
+            groups = find_similar(media_maps['image'], entries, similar_distance)
+            if similar_report:
+                write_similar_report([[record.file_path for record in group] for group in groups], similar_report)
+            if collapse_similar:
+                collapsed = {record.file_path: group[0] for group in groups for record in group[1:]}
 
+        hashes = {entry['path']: (entry['file_hash'], hash_algorithm) for entry in entries if entry['file_hash']}
+        log.info("Linking %d images and %d videos", len(media_maps['image']), len(media_maps['video']))
+        link_media([*media_maps['image'].values(), *media_maps['video'].values()], output_folder, dry_run=dry_run,
+                   collapsed=collapsed, layout=layout, link_mode=link_mode, hashes=hashes, workers=workers)
+        log.info("Organization completed.")
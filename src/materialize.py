@@ -0,0 +1,149 @@
+"""
+Materializing output files as hardlinks, reflinks or copies instead of symlinks.
+
+Symlinks break when the source folder moves and some tools refuse them, so the output tree can also be
+made of hardlinks (same filesystem only), reflinks (FICLONE: the copy shares the source's blocks until either
+is written, on btrfs, XFS and the like) or full copies. Copies go through copy_file_range, which the kernel
+turns into a reflink or a server-side copy where the filesystem supports it, and otherwise copies without
+passing the data through Python. Every file is written to <target>.partial and renamed into place once
+complete, so an interrupted run leaves no half-written targets and the next run continues a partial copy where
+it stopped. Copies are checked against the content hash the ingest already computed before they are renamed.
+"""
+import os
+import errno
+import shutil
+import logging
+from src.hashing import hash_file, READ_BUFFER_BYTES, DEFAULT_HASH_ALGORITHM
+from src.metrics import METRICS
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+log = logging.getLogger(__name__)
+
+LINK_MODES = ('symlink', 'hardlink', 'reflink', 'copy')
+DEFAULT_LINK_MODE = 'symlink'
+
+# FICLONE from linux/fs.h: make the destination share all of the source's extents
+FICLONE = 0x40049409
+
+# Bytes handed to one copy_file_range call
+COPY_CHUNK_BYTES = 64 * 1024 * 1024
+
+PARTIAL_SUFFIX = '.partial'
+
+# Errors meaning "this filesystem (pair) can't do that", after which the next method down is tried
+UNSUPPORTED_ERRNOS = {errno.EXDEV, errno.EOPNOTSUPP, errno.ENOTTY, errno.EINVAL, errno.ENOSYS, errno.EPERM, errno.EMLINK}
+
+
+def is_up_to_date(source, target, mode):
+    """Return True if target already holds source in the given mode (the same inode for hardlinks, and a
+    regular file of the same size and modification time for reflinks and copies)."""
+    try:
+        source_stat = os.stat(source)
+        target_stat = os.stat(target, follow_symlinks=False)
+    except OSError:
+        return False
+    if mode == 'hardlink':
+        return (source_stat.st_dev, source_stat.st_ino) == (target_stat.st_dev, target_stat.st_ino)
+    return (os.path.isfile(target) and not os.path.islink(target) and target_stat.st_size == source_stat.st_size
+            and target_stat.st_mtime_ns == source_stat.st_mtime_ns)
+
+
+def reflink_file(source, target):
+    """Clone source into target with FICLONE; raises OSError where the filesystem can't share extents."""
+    if fcntl is None:
+        raise OSError(errno.EOPNOTSUPP, "reflinks need fcntl")
+    with open(source, 'rb') as src, open(target, 'wb') as dst:
+        fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+
+
+def copy_file(source, target):
+    """Copy source into target, continuing from the end of target if it already holds the start of the file.
+
+    Returns the number of bytes copied by this call.
+    """
+    size = os.path.getsize(source)
+    offset = os.path.getsize(target) if os.path.exists(target) else 0
+    if offset > size:
+        offset = 0
+    if offset:
+        log.debug("Resuming copy of %s at %d of %d bytes", source, offset, size)
+    with open(source, 'rb', buffering=0) as src, open(target, 'r+b' if offset else 'wb', buffering=0) as dst:
+        dst.truncate(offset)
+        position = offset
+        if hasattr(os, 'copy_file_range'):
+            try:
+                while position < size:
+                    copied = os.copy_file_range(src.fileno(), dst.fileno(), min(COPY_CHUNK_BYTES, size - position),
+                                                position, position)
+                    if not copied:
+                        break
+                    position += copied
+            except OSError as e:
+                if e.errno not in UNSUPPORTED_ERRNOS:
+                    raise
+        if position < size:
+            src.seek(position)
+            dst.seek(position)
+            shutil.copyfileobj(src, dst, READ_BUFFER_BYTES)
+            position = dst.tell()
+    return position - offset
+
+
+def _write_partial(source, partial_path, mode):
+    """Materialize source at partial_path, falling back from hardlink and reflink to a copy.
+
+    A partial file left by an earlier run is a copy that was cut short, and is continued as one. Returns
+    (method used, whether a partial copy was resumed).
+    """
+    if os.path.lexists(partial_path):
+        if is_up_to_date(source, partial_path, 'hardlink'):
+            # Linked just before an interruption; writing to it would write to the source
+            return 'hardlink', False
+    elif mode in ('hardlink', 'reflink'):
+        try:
+            if mode == 'hardlink':
+                os.link(source, partial_path)
+            else:
+                reflink_file(source, partial_path)
+            return mode, False
+        except OSError as e:
+            if e.errno not in UNSUPPORTED_ERRNOS:
+                raise
+            log.debug("Can't %s %s (%s), copying instead", mode, source, e.strerror)
+            if os.path.lexists(partial_path):
+                # A failed clone leaves an empty file behind, which must not count as a partial copy
+                os.unlink(partial_path)
+    resumed = os.path.lexists(partial_path)
+    METRICS.count('bytes_copied', copy_file(source, partial_path))
+    return 'copy', resumed
+
+
+def materialize(source, target, mode, expected_hash=None, hash_algorithm=DEFAULT_HASH_ALGORITHM):
+    """Make target a hardlink, reflink or copy of source, replacing whatever is at target.
+
+    Copies are checked against expected_hash (the full content hash of source under hash_algorithm) or, when
+    the ingest never hashed the file in full, against a hash of the source; a copy that doesn't match is
+    discarded and raises OSError. A mismatching resumed copy is restarted once from scratch first.
+    Returns the method used, which is a copy where the filesystem can't link or clone.
+    """
+    partial_path = target + PARTIAL_SUFFIX
+    while True:
+        method, resumed = _write_partial(source, partial_path, mode)
+        if method != 'copy':
+            break
+        expected_hash = expected_hash or hash_file(source, hash_algorithm)
+        if hash_file(partial_path, hash_algorithm) == expected_hash:
+            METRICS.count('copies_verified')
+            break
+        os.unlink(partial_path)
+        if not resumed:
+            raise OSError(errno.EIO, f"Copy of {source} does not match its content hash")
+        log.warning("Resumed copy of %s did not match its content hash; copying it again", source)
+    if method != 'hardlink':
+        shutil.copystat(source, partial_path)
+    os.replace(partial_path, target)
+    return method
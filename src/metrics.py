@@ -0,0 +1,156 @@
+"""
+Run metrics and progress reporting.
+
+Pipeline stages add their wall time and counters to METRICS, which run.py can dump as JSON at the end of a
+run. Progress keeps a single self-updating line with throughput and ETA on a terminal, and logs a summary
+when the stage finishes.
+"""
+import sys
+import json
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from collections import defaultdict
+
+log = logging.getLogger(__name__)
+
+# Minimum seconds between redraws of the progress line
+PROGRESS_INTERVAL = 0.5
+
+
+def format_duration(seconds):
+    """Format seconds as H:MM:SS, or M:SS under an hour."""
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}" if hours else f"{minutes}:{seconds:02d}"
+
+
+class Metrics:
+    """Wall-clock time per stage and named counters for a run. Safe to update from several threads."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Start a new run."""
+        with self.lock:
+            self.started = time.time()
+            self._start = time.perf_counter()
+            self.timers = defaultdict(float)
+            self.counters = defaultdict(int)
+
+    @contextmanager
+    def stage(self, name):
+        """Add the time spent in the block to the named stage."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self.lock:
+                self.timers[name] += elapsed
+
+    def timed_iter(self, iterable, name):
+        """Yield from an iterable, adding the time spent producing each item to the named stage."""
+        iterator = iter(iterable)
+        while True:
+            with self.stage(name):
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            yield item
+
+    def count(self, name, amount=1):
+        with self.lock:
+            self.counters[name] += amount
+
+    def as_dict(self):
+        with self.lock:
+            return {'started': self.started, 'elapsed_seconds': time.perf_counter() - self._start,
+                    'stages': dict(self.timers), 'counters': dict(self.counters)}
+
+    def log_summary(self):
+        """Log the time per stage, slowest first, and the counters."""
+        metrics = self.as_dict()
+        log.info("Finished in %s", format_duration(metrics['elapsed_seconds']))
+        for name, seconds in sorted(metrics['stages'].items(), key=lambda item: -item[1]):
+            log.info("  %-14s %8.2fs", name, seconds)
+        if metrics['counters']:
+            log.info("  %s", ", ".join(f"{name}={value}" for name, value in sorted(metrics['counters'].items())))
+
+    def dump(self, path):
+        """Write the metrics to a JSON file."""
+        with open(path, 'w') as f:
+            json.dump(self.as_dict(), f, indent=2)
+        log.info("Wrote metrics to %s", path)
+
+
+METRICS = Metrics()
+
+
+class Progress:
+    """Progress of one stage as a single line on stderr, redrawn at most every PROGRESS_INTERVAL seconds.
+
+    The line is only drawn on a terminal and when debug logging is off; a stage started while another is
+    drawing (e.g. hashing inside a streaming chunk) stays silent and logs its summary at debug level.
+    """
+
+    _active = None
+
+    def __init__(self, label, total=None, unit='files', stream=None):
+        self.label = label
+        self.total = total
+        self.unit = unit
+        self.stream = stream or sys.stderr
+        self.done = 0
+        self.bytes = 0
+        self.nested = Progress._active is not None
+        if not self.nested:
+            Progress._active = self
+        self.enabled = not self.nested and self.stream.isatty() and not log.isEnabledFor(logging.DEBUG)
+        self._start = self._last_draw = time.perf_counter()
+        self._width = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def update(self, count=1, nbytes=0):
+        self.done += count
+        self.bytes += nbytes
+        now = time.perf_counter()
+        if self.enabled and now - self._last_draw >= PROGRESS_INTERVAL:
+            self._last_draw = now
+            self._draw(now)
+
+    def _draw(self, now):
+        elapsed = max(now - self._start, 1e-9)
+        rate = self.done / elapsed
+        parts = [f"{self.label}: {self.done}" + (f"/{self.total}" if self.total else "") + f" {self.unit}",
+                 f"{rate:.1f} {self.unit}/s"]
+        if self.bytes:
+            parts.append(f"{self.bytes / elapsed / 1e6:.1f} MB/s")
+        if self.total and rate > 0:
+            parts.append(f"ETA {format_duration((self.total - self.done) / rate)}")
+        line = ", ".join(parts)
+        self.stream.write("\r" + line.ljust(self._width))
+        self.stream.flush()
+        self._width = len(line)
+
+    def close(self):
+        """Clear the progress line and log what the stage did."""
+        if self._width:
+            self.stream.write("\r" + " " * self._width + "\r")
+            self.stream.flush()
+            self._width = 0
+        if Progress._active is self:
+            Progress._active = None
+        if self.done:
+            elapsed = max(time.perf_counter() - self._start, 1e-9)
+            log.log(logging.DEBUG if self.nested else logging.INFO, "%s: %d %s in %.1fs (%.1f %s/s)",
+                    self.label, self.done, self.unit, elapsed, self.done / elapsed, self.unit)
@@ -0,0 +1,199 @@
+"""
+Content-addressed cache of screen-size previews and small thumbnails.
+
+Previews are keyed by the file hash (and the algorithm that produced it), so every copy of a photo shares
+one preview, and are stored as compact JPEGs under the cache directory. Files that were never hashed in full
+are keyed by their path, size and mtime instead (see preview_key). Ingest can fill the cache ahead of time;
+the viewer reads from it and fills it with whatever it had to decode itself.
+"""
+import io
+import os
+import hashlib
+import logging
+import threading
+from PIL import Image, ExifTags
+from src.exif import read_embedded_preview
+
+DEFAULT_PREVIEW_DIR = 'previews'
+
+# Longest edge of each stored size
+PREVIEW_SIZES = {'preview': 2048, 'thumbnail': 256}
+PREVIEW_QUALITY = 85
+
+# The least recently used previews are removed once the cache grows past this, down to EVICT_TO_FRACTION of it
+DEFAULT_PREVIEW_CACHE_BYTES = 2 * 1024 * 1024 * 1024
+EVICT_TO_FRACTION = 0.9
+
+# RAW files are decoded through the preview JPEG embedded in them
+RAW_EXTENSIONS = ('.cr2', '.nef', '.arw', '.dng')
+
+# Stands in for the hash algorithm of previews keyed by path, size and mtime
+STAT_PREVIEW_KEY = 'stat'
+
+log = logging.getLogger(__name__)
+
+ORIENTATION_TAG = next(tag for tag, name in ExifTags.TAGS.items() if name == 'Orientation')
+
+
+def image_orientation(image):
+    """Return the EXIF orientation of an opened image, or None."""
+    try:
+        exif = image._getexif()
+        if exif:
+            return exif.get(ORIENTATION_TAG)
+    except (AttributeError, KeyError, IndexError):
+        pass
+    return None
+
+
+def orient_image(image, orientation):
+    """Rotate an image upright according to its EXIF orientation."""
+    if orientation == 3:
+        image = image.rotate(180, expand=True)
+    elif orientation == 6:
+        image = image.rotate(270, expand=True)
+    elif orientation == 8:
+        image = image.rotate(90, expand=True)
+    return image
+
+
+def open_image(file_path, target_size=None):
+    """Open an image without decoding it, returning (image, orientation).
+
+    With a target size, JPEGs are set up to decode at the smallest DCT scale that still fills the target
+    size once fitted into it. RAW files are opened through their embedded preview JPEG.
+    """
+    if file_path.lower().endswith(RAW_EXTENSIONS):
+        preview = read_embedded_preview(file_path)
+        if preview is None:
+            raise ValueError("no embedded preview to display")
+        offset, length, orientation = preview
+        with open(file_path, 'rb') as f:
+            f.seek(offset)
+            image = Image.open(io.BytesIO(f.read(length)))
+    else:
+        image = Image.open(file_path)
+        orientation = image_orientation(image)
+    if target_size and image.format == 'JPEG':
+        width, height = target_size
+        if orientation in (5, 6, 7, 8):
+            # The image is rotated a quarter turn after decoding
+            width, height = height, width
+        ratio = min(width / image.width, height / image.height)
+        image.draft(image.mode, (int(image.width * ratio), int(image.height * ratio)))
+    return image, orientation
+
+
+def fit_within(image, max_edge):
+    """Return the image scaled down so its longest edge is at most max_edge."""
+    ratio = max_edge / max(image.size)
+    if ratio >= 1:
+        return image
+    return image.resize((max(1, int(image.width * ratio)), max(1, int(image.height * ratio))), Image.LANCZOS)
+
+
+def preview_key(file_path, file_stat, file_hash=None, hash_algorithm=None):
+    """Return the (key, hash_algorithm) the previews of a file are stored under.
+
+    That is its full content hash when one is known. Ingest only hashes size-colliding files in full, though,
+    and hashing a whole original just to key its previews costs more than decoding it, so other files are keyed
+    by their real path, size and mtime, which both ingest and the viewer have without reading the file.
+    """
+    if file_hash:
+        return file_hash, hash_algorithm
+    stat_key = f"{os.path.realpath(file_path)}\0{file_stat.st_size}\0{file_stat.st_mtime_ns}"
+    return hashlib.sha1(stat_key.encode('utf-8', 'surrogateescape')).hexdigest(), STAT_PREVIEW_KEY
+
+
+class PreviewCache:
+    """Directory of preview and thumbnail JPEGs named after file content hashes, with size-bounded LRU eviction.
+
+    Hits refresh the file's mtime, which eviction uses as the last access time.
+    """
+
+    def __init__(self, cache_dir=DEFAULT_PREVIEW_DIR, max_bytes=DEFAULT_PREVIEW_CACHE_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._total_bytes = None
+
+    def path(self, file_hash, hash_algorithm, kind):
+        """Return where the given size of a file content's preview is stored."""
+        return os.path.join(self.cache_dir, file_hash[:2], f"{hash_algorithm}-{file_hash}-{kind}.jpg")
+
+    def get(self, file_hash, hash_algorithm, kind):
+        """Return the cached preview as a decoded image, or None."""
+        path = self.path(file_hash, hash_algorithm, kind)
+        try:
+            image = Image.open(path)
+            image.load()
+            os.utime(path)
+        except (OSError, ValueError):
+            return None
+        return image
+
+    def has(self, file_hash, hash_algorithm, kind):
+        return os.path.exists(self.path(file_hash, hash_algorithm, kind))
+
+    def put(self, file_hash, hash_algorithm, kind, image):
+        """Store an image (already upright) as the given preview size, scaling it down as needed."""
+        path = self.path(file_hash, hash_algorithm, kind)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        image = fit_within(image, PREVIEW_SIZES[kind])
+        if image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+        # Write to a temporary name first so readers never see a half-written preview
+        temporary_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        image.save(temporary_path, 'JPEG', quality=PREVIEW_QUALITY)
+        os.replace(temporary_path, path)
+        if self._total_bytes is not None:
+            self._total_bytes += os.path.getsize(path)
+            if self._total_bytes > self.max_bytes:
+                self.evict()
+
+    def put_all(self, file_hash, hash_algorithm, image):
+        """Store every preview size from one upright image, largest first so each is scaled from the last."""
+        for kind, max_edge in sorted(PREVIEW_SIZES.items(), key=lambda item: -item[1]):
+            image = fit_within(image, max_edge)
+            self.put(file_hash, hash_algorithm, kind, image)
+
+    def evict(self):
+        """Remove the least recently used previews until the cache is back under its size budget."""
+        files = []
+        for directory, _, names in os.walk(self.cache_dir):
+            for name in names:
+                path = os.path.join(directory, name)
+                try:
+                    file_stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                files.append((file_stat.st_mtime_ns, file_stat.st_size, path))
+        total_bytes = sum(size for _, size, _ in files)
+        if total_bytes > self.max_bytes:
+            target = self.max_bytes * EVICT_TO_FRACTION
+            for _, size, path in sorted(files):
+                if total_bytes <= target:
+                    break
+                try:
+                    os.unlink(path)
+                except FileNotFoundError:
+                    pass
+                total_bytes -= size
+        self._total_bytes = total_bytes
+
+
+def generate_previews(file_path, file_hash, hash_algorithm, cache_dir=DEFAULT_PREVIEW_DIR):
+    """Decode a file once and store all its preview sizes. Returns True if previews were written.
+
+    Runs in worker processes, so eviction is left to the caller.
+    """
+    cache = PreviewCache(cache_dir)
+    if all(cache.has(file_hash, hash_algorithm, kind) for kind in PREVIEW_SIZES):
+        return False
+    try:
+        max_edge = max(PREVIEW_SIZES.values())
+        image, orientation = open_image(file_path, (max_edge, max_edge))
+        cache.put_all(file_hash, hash_algorithm, orient_image(image, orientation))
+    except Exception as e:
+        log.warning("Could not create previews for %s: %s", file_path, e)
+        return False
+    return True
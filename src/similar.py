@@ -0,0 +1,189 @@
+"""
+Perceptual hashes and near-duplicate grouping.
+
+Each image is decoded at a tiny size in a worker process (JPEGs through their DCT scaling), and the 64-bit
+pHash of a whole batch is then computed at once with NumPy: the low 8x8 frequencies of a 32x32 DCT,
+thresholded at their median. Near-duplicates (bursts, resized exports, re-encoded copies) have hashes a few
+bits apart, and a BK-tree finds everything within that Hamming distance without comparing every pair.
+"""
+import os
+import json
+import logging
+from collections import defaultdict
+from PIL import Image
+from src.previews import open_image, orient_image
+from src.metrics import METRICS, Progress
+from src.io_scheduler import run_scheduled
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+log = logging.getLogger(__name__)
+
+# Side of the grayscale square the DCT runs on, and of the low-frequency block that makes up the hash
+PHASH_SIZE = 32
+PHASH_LOW_FREQUENCIES = 8
+
+# Images whose hashes differ in at most this many of the 64 bits are grouped together
+DEFAULT_SIMILARITY_DISTANCE = 8
+
+# Decoded images are hashed this many at a time
+PHASH_BATCH_SIZE = 4096
+
+# Collapsed group members are linked into this folder next to the group's first image
+SIMILAR_FOLDER = 'similar'
+
+
+def hamming_distance(a, b):
+    return (a ^ b).bit_count()
+
+
+def image_pixels(file_path):
+    """Decode an image as PHASH_SIZE x PHASH_SIZE upright grayscale bytes, or None if it can't be decoded.
+
+    Runs in worker processes.
+    """
+    try:
+        image, orientation = open_image(file_path, (PHASH_SIZE, PHASH_SIZE))
+        image = image.convert('L').resize((PHASH_SIZE, PHASH_SIZE), Image.BILINEAR)
+        return orient_image(image, orientation).tobytes()
+    except Exception as e:
+        log.debug("Could not decode %s for its perceptual hash: %s", file_path, e)
+        return None
+
+
+def _dct_rows(size, count):
+    """Return the first `count` rows of the orthonormal DCT-II matrix of the given size."""
+    frequencies = np.arange(count)[:, None]
+    samples = np.arange(size)[None, :]
+    rows = np.cos(np.pi * (2 * samples + 1) * frequencies / (2 * size)) * np.sqrt(2 / size)
+    rows[0] /= np.sqrt(2)
+    return rows
+
+
+def phash_batch(pixel_blocks):
+    """Return the 64-bit perceptual hash of each block of grayscale bytes from image_pixels."""
+    if not pixel_blocks:
+        return []
+    pixels = np.frombuffer(b''.join(pixel_blocks), dtype=np.uint8).reshape(-1, PHASH_SIZE, PHASH_SIZE).astype(np.float32)
+    rows = _dct_rows(PHASH_SIZE, PHASH_LOW_FREQUENCIES).astype(np.float32)
+    low = (rows @ pixels @ rows.T).reshape(len(pixel_blocks), -1)
+    # The DC term only carries overall brightness, so it is left out of the median
+    bits = low > np.median(low[:, 1:], axis=1, keepdims=True)
+    return [int.from_bytes(packed.tobytes(), 'big') for packed in np.packbits(bits, axis=1)]
+
+
+def compute_phashes(pool, entries, cache):
+    """Set entry['phash'] on every image entry, from the cache for unchanged files and decoding the rest on the pool.
+
+    Byte-identical copies share one decode. Entries that could not be decoded get None, and entries whose hash
+    was computed here are marked with 'phash_computed' so the caller can store it.
+    """
+    if np is None:
+        raise ImportError("Perceptual hashing needs numpy; install it with 'pip install numpy'")
+    images = [entry for entry in entries if entry['kind'] == 'image']
+    with METRICS.stage('cache lookup'):
+        cached = cache.lookup_phashes(entry['path'] for entry in images if not entry['changed'])
+    pending = defaultdict(list)
+    for entry in images:
+        entry['phash'] = cached.get(entry['path'])
+        if entry['phash'] is None:
+            pending[entry['file_hash'] or entry['path']].append(entry)
+    METRICS.count('phash_cache_hits', len(cached))
+    if not pending:
+        return
+    jobs = [(group[0]['path'], group[0]['stat'], key) for key, group in pending.items()]
+    decoded = []
+    with METRICS.stage('phash'), Progress('Perceptual hashing', len(jobs)) as progress:
+        for key, future in run_scheduled(jobs, lambda key: pool.submit(image_pixels, pending[key][0]['path'])):
+            pixels = future.result()
+            if pixels is not None:
+                decoded.append((key, pixels))
+            if len(decoded) >= PHASH_BATCH_SIZE:
+                _assign_phashes(pending, decoded)
+                decoded = []
+            progress.update()
+        _assign_phashes(pending, decoded)
+    METRICS.count('phashes_computed', len(jobs))
+
+
+def _assign_phashes(pending, decoded):
+    """Hash one batch of (content key, pixels) and set the result on every entry with that content."""
+    for (key, _), phash in zip(decoded, phash_batch([pixels for _, pixels in decoded])):
+        for entry in pending[key]:
+            entry['phash'] = phash
+            entry['phash_computed'] = True
+
+
+class BKTree:
+    """Burkhard-Keller tree of 64-bit hashes under Hamming distance.
+
+    Each child sits under the distance to its parent, so a search only descends into children whose distance
+    could be within range of the query (by the triangle inequality).
+    """
+
+    def __init__(self):
+        self.root = None
+
+    def add(self, phash, key):
+        node = (phash, key, {})
+        if self.root is None:
+            self.root = node
+            return
+        parent = self.root
+        while True:
+            distance = hamming_distance(phash, parent[0])
+            child = parent[2].get(distance)
+            if child is None:
+                parent[2][distance] = node
+                return
+            parent = child
+
+    def search(self, phash, max_distance):
+        """Return (distance, key) for every hash within max_distance of phash."""
+        found = []
+        pending = [self.root] if self.root is not None else []
+        while pending:
+            node_hash, key, children = pending.pop()
+            distance = hamming_distance(phash, node_hash)
+            if distance <= max_distance:
+                found.append((distance, key))
+            pending.extend(child for child_distance, child in children.items()
+                           if distance - max_distance <= child_distance <= distance + max_distance)
+        return found
+
+
+def group_similar(items, max_distance=DEFAULT_SIMILARITY_DISTANCE):
+    """Group (key, phash) items whose hashes are within max_distance of each other.
+
+    Items are taken in the order given: each one not yet grouped starts a group of every ungrouped item within
+    range of it, so groups are centred on their first member and never chain across the library. Returns the
+    groups of two or more keys, each in the original order.
+    """
+    tree = BKTree()
+    for position, (_, phash) in enumerate(items):
+        tree.add(phash, position)
+    grouped = set()
+    groups = []
+    for position, (_, phash) in enumerate(items):
+        if position in grouped:
+            continue
+        members = sorted(match for _, match in tree.search(phash, max_distance) if match not in grouped)
+        grouped.update(members)
+        if len(members) > 1:
+            groups.append([items[member][0] for member in members])
+    return groups
+
+
+def write_similar_report(groups, path):
+    """Write groups of similar file paths to a JSON file, first (kept) file first."""
+    with open(path, 'w') as f:
+        json.dump([{'first': group[0], 'similar': group[1:]} for group in groups], f, indent=2)
+    log.info("Wrote %d similar groups to %s", len(groups), path)
+
+
+def collapsed_folder(link_path):
+    """Return the folder that holds the collapsed group members of the image linked at link_path."""
+    return os.path.join(os.path.dirname(link_path), SIMILAR_FOLDER, os.path.splitext(os.path.basename(link_path))[0])
@@ -0,0 +1,191 @@
+import os
+import logging
+from itertools import islice
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from src.main import (MediaRecord, DEFAULT_WORKERS, find_media_files, load_entries, resolve_duplicates, resolve_metadata,
+                      verify_hashes, store_previews, content_key, link_target, resolve_layout, media_kind,
+                      LAYOUTS, DEFAULT_LAYOUT)
+from src.previews import PreviewCache
+from src.links import plan_links, apply_links
+from src.metrics import METRICS, Progress
+from src.hashing import resolve_hash_algorithm, DEFAULT_HASH_ALGORITHM
+from src.cache import FileCache, DEFAULT_CACHE_PATH
+
+log = logging.getLogger(__name__)
+
+# Files taken from the walk per round trip through the pipeline; bounds memory regardless of library size
+STREAM_CHUNK_SIZE = 256
+
+def chunked(iterable, size):
+    """Yield lists of up to `size` items from the iterable."""
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+def linked_entry(row, hash_algorithm):
+    """Build an entry for a file already linked into the output from its output_index row, or None if it is gone."""
+    file_path, file_size, mtime_ns, file_hash, partial_hash, row_algorithm, link_path = row
+    try:
+        file_stat = os.stat(file_path)
+    except FileNotFoundError:
+        return None
+    if (file_stat.st_size, file_stat.st_mtime_ns) != (file_size, mtime_ns) or row_algorithm != hash_algorithm:
+        # The indexed hashes no longer describe the file on disk; hash it again if it collides
+        file_hash = partial_hash = None
+    return {'path': file_path, 'stat': file_stat, 'file_hash': file_hash, 'partial_hash': partial_hash,
+            'changed': False, 'link_path': link_path, 'indexed': True}
+
+def remove_link(link_path):
+    """Remove a link created by an earlier run, if it is still there."""
+    if link_path and os.path.islink(link_path):
+        log.debug("Removing symlink %s", link_path)
+        os.unlink(link_path)
+        METRICS.count('links_removed')
+
+def ingest_chunk(media_files, output_folder, cache, hash_pool, metadata_pool, hash_algorithm, verify=False, preview_dir=None,
+                 layout=LAYOUTS[DEFAULT_LAYOUT]):
+    """Run one chunk of (file_path, kind) pairs through hash, metadata and link, deduplicating against the output index.
+
+    Returns the number of links created.
+    """
+    entries = load_entries(media_files, cache, hash_algorithm, verify=verify)
+
+    # Skip files already ingested into this output, and retract links to files that changed since
+    indexed = cache.lookup_indexed(output_folder, [entry['path'] for entry in entries])
+    new_entries = []
+    copies = []
+    for entry in entries:
+        if entry['path'] in indexed:
+            file_size, mtime_ns, link_path = indexed[entry['path']]
+            if (file_size, mtime_ns) == (entry['stat'].st_size, entry['stat'].st_mtime_ns) and not verify:
+                continue
+            if link_path:
+                remove_link(link_path)
+                # The old content's other copies compete again for the link this file held
+                copies.extend(cache.take_unlinked_copies(output_folder, entry['path']))
+        new_entries.append(entry)
+    queued = {entry['path'] for entry in new_entries}
+    copies = [(copy_path, media_kind(copy_path)) for copy_path in dict.fromkeys(copies)
+              if copy_path not in queued and os.path.isfile(copy_path)]
+    if copies:
+        log.debug("Requeued %d copies of changed files", len(copies))
+        new_entries.extend(load_entries(copies, cache, hash_algorithm))
+    if not new_entries:
+        return 0
+
+    # Only files already linked with a size seen in this chunk can be duplicates of it
+    chunk_paths = {entry['path'] for entry in new_entries}
+    linked = [linked_entry(row, hash_algorithm)
+              for row in cache.lookup_linked_sizes(output_folder, {entry['stat'].st_size for entry in new_entries})
+              if row[0] not in chunk_paths]
+    linked = [entry for entry in linked if entry is not None]
+    if verify:
+        verify_hashes(hash_pool, new_entries, hash_algorithm)
+    resolve_duplicates(hash_pool, linked + new_entries, hash_algorithm)
+    for entry in linked:
+        if entry['changed']:
+            # Hashes filled in lazily now that another file collided with this one
+            cache.update_hashes(entry['path'], entry['stat'], entry['file_hash'], entry['partial_hash'], hash_algorithm)
+            cache.index_file(output_folder, entry['path'], entry['stat'], entry['file_hash'], entry['partial_hash'],
+                             hash_algorithm, entry['link_path'])
+    resolve_metadata(metadata_pool, new_entries, cache, hash_algorithm)
+    if preview_dir:
+        store_previews(hash_pool, metadata_pool, new_entries, hash_algorithm, preview_dir)
+    for entry in new_entries:
+        if entry['changed']:
+            cache.store(entry['file_hash'], entry['path'], entry['stat'], *entry['metadata'],
+                        partial_hash=entry['partial_hash'], hash_algorithm=hash_algorithm)
+
+    groups = defaultdict(list)
+    for entry in linked + new_entries:
+        groups[content_key(entry)].append(entry)
+    with METRICS.stage('link'):
+        links_created = link_groups(groups.values(), output_folder, cache, hash_algorithm, layout)
+    cache.flush()
+    return links_created
+
+def link_groups(groups, output_folder, cache, hash_algorithm, layout=LAYOUTS[DEFAULT_LAYOUT]):
+    """Link the earliest-modified copy of each group of identical files, retracting links to the other copies.
+
+    Ties go to the lowest path, as in keep_earliest. Returns the number of links created.
+    """
+    winners = []
+    for group in groups:
+        if all(entry.get('indexed') for entry in group):
+            continue
+        winner = min(group, key=lambda entry: (entry['stat'].st_mtime_ns, entry['path']))
+        for entry in group:
+            if entry is winner:
+                continue
+            remove_link(entry.get('link_path'))
+            cache.index_file(output_folder, entry['path'], entry['stat'], entry['file_hash'], entry['partial_hash'],
+                             hash_algorithm, None)
+        if not winner.get('indexed'):
+            winners.append(winner)
+
+    # Plan after the retractions above, so a link path freed by one of them can be reused
+    records = [MediaRecord(winner['path'], winner['stat'].st_mtime_ns, *winner['metadata']) for winner in winners]
+    plan = plan_links((record.file_path, link_target(record, output_folder, layout)) for record in records)
+    apply_links(plan)
+    for winner, action in zip(winners, plan.actions):
+        cache.index_file(output_folder, winner['path'], winner['stat'], winner['file_hash'], winner['partial_hash'],
+                         hash_algorithm, action.link_path)
+    return len(winners)
+
+def relink_missing(output_folder, cache, hash_pool, metadata_pool, hash_algorithm, preview_dir=None,
+                   layout=LAYOUTS[DEFAULT_LAYOUT]):
+    """Retract the links of indexed files that no longer exist, and link a remaining copy of each in their place.
+
+    Costs one stat per linked file. Returns the number of links created.
+    """
+    copies = []
+    with METRICS.stage('relink'):
+        for file_path, link_path in cache.iter_linked(output_folder):
+            if os.path.exists(file_path):
+                continue
+            log.debug("%s is gone, retracting %s", file_path, link_path)
+            remove_link(link_path)
+            copies.extend(cache.take_unlinked_copies(output_folder, file_path))
+            cache.forget_indexed(output_folder, file_path)
+        cache.flush()
+    copies = [(copy_path, media_kind(copy_path)) for copy_path in dict.fromkeys(copies) if os.path.isfile(copy_path)]
+    if not copies:
+        return 0
+    log.info("Linking copies of %d files that are gone", len(copies))
+    return ingest_files(copies, output_folder, cache, hash_pool, metadata_pool, hash_algorithm, preview_dir=preview_dir,
+                        layout=layout)
+
+def ingest_files(media_files, output_folder, cache, hash_pool, metadata_pool, hash_algorithm, verify=False,
+                 chunk_size=STREAM_CHUNK_SIZE, preview_dir=None, layout=LAYOUTS[DEFAULT_LAYOUT]):
+    """Stream (file_path, kind) pairs through the pipeline chunk by chunk and return the number of links created."""
+    files_seen = links_created = 0
+    with Progress('Ingesting') as progress:
+        for chunk in chunked(METRICS.timed_iter(media_files, 'walk'), chunk_size):
+            links_created += ingest_chunk(chunk, output_folder, cache, hash_pool, metadata_pool, hash_algorithm, verify=verify,
+                                          preview_dir=preview_dir, layout=layout)
+            files_seen += len(chunk)
+            progress.update(len(chunk))
+            log.debug("Ingested %d files, %d new links", files_seen, links_created)
+    log.info("Ingested %d files, %d new links", files_seen, links_created)
+    if preview_dir:
+        PreviewCache(preview_dir).evict()
+    return links_created
+
+def stream_organize_files(source_folder, output_folder, verify=False, workers=DEFAULT_WORKERS,
+                          hash_algorithm=DEFAULT_HASH_ALGORITHM, cache_path=DEFAULT_CACHE_PATH, chunk_size=STREAM_CHUNK_SIZE,
+                          preview_dir=None, layout=DEFAULT_LAYOUT):
+    """Organize files like organize_files, but in bounded memory with links appearing as the walk progresses.
+
+    Duplicates are detected against the output_index table in the cache rather than in-memory maps, so
+    the earliest copy of a content found later in the walk replaces the link made for a later one.
+    """
+    layout = resolve_layout(layout)
+    with FileCache(cache_path) as cache:
+        hash_algorithm = resolve_hash_algorithm(hash_algorithm)
+        log.info("Streaming files from %s to %s with %d workers, hashing with %s", source_folder, output_folder, workers, hash_algorithm)
+        with ThreadPoolExecutor(max_workers=workers) as hash_pool, ProcessPoolExecutor(max_workers=workers) as metadata_pool:
+            ingest_files(find_media_files(source_folder, excluded=[output_folder]), output_folder, cache, hash_pool, metadata_pool, hash_algorithm,
+                         verify=verify, chunk_size=chunk_size, preview_dir=preview_dir, layout=layout)
+            relink_missing(output_folder, cache, hash_pool, metadata_pool, hash_algorithm, preview_dir=preview_dir, layout=layout)
+        log.info("Organization completed.")
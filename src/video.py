@@ -0,0 +1,172 @@
+"""
+Lightweight video container reader.
+
+Reads creation date and make/model from QuickTime/MP4 (mvhd, udta and Apple mdta keys) and the creation date
+from AVCHD MTS/M2TS streams with a few bounded seeks and reads, so MediaInfo is only needed for other containers.
+"""
+import time
+import struct
+
+QUICKTIME_EXTENSIONS = {'.mp4', '.mov', '.3gp', '.m4v'}
+MPEG_TS_EXTENSIONS = {'.mts', '.m2ts'}
+
+# Seconds between the QuickTime epoch (1904-01-01) and the Unix epoch
+QUICKTIME_EPOCH_OFFSET = 2082844800
+
+# Upper bounds on how much of a file the reader will look at
+MAX_TOP_LEVEL_BOXES = 64
+MAX_METADATA_BOX_BYTES = 256 * 1024
+MPEG_TS_SCAN_BYTES = 2 * 1024 * 1024
+
+# udta text atoms, keyed by the name used in the returned tags
+UDTA_TEXT_ATOMS = {b'\xa9mak': 'make', b'\xa9mod': 'model', b'\xa9inf': 'info'}
+
+APPLE_KEYS = {'com.apple.quicktime.make': 'make', 'com.apple.quicktime.model': 'model',
+              'com.apple.quicktime.creationdate': 'creation_date'}
+
+# AVCHD stores a "modified digital video pack" (MDPM) in an H.264 SEI message tagged with this UUID
+MDPM_MARKER = bytes.fromhex('17ee8c60f84d11d98cd60800200c9a66') + b'MDPM'
+
+
+def read_video_tags(file_path, extension):
+    """Return a dict with whichever of 'make', 'model', 'info' and 'creation_date' (YYYY-MM-DD) the container holds.
+
+    Returns None for containers this reader does not handle or cannot parse, so the caller can fall back to MediaInfo.
+    """
+    try:
+        with open(file_path, 'rb') as f:
+            if extension in QUICKTIME_EXTENSIONS:
+                return _read_quicktime(f)
+            if extension in MPEG_TS_EXTENSIONS:
+                return _read_mpeg_ts(f)
+    except (OSError, struct.error, ValueError, IndexError, UnicodeDecodeError):
+        pass
+    return None
+
+
+def _child_boxes(f, start, end):
+    """Yield (box_type, payload_start, box_end) for the boxes between start and end, reading only their headers."""
+    offset = start
+    while offset + 8 <= end:
+        f.seek(offset)
+        size, box_type = struct.unpack('>I4s', f.read(8))
+        header = 8
+        if size == 1:
+            size, = struct.unpack('>Q', f.read(8))
+            header = 16
+        elif size == 0:
+            size = end - offset
+        if size < header:
+            return
+        yield box_type, offset + header, min(offset + size, end)
+        offset += size
+
+
+def _read_payload(f, start, end):
+    """Read a box payload, refusing anything larger than MAX_METADATA_BOX_BYTES."""
+    if end - start > MAX_METADATA_BOX_BYTES:
+        raise ValueError("metadata box too large")
+    f.seek(start)
+    return f.read(end - start)
+
+
+def _read_quicktime(f):
+    """Find the moov box among the top-level boxes and read its mvhd, udta and meta children."""
+    f.seek(0, 2)
+    file_size = f.tell()
+    for index, (box_type, start, end) in enumerate(_child_boxes(f, 0, file_size)):
+        if index >= MAX_TOP_LEVEL_BOXES:
+            break
+        if box_type == b'moov':
+            return _read_moov(f, start, end)
+    return None
+
+
+def _read_moov(f, start, end):
+    """Collect the creation date and make/model from the children of the moov box."""
+    tags = {}
+    for box_type, child_start, child_end in _child_boxes(f, start, end):
+        if box_type == b'mvhd':
+            payload = _read_payload(f, child_start, child_end)
+            version = payload[0]
+            creation_time = struct.unpack('>Q' if version == 1 else '>I', payload[4:12 if version == 1 else 8])[0]
+            if creation_time > QUICKTIME_EPOCH_OFFSET:
+                tags.setdefault('creation_date', time.strftime("%Y-%m-%d", time.localtime(creation_time - QUICKTIME_EPOCH_OFFSET)))
+        elif box_type == b'udta':
+            payload = _read_payload(f, child_start, child_end)
+            for atom, text_start, text_end in _iter_payload_boxes(payload, 0, len(payload)):
+                if atom in UDTA_TEXT_ATOMS:
+                    # International text: 16-bit length and language code, then the string
+                    length, = struct.unpack('>H', payload[text_start:text_start + 2])
+                    text = payload[text_start + 4:min(text_start + 4 + length, text_end)]
+                    tags[UDTA_TEXT_ATOMS[atom]] = text.decode('utf-8', 'replace').strip('\x00 ')
+        elif box_type == b'meta':
+            tags.update(_read_mdta(_read_payload(f, child_start, child_end)))
+    # Apple's creationdate carries the local capture date, so it wins over the UTC mvhd timestamp
+    if 'apple_creation_date' in tags:
+        tags['creation_date'] = tags.pop('apple_creation_date')[:10]
+    return tags
+
+
+def _iter_payload_boxes(data, offset, end):
+    """Yield (box_type, payload_start, box_end) for the boxes in data[offset:end]."""
+    while offset + 8 <= end:
+        size, box_type = struct.unpack('>I4s', data[offset:offset + 8])
+        if size < 8:
+            return
+        yield box_type, offset + 8, min(offset + size, end)
+        offset += size
+
+
+def _read_mdta(data):
+    """Read the Apple mdta keys/ilst pair from a QuickTime meta box payload."""
+    # QuickTime meta boxes have no version/flags word, ISO ones do
+    offset = 4 if data[:4] == b'\x00\x00\x00\x00' else 0
+    keys = []
+    values = {}
+    for box_type, start, end in _iter_payload_boxes(data, offset, len(data)):
+        if box_type == b'keys':
+            entry_count, = struct.unpack('>I', data[start + 4:start + 8])
+            position = start + 8
+            for _ in range(entry_count):
+                key_size, = struct.unpack('>I', data[position:position + 4])
+                keys.append(data[position + 8:position + key_size].decode('utf-8', 'replace'))
+                position += key_size
+        elif box_type == b'ilst':
+            for index_bytes, item_start, item_end in _iter_payload_boxes(data, start, end):
+                key_index, = struct.unpack('>I', index_bytes)
+                for data_type, value_start, value_end in _iter_payload_boxes(data, item_start, item_end):
+                    if data_type == b'data':
+                        # Skip the type indicator and locale words
+                        values[key_index] = data[value_start + 8:value_end].decode('utf-8', 'replace')
+    tags = {}
+    for key_index, value in values.items():
+        if 0 < key_index <= len(keys) and keys[key_index - 1] in APPLE_KEYS:
+            name = APPLE_KEYS[keys[key_index - 1]]
+            tags['apple_creation_date' if name == 'creation_date' else name] = value
+    return tags
+
+
+def _read_mpeg_ts(f):
+    """Find the AVCHD MDPM block near the start of the stream and read its recording date."""
+    data = f.read(MPEG_TS_SCAN_BYTES)
+    position = data.find(MDPM_MARKER)
+    if position < 0:
+        return {}
+    # Undo H.264 emulation prevention so the 5-byte tag entries line up
+    block = data[position + len(MDPM_MARKER):position + len(MDPM_MARKER) + 1024].replace(b'\x00\x00\x03', b'\x00\x00')
+    if not block:
+        # Cut off right after the marker; leave the file to MediaInfo
+        return None
+    entries = {}
+    for index in range(block[0]):
+        entry = block[1 + 5 * index:6 + 5 * index]
+        if len(entry) == 5:
+            entries[entry[0]] = entry[1:]
+    if 0x18 not in entries or 0x19 not in entries:
+        # A block cut short by the end of the file may have lost the date entries
+        return None if len(entries) < block[0] and len(data) < MPEG_TS_SCAN_BYTES else {}
+    # 0x18 holds time zone, BCD century, BCD year and BCD month; 0x19 holds BCD day, hour, minute and second
+    _, century, year, month = entries[0x18]
+    day = entries[0x19][0]
+    return {'creation_date': f"{century:02x}{year:02x}-{month:02x}-{day:02x}"}
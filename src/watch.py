@@ -0,0 +1,266 @@
+import os
+import sys
+import time
+import errno
+import select
+import signal
+import ctypes
+import ctypes.util
+import struct
+import logging
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from src.main import DEFAULT_WORKERS, DEFAULT_LAYOUT, find_media_files, media_kind, resolve_layout
+from src.stream import ingest_files, relink_missing
+from src.hashing import resolve_hash_algorithm, DEFAULT_HASH_ALGORITHM
+from src.cache import FileCache, DEFAULT_CACHE_PATH
+
+log = logging.getLogger(__name__)
+
+# A file is ingested once it has gone this long without a new event, so half-copied files are left alone
+DEFAULT_SETTLE_SECONDS = 5.0
+
+# How often the polling watcher rescans the tree
+DEFAULT_POLL_INTERVAL = 10.0
+
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+EVENT_HEADER = struct.Struct('iIII')
+
+
+def _ignore_sigint():
+    """Leave Ctrl+C to the watch loop, which stops the worker pools itself."""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def _is_excluded(path, excluded):
+    """Return True if the path is one of the excluded folders or inside one."""
+    return any(path == folder or path.startswith(folder + os.sep) for folder in excluded)
+
+
+class InotifyWatcher:
+    """Recursive inotify watch on a folder tree (Linux only)."""
+
+    def __init__(self, folder, excluded=()):
+        libc_name = ctypes.util.find_library('c')
+        if not sys.platform.startswith('linux') or libc_name is None:
+            raise OSError(errno.ENOSYS, "inotify is only available on Linux")
+        self._libc = ctypes.CDLL(libc_name, use_errno=True)
+        self.fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.excluded = [os.path.abspath(path) for path in excluded]
+        self.watches = {}
+        try:
+            self._add_tree(folder)
+        except OSError:
+            os.close(self.fd)
+            raise
+
+    def _add_watch(self, directory):
+        """Add an inotify watch for a single directory."""
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(directory), WATCH_MASK)
+        if wd < 0:
+            # ENOSPC means fs.inotify.max_user_watches is exhausted; let the caller fall back to polling
+            raise OSError(ctypes.get_errno(), f"inotify_add_watch failed for {directory}")
+        self.watches[wd] = directory
+
+    def _add_tree(self, folder):
+        """Watch a directory and everything below it, and return the files already in it."""
+        found = set()
+        for path, directories, files in os.walk(folder):
+            directories[:] = [name for name in directories if not _is_excluded(os.path.join(path, name), self.excluded)]
+            try:
+                self._add_watch(path)
+            except OSError as e:
+                if e.errno not in (errno.ENOENT, errno.ENOTDIR):
+                    raise
+                # Removed between the walk and the watch
+                log.debug("Not watching %s: %s", path, e)
+                directories[:] = []
+                continue
+            found.update(os.path.join(path, name) for name in files)
+        return found
+
+    def poll(self, timeout):
+        """Wait up to `timeout` seconds and return the set of file paths created or modified since the last call.
+
+        Raises OSError with errno ENOSPC when a new directory can't be watched because fs.inotify.max_user_watches
+        is exhausted.
+        """
+        changed = set()
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return changed
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return changed
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, name_length = EVENT_HEADER.unpack_from(data, offset)
+            name = data[offset + EVENT_HEADER.size:offset + EVENT_HEADER.size + name_length].split(b'\x00', 1)[0]
+            offset += EVENT_HEADER.size + name_length
+            if mask & IN_Q_OVERFLOW:
+                log.warning("inotify queue overflowed, rescanning the whole tree")
+                for directory in list(self.watches.values()):
+                    try:
+                        changed.update(os.path.join(directory, name) for name in os.listdir(directory))
+                    except OSError as e:
+                        # Removed since it was watched; its IN_IGNORED event drops the watch
+                        log.debug("Could not rescan %s: %s", directory, e)
+                continue
+            if mask & IN_IGNORED:
+                self.watches.pop(wd, None)
+                continue
+            directory = self.watches.get(wd)
+            if directory is None or not name:
+                continue
+            path = os.path.join(directory, os.fsdecode(name))
+            if mask & IN_ISDIR:
+                # A new or moved-in directory may already hold files by the time it is watched
+                if (mask & (IN_CREATE | IN_MOVED_TO)) and not _is_excluded(path, self.excluded):
+                    try:
+                        changed.update(self._add_tree(path))
+                    except OSError as e:
+                        if e.errno == errno.ENOSPC:
+                            # Out of watches; the caller switches to polling
+                            raise
+                        log.warning("Could not watch %s: %s", path, e)
+            else:
+                changed.add(path)
+        return changed
+
+    def close(self):
+        os.close(self.fd)
+
+
+class PollingWatcher:
+    """Portable watcher that rescans the tree and diffs sizes and mtimes."""
+
+    def __init__(self, folder, excluded=(), interval=DEFAULT_POLL_INTERVAL):
+        self.folder = folder
+        self.excluded = [os.path.abspath(path) for path in excluded]
+        self.interval = interval
+        self.snapshot = self._scan()
+        self._next_scan = time.monotonic() + interval
+
+    def _scan(self):
+        snapshot = {}
+        pending = [self.folder]
+        while pending:
+            directory = pending.pop()
+            try:
+                with os.scandir(directory) as scanner:
+                    for item in scanner:
+                        if item.is_dir(follow_symlinks=False):
+                            if not _is_excluded(item.path, self.excluded):
+                                pending.append(item.path)
+                        elif item.is_file(follow_symlinks=False):
+                            item_stat = item.stat(follow_symlinks=False)
+                            snapshot[item.path] = (item_stat.st_size, item_stat.st_mtime_ns)
+            except OSError:
+                continue
+        return snapshot
+
+    def poll(self, timeout):
+        """Wait up to `timeout` seconds and return the file paths that are new or changed since the previous scan."""
+        time.sleep(max(0.0, min(timeout, self._next_scan - time.monotonic())))
+        if time.monotonic() < self._next_scan:
+            return set()
+        snapshot = self._scan()
+        changed = {path for path, signature in snapshot.items() if self.snapshot.get(path) != signature}
+        self.snapshot = snapshot
+        self._next_scan = time.monotonic() + self.interval
+        return changed
+
+    def close(self):
+        pass
+
+
+def open_watcher(source_folder, excluded=(), poll_interval=DEFAULT_POLL_INTERVAL, use_inotify=True):
+    """Return an inotify watcher where available, falling back to polling."""
+    if use_inotify:
+        try:
+            return InotifyWatcher(source_folder, excluded)
+        except OSError as e:
+            log.warning("inotify unavailable (%s), falling back to polling every %ss", e, poll_interval)
+    return PollingWatcher(source_folder, excluded, poll_interval)
+
+
+def settle_time(watcher, settle_seconds):
+    """Return how long a file must go without events before it is ingested.
+
+    A polling watcher only reports a file still being copied once per scan, so the wait is at least one interval.
+    """
+    if isinstance(watcher, PollingWatcher) and watcher.interval > settle_seconds:
+        log.info("Waiting %ss (the poll interval) for new files to settle", watcher.interval)
+        return watcher.interval
+    return settle_seconds
+
+
+def watch_files(source_folder, output_folder, workers=DEFAULT_WORKERS, hash_algorithm=DEFAULT_HASH_ALGORITHM,
+                cache_path=DEFAULT_CACHE_PATH, settle_seconds=DEFAULT_SETTLE_SECONDS, poll_interval=DEFAULT_POLL_INTERVAL,
+                use_inotify=True, preview_dir=None, layout=DEFAULT_LAYOUT):
+    """Organize the source folder, then keep organizing new and modified files as they land, until interrupted.
+
+    Events are debounced: a file is ingested once it has seen no new event for settle_seconds, or for one poll
+    interval when polling. Files go through the same hash, cache, metadata and link stages as
+    stream_organize_files. If inotify runs out of watches while running, watching continues by polling.
+    """
+    layout = resolve_layout(layout)
+    with FileCache(cache_path) as cache:
+        hash_algorithm = resolve_hash_algorithm(hash_algorithm)
+        with ThreadPoolExecutor(max_workers=workers) as hash_pool, \
+                ProcessPoolExecutor(max_workers=workers, initializer=_ignore_sigint) as metadata_pool:
+            # Start watching before the catch-up pass so nothing copied during it is missed
+            watcher = open_watcher(source_folder, excluded=[output_folder], poll_interval=poll_interval, use_inotify=use_inotify)
+            try:
+                log.info("Catching up on %s", source_folder)
+                ingest_files(find_media_files(source_folder, excluded=[output_folder]), output_folder, cache, hash_pool, metadata_pool, hash_algorithm,
+                             preview_dir=preview_dir, layout=layout)
+                relink_missing(output_folder, cache, hash_pool, metadata_pool, hash_algorithm, preview_dir=preview_dir,
+                               layout=layout)
+                log.info("Watching %s for new files (Ctrl+C to stop)", source_folder)
+                settle = settle_time(watcher, settle_seconds)
+                last_event = {}
+                while True:
+                    try:
+                        changed = watcher.poll(timeout=1.0)
+                    except OSError as e:
+                        if e.errno != errno.ENOSPC:
+                            raise
+                        log.warning("Ran out of inotify watches (%s), falling back to polling every %ss", e, poll_interval)
+                        watcher.close()
+                        watcher = PollingWatcher(source_folder, [output_folder], poll_interval)
+                        settle = settle_time(watcher, settle_seconds)
+                        # Whatever landed in folders that couldn't be watched is only in the first scan, so treat
+                        # the whole tree as changed once; files already ingested are skipped by the cache
+                        changed = set(watcher.snapshot)
+                    now = time.monotonic()
+                    for path in changed:
+                        if media_kind(path) is not None:
+                            last_event[path] = now
+                    now = time.monotonic()
+                    ready = [path for path, seen in last_event.items() if now - seen >= settle]
+                    if not ready:
+                        continue
+                    for path in ready:
+                        del last_event[path]
+                    media_files = [(path, media_kind(path)) for path in ready
+                                   if os.path.isfile(path) and not os.path.islink(path)]
+                    if media_files:
+                        log.info("Ingesting %d new files", len(media_files))
+                        ingest_files(media_files, output_folder, cache, hash_pool, metadata_pool, hash_algorithm,
+                                     preview_dir=preview_dir, layout=layout)
+            except KeyboardInterrupt:
+                log.info("Stopped watching.")
+            finally:
+                watcher.close()
@@ -1,9 +1,54 @@
 import os
 import tkinter as tk
 from tkinter import filedialog, Listbox, Scrollbar
-from PIL import Image, ImageTk, ExifTags, ImageOps
-import io
+from PIL import Image, ImageTk, ImageOps
 import json
+import argparse
+import threading
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from src.cache import FileCache, DEFAULT_CACHE_PATH
+from src.hashing import DEFAULT_HASH_ALGORITHM
+from src.previews import (PreviewCache, DEFAULT_PREVIEW_DIR, PREVIEW_SIZES, RAW_EXTENSIONS, open_image, image_orientation,
+                          orient_image, fit_within, preview_key)
+from src.similar import group_similar
+from src.materialize import LINK_MODES, DEFAULT_LINK_MODE, materialize
+
+VIEWER_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp') + RAW_EXTENSIONS
+
+# Images decoded ahead of and behind the current one
+PREFETCH_AHEAD = 5
+PREFETCH_BEHIND = 2
+PREFETCH_WORKERS = 3
+
+# Memory budget for decoded, screen-sized images kept around for instant navigation
+PREFETCH_CACHE_BYTES = 256 * 1024 * 1024
+
+# How often the Tk thread checks for a decode it is waiting on
+PREFETCH_POLL_MS = 15
+
+# Large folders are listed in batches of this many images, and the first batch is shown before the rest is listed
+LISTING_BATCH_SIZE = 500
+
+# Zoomed views are re-rendered with a fast filter while zooming or panning, then with LANCZOS once input
+# has been idle this long
+RENDER_SETTLE_MS = 150
+INTERACTIVE_FILTER = Image.BILINEAR
+
+# Fraction of the viewport rendered beyond each edge, so short pans only move the canvas item
+RENDER_MARGIN = 0.25
+
+# Smallest mip level kept for full-resolution images
+PYRAMID_MIN_SIZE = 512
+
+# Filmstrip tiles, how many are materialized beyond each edge of the view, and how many decoded thumbnails are kept
+FILMSTRIP_THUMBNAIL_SIZE = 128
+FILMSTRIP_PADDING = 4
+FILMSTRIP_OVERSCAN = 8
+FILMSTRIP_CACHE_SIZE = 2000
+FILMSTRIP_WORKERS = 2
+FILMSTRIP_POLL_MS = 50
 
 def save_session(image_folder, selects_folder):
     """Save the session data (folder paths) to a file."""
@@ -24,8 +69,264 @@ def load_last_session():
         return None, None  # No session file found
 
 
+class ImagePrefetcher:
+    """Decode images on background threads into a size-bounded LRU of display-ready PIL images.
+
+    Only PIL images cross threads; the Tk thread turns finished results into PhotoImages itself.
+    """
+
+    def __init__(self, decode, max_bytes=PREFETCH_CACHE_BYTES, workers=PREFETCH_WORKERS):
+        self.decode = decode
+        self.max_bytes = max_bytes
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="prefetch")
+        self.lock = threading.Lock()
+        self.cache = OrderedDict()
+        self.cache_bytes = 0
+        self.errors = {}
+        # (index, generation) of queued and running decodes; clear() starts a new generation, and results of
+        # older ones (decoded for the previous display size) are dropped
+        self.in_flight = set()
+        self.generation = 0
+        self.wanted = set()
+
+    def get(self, index):
+        """Return the decoded image for index if it is ready, marking it most recently used."""
+        with self.lock:
+            image = self.cache.get(index)
+            if image is not None:
+                self.cache.move_to_end(index)
+            return image
+
+    def error(self, index):
+        """Return the exception raised while decoding index, if any."""
+        with self.lock:
+            return self.errors.get(index)
+
+    def clear(self):
+        """Forget every decoded image, e.g. after the display size changed."""
+        with self.lock:
+            self.cache.clear()
+            self.cache_bytes = 0
+            self.errors.clear()
+            self.generation += 1
+
+    def prefetch(self, index, total):
+        """Queue the image at index first, then its neighbours; stale queued work is skipped."""
+        order = [index] + [index + step for step in range(1, PREFETCH_AHEAD + 1)] + [index - step for step in range(1, PREFETCH_BEHIND + 1)]
+        order = [i for i in order if 0 <= i < total]
+        with self.lock:
+            self.wanted = set(order)
+            generation = self.generation
+            to_submit = [i for i in order
+                         if i not in self.cache and (i, generation) not in self.in_flight and i not in self.errors]
+            self.in_flight.update((i, generation) for i in to_submit)
+        for i in to_submit:
+            self.executor.submit(self._load, i, generation)
+
+    def _load(self, index, generation):
+        with self.lock:
+            if index not in self.wanted or generation != self.generation:
+                # The user moved on, or the display size changed, before this got its turn
+                self.in_flight.discard((index, generation))
+                return
+        try:
+            image = self.decode(index)
+            image.load()
+        except Exception as e:
+            with self.lock:
+                self.in_flight.discard((index, generation))
+                if generation == self.generation:
+                    self.errors[index] = e
+            return
+        size = image.width * image.height * len(image.getbands())
+        with self.lock:
+            self.in_flight.discard((index, generation))
+            if generation != self.generation:
+                return
+            self.cache[index] = image
+            self.cache_bytes += size
+            # Evict least recently used images, keeping the ones around the current position
+            for old_index in list(self.cache):
+                if self.cache_bytes <= self.max_bytes:
+                    break
+                if old_index not in self.wanted:
+                    old = self.cache.pop(old_index)
+                    self.cache_bytes -= old.width * old.height * len(old.getbands())
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+class ImagePyramid:
+    """An image and successively halved copies of it, so zoomed views resample from the nearest larger level."""
+
+    def __init__(self, image, min_size=PYRAMID_MIN_SIZE):
+        self.levels = [image]
+        while min(image.size) // 2 >= min_size:
+            image = image.reduce(2)
+            self.levels.append(image)
+
+    def level_for(self, width):
+        """Return the smallest level at least `width` pixels wide (the base image if none is)."""
+        for level in reversed(self.levels):
+            if level.width >= width:
+                return level
+        return self.levels[0]
+
+
+class Filmstrip:
+    """Horizontal strip of thumbnails that only materializes the tiles in view.
+
+    Thumbnails are loaded on background threads into a bounded LRU of PIL images; PhotoImages exist only for
+    tiles on the canvas, and tiles scrolled out of view are deleted.
+    """
+
+    def __init__(self, parent, total, load_thumbnail, on_select):
+        self.total = total
+        self.load_thumbnail = load_thumbnail
+        self.on_select = on_select
+        self.tile_size = FILMSTRIP_THUMBNAIL_SIZE + 2 * FILMSTRIP_PADDING
+        self.current_index = None
+
+        self.frame = tk.Frame(parent, bg='black')
+        self.canvas = tk.Canvas(self.frame, height=self.tile_size, bg='black', highlightthickness=0,
+                                xscrollincrement=self.tile_size, scrollregion=(0, 0, total * self.tile_size, self.tile_size))
+        self.scrollbar = Scrollbar(self.frame, orient=tk.HORIZONTAL, command=self.scroll)
+        self.canvas.config(xscrollcommand=self.scrollbar.set)
+        self.canvas.pack(side=tk.TOP, fill=tk.X)
+        self.scrollbar.pack(side=tk.BOTTOM, fill=tk.X)
+        self.canvas.bind('<Configure>', lambda event: self.refresh())
+        self.canvas.bind('<Button-1>', self.click)
+        self.canvas.bind('<MouseWheel>', lambda event: self.scroll('scroll', -1 if event.delta > 0 else 1, 'units'))
+        self.canvas.bind('<Button-4>', lambda event: self.scroll('scroll', -1, 'units'))
+        self.canvas.bind('<Button-5>', lambda event: self.scroll('scroll', 1, 'units'))
+        self.highlight = self.canvas.create_rectangle(0, 0, 0, 0, outline='yellow', width=2)
+
+        self.tiles = {}  # index -> (canvas item, PhotoImage or None while loading)
+        self.executor = ThreadPoolExecutor(max_workers=FILMSTRIP_WORKERS, thread_name_prefix="filmstrip")
+        self.lock = threading.Lock()
+        self.thumbnails = OrderedDict()
+        self.pending = set()
+        self.wanted = range(0)
+        self.poll_job = None
+        # Bumped by clear(); thumbnails loaded for an older generation are dropped
+        self.generation = 0
+
+    def clear(self):
+        """Forget every thumbnail and tile, e.g. after the images were reordered."""
+        with self.lock:
+            self.thumbnails.clear()
+            self.pending.clear()
+            self.generation += 1
+        for item, _ in self.tiles.values():
+            self.canvas.delete(item)
+        self.tiles.clear()
+
+    def set_total(self, total):
+        """Resize the strip for a new number of images."""
+        self.total = total
+        self.canvas.config(scrollregion=(0, 0, total * self.tile_size, self.tile_size))
+        self.refresh()
+
+    def scroll(self, *args):
+        self.canvas.xview(*args)
+        self.refresh()
+
+    def click(self, event):
+        index = int(self.canvas.canvasx(event.x) // self.tile_size)
+        if 0 <= index < self.total:
+            self.on_select(index)
+
+    def tile_origin(self, index):
+        return index * self.tile_size + FILMSTRIP_PADDING, FILMSTRIP_PADDING
+
+    def refresh(self):
+        """Create tiles for the indexes in (or near) view and delete the rest."""
+        left = self.canvas.canvasx(0)
+        right = self.canvas.canvasx(self.canvas.winfo_width())
+        first = max(0, int(left // self.tile_size) - FILMSTRIP_OVERSCAN)
+        last = min(self.total, int(right // self.tile_size) + 1 + FILMSTRIP_OVERSCAN)
+        with self.lock:
+            self.wanted = range(first, last)
+        for index in [index for index in self.tiles if not first <= index < last]:
+            self.canvas.delete(self.tiles.pop(index)[0])
+        for index in range(first, last):
+            if index not in self.tiles:
+                self.tiles[index] = self.create_tile(index)
+        self.canvas.tag_raise(self.highlight)
+        if any(photo is None for _, photo in self.tiles.values()) and self.poll_job is None:
+            self.poll_job = self.canvas.after(FILMSTRIP_POLL_MS, self.poll)
+
+    def create_tile(self, index):
+        """Place the thumbnail for index, or a placeholder while it loads in the background."""
+        x, y = self.tile_origin(index)
+        with self.lock:
+            thumbnail = self.thumbnails.get(index)
+            if thumbnail is not None:
+                self.thumbnails.move_to_end(index)
+            elif index not in self.pending:
+                self.pending.add(index)
+                self.executor.submit(self._load, index, self.generation)
+        if thumbnail is None:
+            item = self.canvas.create_rectangle(x, y, x + FILMSTRIP_THUMBNAIL_SIZE, y + FILMSTRIP_THUMBNAIL_SIZE,
+                                                fill='grey20', outline='')
+            return item, None
+        photo = ImageTk.PhotoImage(thumbnail)
+        center = FILMSTRIP_THUMBNAIL_SIZE // 2
+        return self.canvas.create_image(x + center, y + center, image=photo, anchor=tk.CENTER), photo
+
+    def _load(self, index, generation):
+        with self.lock:
+            if generation != self.generation:
+                return
+            if index not in self.wanted:
+                # Scrolled past before this got its turn
+                self.pending.discard(index)
+                return
+        try:
+            thumbnail = self.load_thumbnail(index)
+        except Exception as e:
+            print(f"Could not load thumbnail {index + 1}: {e}")
+            thumbnail = Image.new('RGB', (1, 1), 'grey')
+        with self.lock:
+            if generation != self.generation:
+                return
+            self.pending.discard(index)
+            self.thumbnails[index] = thumbnail
+            while len(self.thumbnails) > FILMSTRIP_CACHE_SIZE:
+                self.thumbnails.popitem(last=False)
+
+    def poll(self):
+        """Swap finished thumbnails in for their placeholders."""
+        self.poll_job = None
+        with self.lock:
+            ready = [index for index, (_, photo) in self.tiles.items() if photo is None and index in self.thumbnails]
+        for index in ready:
+            self.canvas.delete(self.tiles.pop(index)[0])
+            self.tiles[index] = self.create_tile(index)
+        self.canvas.tag_raise(self.highlight)
+        if any(photo is None for _, photo in self.tiles.values()):
+            self.poll_job = self.canvas.after(FILMSTRIP_POLL_MS, self.poll)
+
+    def show_current(self, index):
+        """Highlight the tile of the image being viewed and scroll it into view."""
+        self.current_index = index
+        x, y = self.tile_origin(index)
+        self.canvas.coords(self.highlight, x - 2, y - 2, x + FILMSTRIP_THUMBNAIL_SIZE + 2, y + FILMSTRIP_THUMBNAIL_SIZE + 2)
+        left = self.canvas.canvasx(0)
+        width = self.canvas.winfo_width()
+        if not left <= index * self.tile_size <= left + width - self.tile_size:
+            # Center the current tile
+            self.canvas.xview_moveto(max(0, index * self.tile_size - width / 2) / max(1, self.total * self.tile_size))
+        self.refresh()
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
 class ImageViewer:
-    def __init__(self, root, image_folder, selects_folder):
+    def __init__(self, root, image_folder, selects_folder, cache_path=DEFAULT_CACHE_PATH, preview_dir=DEFAULT_PREVIEW_DIR,
+                 link_mode=DEFAULT_LINK_MODE):
         self.root = root
         self.root.attributes('-fullscreen', True)
         self.root.bind("<Escape>", self.exit_fullscreen)
@@ -36,6 +337,9 @@ class ImageViewer:
         self.root.bind("<Shift-Left>", self.show_previous_selected_image)
         self.root.bind("<Shift-Right>", self.show_next_selected_image)
         self.root.bind("<BackSpace>", self.remove_image)
+        self.root.bind("f", self.toggle_filmstrip)
+        self.root.bind("<bracketleft>", self.show_previous_similar_image)
+        self.root.bind("<bracketright>", self.show_next_similar_image)
 
         # Bind Up and Down keys for zooming
         self.root.bind("<Up>", self.zoom_in)   # Zoom in with Up arrow key
@@ -46,17 +350,31 @@ class ImageViewer:
 
         self.image_folder = image_folder
         self.selects_folder = selects_folder
+        # Selects are symlinked, or hardlinked, reflinked or copied one at a time in the background, in pick order
+        self.link_mode = link_mode
+        self.select_executor = ThreadPoolExecutor(max_workers=1)
+        # File name -> future of each pick still being materialized; it joins the selection once its file is in place
+        self.pending_picks = {}
 
         # Sidebar width (to be considered when centering the image)
         self.sidebar_width = 200
 
-        # Get total image count from the folder (for progressive loading)
-        self.image_files = sorted([f for f in os.listdir(image_folder) if f.lower().endswith(('.png', '.jpg', '.jpeg', '.bmp'))],
-                                  key=lambda x: os.path.getmtime(os.path.join(image_folder, x)))
-        self.total_images = len(self.image_files)
+        # The folder is listed in the background once the window is up; see finish_loading
+        self.image_files = []
+        self.total_images = 0
+        self.image_indexes = {}
+        self.image_sources = {}
+        # The sorted first batch of a large folder, shown until the whole folder is listed and sorted
+        self.first_batch = None
+        self.listing_complete = False
+        # Index -> indexes of its group of near-duplicates, from perceptual hashes stored by the organizer
+        self.similar_groups = {}
         
         self.current_image_index = 0  # Start before the first image
-        self.selected_files = []  # List to hold selected file indexes
+        # Selected image indexes, as a set for membership and a sorted list whose positions match the sidebar rows
+        self.selected_files = set()
+        self.selected_order = []
+        self.highlighted_index = None  # Selected image whose sidebar row is highlighted
 
         # Zoom and pan variables
         self.scale_factor = 1.0  # Track the zoom scale
@@ -64,6 +382,31 @@ class ImageViewer:
         self.image_origin_y = 0
         self.drag_data = {"x": 0, "y": 0}  # To track dragging positions
 
+        # Screen-fitted images are decoded in the background; the Tk thread only displays finished ones
+        self.fit_size = None
+        self.display_image = None
+        self.waiting_for_index = None
+        # Full-resolution decode of one image, made only when zooming in past the fitted size
+        self.full_pyramid = None
+        self.full_image_index = None
+
+        # The canvas item showing the rendered part of the zoomed image, and its extent in canvas coordinates
+        self.canvas_image = None
+        self.rendered_region = None
+        self.rendered_filter = None
+        self.settle_job = None
+        self.prefetcher = ImagePrefetcher(self.decode_display_image)
+
+        # Previews cached by ingest or earlier sessions, by content hash where the ingest file cache has one (see preview_key)
+        self.preview_cache = PreviewCache(preview_dir)
+        threading.Thread(target=self.preview_cache.evict, daemon=True).start()
+        self.file_cache = FileCache(cache_path, check_same_thread=False) if os.path.exists(cache_path) else None
+        self.file_cache_lock = threading.Lock()
+        # By file name: full content hashes known from the file cache, and the (key, hash_algorithm) previews are
+        # stored under
+        self.content_hashes = {}
+        self.preview_keys = {}
+
         # Create sidebar for selected images (on the left)
         self.sidebar = tk.Frame(root, width=self.sidebar_width, bg='lightgrey')
         self.sidebar.pack(fill=tk.Y, side=tk.LEFT)
@@ -77,6 +420,10 @@ class ImageViewer:
         self.listbox.bind('<<ListboxSelect>>', self.on_sidebar_select)
         self.scrollbar.config(command=self.listbox.yview)
 
+        # Thumbnail filmstrip along the bottom
+        self.filmstrip = Filmstrip(root, self.total_images, self.load_thumbnail, self.jump_to_image)
+        self.filmstrip.frame.pack(fill=tk.X, side=tk.BOTTOM)
+
         # Create canvas to display images (on the right)
         self.canvas = tk.Canvas(root, bg="white", cursor="fleur")
         self.canvas.pack(fill=tk.BOTH, expand=True, side=tk.RIGHT)
@@ -89,111 +436,329 @@ class ImageViewer:
         self.canvas.bind("<ButtonPress-1>", self.start_pan)
         self.canvas.bind("<B1-Motion>", self.do_pan)
 
+        # List the folder without blocking the window, then load the selects and the first image
+        self.image_counter_label.config(text="Loading...")
+        self.listing = self.prefetcher.executor.submit(self.list_image_files)
+        self.root.after(PREFETCH_POLL_MS, self.wait_for_listing)
+
+    def list_image_files(self):
+        """Return the image file names in the folder, oldest first. Runs on a background thread.
+
+        Modification times come from the file cache for files the organizer has seen (following its symlinks back
+        to their sources), so only the remaining files are stat'ed. The folder is read in batches, and the first
+        batch is sorted and published in first_batch as soon as it is known.
+        """
+        mtimes = {}
+        batch = []
+        with os.scandir(self.image_folder) as scanner:
+            for entry in scanner:
+                # File types come with the listing, so this costs no extra system calls
+                if entry.name.lower().endswith(VIEWER_EXTENSIONS) and (entry.is_symlink() or entry.is_file(follow_symlinks=False)):
+                    batch.append(entry)
+                if len(batch) == LISTING_BATCH_SIZE:
+                    mtimes.update(self.batch_mtimes(batch))
+                    batch = []
+                    if self.first_batch is None:
+                        self.first_batch = sorted(mtimes, key=lambda name: (mtimes[name], name))
+        mtimes.update(self.batch_mtimes(batch))
+        return sorted(mtimes, key=lambda name: (mtimes[name], name))
+
+    def batch_mtimes(self, entries):
+        """Return {file name: mtime_ns} for a batch of directory entries, recording the sources of symlinks."""
+        mtimes = {}
+        if self.file_cache is not None:
+            sources = {}
+            for entry in entries:
+                # Only symlinks need their target read; regular files are their own source
+                source = os.path.join(self.image_folder, os.readlink(entry.path)) if entry.is_symlink() else entry.path
+                sources[entry.name] = os.path.normpath(source)
+            with self.file_cache_lock:
+                cached = self.file_cache.lookup_mtimes(set(sources.values())) if self.file_cache is not None else {}
+            mtimes = {name: cached[source] for name, source in sources.items() if source in cached}
+            self.image_sources.update(sources)
+        for entry in entries:
+            if entry.name not in mtimes:
+                try:
+                    mtimes[entry.name] = entry.stat().st_mtime_ns
+                except OSError:
+                    # Broken symlink; keep it listed so the viewer reports it when shown
+                    mtimes[entry.name] = 0
+        return mtimes
+
+    def wait_for_listing(self):
+        """Poll the background listing, showing its first batch while a large folder is still being listed, and
+        finish setting up once it is done."""
+        if not self.listing.done():
+            if self.first_batch is not None and not self.total_images:
+                self.finish_loading(self.first_batch, complete=False)
+            self.root.after(PREFETCH_POLL_MS, self.wait_for_listing)
+            return
+        try:
+            image_files = self.listing.result()
+        except OSError as e:
+            print(f"Could not list {self.image_folder}: {e}")
+            image_files = []
+        self.finish_loading(image_files)
+
+    def finish_loading(self, image_files, complete=True):
+        """Install the folder listing (or its first batch), load the existing selects and show the current image.
+
+        When the full listing replaces the first batch, positions change: everything cached by index is dropped,
+        and an image the user has moved to stays on screen.
+        """
+        current_file = self.image_files[self.current_image_index] if self.current_image_index else None
+        replacing = bool(self.total_images)
+        self.image_files = image_files
+        self.total_images = len(image_files)
+        self.image_indexes = {file_name: index for index, file_name in enumerate(image_files)}
+        self.listing_complete = complete
+        self.current_image_index = self.image_indexes.get(current_file, 0)
+        if replacing:
+            # After the swap above, so no background decode files an old image under a new index
+            self.prefetcher.clear()
+            self.filmstrip.clear()
+            self.full_image_index = self.full_pyramid = None
+            self.waiting_for_index = None
+            self.selected_files = set()
+        self.filmstrip.set_total(self.total_images)
+
+        if complete and self.image_sources:
+            self.prefetcher.executor.submit(self.find_similar_images)
+
         # Load selected images in the sidebar on start
         self.load_selected_images()
-
-        # Load the first image when the user presses 'Right' or 'Next'
-        self.root.after(100, self.show_image)
-
-    def load_image_data(self, image_index):
-        """Read the image data from local files (no database)."""
+        if self.total_images:
+            self.show_image()
+        else:
+            self.image_counter_label.config(text="No images")
+
+    def find_similar_images(self):
+        """Group the listed images by the perceptual hashes in the file cache. Runs on a background thread."""
+        indexes = {self.image_sources[name]: index for index, name in enumerate(self.image_files) if name in self.image_sources}
+        with self.file_cache_lock:
+            if self.file_cache is None:
+                return
+            phashes = self.file_cache.lookup_phashes(indexes)
+        groups = group_similar(sorted((indexes[source], phash) for source, phash in phashes.items()))
+        self.similar_groups = {index: group for group in groups for index in group}
+
+    def image_path(self, image_index):
+        """Return the full path of the image at a given index."""
+        return os.path.join(self.image_folder, self.image_files[image_index])
+
+    def preview_key(self, image_index):
+        """Return the (key, hash_algorithm) the previews of an image are stored under, without reading the image.
+
+        Uses the full hash from the file cache where there is one, as ingest does (see previews.preview_key). Runs
+        on a prefetch or filmstrip thread.
+        """
         file_name = self.image_files[image_index]
-        file_path = os.path.join(self.image_folder, file_name)
-        try:
-            with open(file_path, 'rb') as file:
-                binary_data = file.read()
-                return binary_data
-        except Exception as e:
-            print(f"Error loading image {file_name}: {e}")
-            return None
-
-    def get_image_data(self, image_index):
-        """Get the binary data and file name of the image at a given index."""
-        if image_index < 0 or image_index >= self.total_images:
-            print(f"Invalid image index: {image_index}")
-            return None, None
+        if file_name in self.preview_keys:
+            return self.preview_keys[file_name]
+        # Output folders hold symlinks, and the file cache is keyed by the source path
+        path = os.path.realpath(os.path.join(self.image_folder, file_name))
+        file_stat = os.stat(path)
+        cached = None
+        with self.file_cache_lock:
+            if self.file_cache is not None:
+                cached = self.file_cache.lookup_content_hash(path, file_stat)
+        if cached and cached[0]:
+            self.content_hashes[file_name] = (cached[0], cached[2])
+            key = preview_key(path, file_stat, cached[0], cached[2])
+        else:
+            key = preview_key(path, file_stat)
+        self.preview_keys[file_name] = key
+        return key
 
-        file_name = self.image_files[image_index]
-        image_data = self.load_image_data(image_index)
-        return file_name, image_data
+    def decode_display_image(self, image_index):
+        """Load an image fitted to the display size, from the preview cache when it holds a large enough preview.
 
-    def correct_image_orientation(self, image):
-        """Correct image orientation based on EXIF metadata."""
+        Images decoded from the original are added to the preview cache. Runs on a prefetch thread.
+        """
         try:
-            exif = image._getexif()
-            if exif:
-                orientation = None
-                for tag, value in ExifTags.TAGS.items():
-                    if value == 'Orientation':
-                        orientation = exif.get(tag)
-                        break
-
-                if orientation == 3:
-                    image = image.rotate(180, expand=True)
-                elif orientation == 6:
-                    image = image.rotate(270, expand=True)
-                elif orientation == 8:
-                    image = image.rotate(90, expand=True)
-        except (AttributeError, KeyError, IndexError):
-            pass
-        return image
+            file_hash, hash_algorithm = self.preview_key(image_index)
+        except OSError as e:
+            print(f"Could not look up {self.image_files[image_index]} in the preview cache: {e}")
+            file_hash = None
+        if file_hash:
+            preview = self.preview_cache.get(file_hash, hash_algorithm, 'preview')
+            if preview is not None and min(self.fit_size[0] / preview.width, self.fit_size[1] / preview.height) <= 1:
+                return self.resize_image(preview, *self.fit_size)
+        image, orientation = open_image(self.image_path(image_index), self.fit_size)
+        image = self.correct_image_orientation(image, orientation)
+        if file_hash:
+            self.preview_cache.put_all(file_hash, hash_algorithm, image)
+        return self.resize_image(image, *self.fit_size)
+
+    def load_thumbnail(self, image_index):
+        """Return a filmstrip thumbnail, from the preview cache or by decoding at reduced size. Runs on a filmstrip thread."""
+        try:
+            file_hash, hash_algorithm = self.preview_key(image_index)
+        except OSError:
+            file_hash = None
+        if file_hash:
+            thumbnail = self.preview_cache.get(file_hash, hash_algorithm, 'thumbnail')
+            if thumbnail is not None:
+                return fit_within(thumbnail, FILMSTRIP_THUMBNAIL_SIZE)
+        thumbnail_size = PREVIEW_SIZES['thumbnail']
+        image, orientation = open_image(self.image_path(image_index), (thumbnail_size, thumbnail_size))
+        image = self.correct_image_orientation(image, orientation)
+        if file_hash:
+            self.preview_cache.put(file_hash, hash_algorithm, 'thumbnail', image)
+        return fit_within(image, FILMSTRIP_THUMBNAIL_SIZE)
+
+    def decode_full_image(self, image_index):
+        """Decode and orient an image at full resolution and build its pyramid, for deep zoom. Runs on a prefetch thread."""
+        image, orientation = open_image(self.image_path(image_index))
+        image = self.correct_image_orientation(image, orientation)
+        image.load()
+        return ImagePyramid(image)
+
+    def correct_image_orientation(self, image, orientation=None):
+        """Correct image orientation based on EXIF metadata."""
+        if orientation is None:
+            orientation = image_orientation(image)
+        return orient_image(image, orientation)
 
     def show_image(self):
-        """Display the current image."""
-        file_name, image_data = self.get_image_data(self.current_image_index)
-
-        if image_data:
-            try:
-                image = Image.open(io.BytesIO(image_data))
-                image = self.correct_image_orientation(image)
-
-                self.original_image = image  # Store the original image for scaling
-
-                self.update_canvas_image()
-                self.update_image_counter()
-
-            except Exception as e:
-                print(f"Error displaying image {file_name}: {e}")
-
-    
-    def update_canvas_image(self):
-        """Updates the image displayed on the canvas based on zoom and panning."""
-        
-        # Get the image data (if it exists)
-        file_name, image_data = self.get_image_data(self.current_image_index)
-
-        if image_data:
-            try:
-                image = Image.open(io.BytesIO(image_data))
-                image = self.correct_image_orientation(image)
-
-                # Get screen and canvas dimensions
-                screen_height = self.root.winfo_screenheight()
-                available_width = self.canvas.winfo_width()
-
-                # Resize the image initially to fit the canvas (based on original logic)
-                image = self.resize_image(image, available_width, screen_height)
-
-                # Now apply zoom to the resized image
-                scaled_image = image.resize(
-                    (int(image.width * self.scale_factor),
-                     int(image.height * self.scale_factor)),
-                    Image.LANCZOS)
-
-                self.tk_image = ImageTk.PhotoImage(scaled_image)
-
-                # Clear the canvas and apply panning adjustments
-                self.canvas.delete("all")
-
-                # Calculate the center or panned position of the image
-                center_x = available_width // 2 + self.image_origin_x
-                center_y = screen_height // 2 + self.image_origin_y
+        """Display the current image, waiting for the background decode if it is not prefetched yet."""
+        if not self.total_images:
+            return
+        fit_size = (self.canvas.winfo_width(), self.canvas.winfo_height())
+        if fit_size != self.fit_size:
+            self.fit_size = fit_size
+            self.prefetcher.clear()
+        index = self.current_image_index
+        self.update_image_counter()
+        self.filmstrip.show_current(index)
+        self.prefetcher.prefetch(index, self.total_images)
+        image = self.prefetcher.get(index)
+        if image is None:
+            error = self.prefetcher.error(index)
+            if error is not None:
+                print(f"Error displaying image {self.image_files[index]}: {error}")
+            elif self.waiting_for_index != index:
+                self.waiting_for_index = index
+                self.root.after(PREFETCH_POLL_MS, self.wait_for_image, index)
+            return
+        self.waiting_for_index = None
+        self.display_image = image
+        self.update_canvas_image()
 
-                # Display the image on the canvas
-                self.canvas.create_image(center_x, center_y, image=self.tk_image, anchor=tk.CENTER)
+    def wait_for_image(self, image_index):
+        """Poll for a background decode, giving up if the user has navigated elsewhere."""
+        if image_index != self.current_image_index or self.waiting_for_index != image_index:
+            return
+        if self.prefetcher.get(image_index) is None and self.prefetcher.error(image_index) is None:
+            self.root.after(PREFETCH_POLL_MS, self.wait_for_image, image_index)
+            return
+        self.waiting_for_index = None
+        self.show_image()
+
+    def update_canvas_image(self, resample=Image.LANCZOS):
+        """Render the part of the zoomed image around the viewport and place it on the canvas.
+
+        Only the visible region (plus RENDER_MARGIN) is resampled, from the fitted image or, past the fitted
+        size, from the nearest level of the full-resolution pyramid.
+        """
+        if self.display_image is None:
+            return
+        self.rendered_filter = resample
+        viewport_width, viewport_height = self.canvas.winfo_width(), self.canvas.winfo_height()
+        image_left, image_top, zoomed_width, zoomed_height = self.zoomed_image_rect()
+
+        # The part of the zoomed image to render, in zoomed-image pixels
+        margin_x, margin_y = viewport_width * RENDER_MARGIN, viewport_height * RENDER_MARGIN
+        x0 = max(0, -margin_x - image_left)
+        y0 = max(0, -margin_y - image_top)
+        x1 = min(zoomed_width, viewport_width + margin_x - image_left)
+        y1 = min(zoomed_height, viewport_height + margin_y - image_top)
+        if x1 - x0 < 1 or y1 - y0 < 1:
+            # Panned entirely out of view
+            if self.canvas_image is not None:
+                self.canvas.itemconfig(self.canvas_image, state=tk.HIDDEN)
+            self.rendered_region = None
+            return
+
+        source = self.display_image
+        if self.scale_factor > 1:
+            # Past the fitted size, sample from the full-resolution decode once it is ready
+            pyramid = self.request_full_image()
+            if pyramid is not None:
+                source = pyramid.level_for(zoomed_width)
+        ratio = source.width / zoomed_width
+        tile = source.resize((round(x1 - x0), round(y1 - y0)), resample,
+                             box=(x0 * ratio, y0 * ratio, x1 * ratio, y1 * ratio))
+        self.tk_image = ImageTk.PhotoImage(tile)
+
+        left, top = image_left + x0, image_top + y0
+        if self.canvas_image is None:
+            self.canvas_image = self.canvas.create_image(left, top, image=self.tk_image, anchor=tk.NW)
+        else:
+            self.canvas.coords(self.canvas_image, left, top)
+            self.canvas.itemconfig(self.canvas_image, image=self.tk_image, state=tk.NORMAL)
+        self.rendered_region = (left, top, left + tile.width, top + tile.height)
+
+    def zoomed_image_rect(self):
+        """Return (left, top, width, height) of the whole zoomed image in canvas coordinates."""
+        zoomed_width = self.display_image.width * self.scale_factor
+        zoomed_height = self.display_image.height * self.scale_factor
+        center_x = self.canvas.winfo_width() / 2 + self.image_origin_x
+        center_y = self.canvas.winfo_height() / 2 + self.image_origin_y
+        return center_x - zoomed_width / 2, center_y - zoomed_height / 2, zoomed_width, zoomed_height
+
+    def rendered_region_covers_view(self):
+        """Return True if the rendered tile still covers every visible pixel of the zoomed image."""
+        if self.rendered_region is None:
+            return False
+        image_left, image_top, zoomed_width, zoomed_height = self.zoomed_image_rect()
+        visible_left = max(0, image_left)
+        visible_top = max(0, image_top)
+        visible_right = min(self.canvas.winfo_width(), image_left + zoomed_width)
+        visible_bottom = min(self.canvas.winfo_height(), image_top + zoomed_height)
+        left, top, right, bottom = self.rendered_region
+        return left <= visible_left + 1 and top <= visible_top + 1 and right >= visible_right - 1 and bottom >= visible_bottom - 1
+
+    def render_interactive(self):
+        """Render with the fast filter now and with LANCZOS once zooming or panning pauses."""
+        self.update_canvas_image(INTERACTIVE_FILTER)
+        self.schedule_settled_render()
+
+    def schedule_settled_render(self):
+        """(Re)start the timer for the full-quality render."""
+        if self.settle_job is not None:
+            self.root.after_cancel(self.settle_job)
+        self.settle_job = self.root.after(RENDER_SETTLE_MS, self.settled_render)
+
+    def settled_render(self):
+        self.settle_job = None
+        self.update_canvas_image()
 
-            except Exception as e:
-                print(f"Error displaying image {file_name}: {e}")
+    def request_full_image(self):
+        """Return the full-resolution current image, starting a background decode if it is not ready yet."""
+        index = self.current_image_index
+        if self.full_image_index == index:
+            return self.full_pyramid
+        self.full_image_index = index
+        self.full_pyramid = None
+        future = self.prefetcher.executor.submit(self.decode_full_image, index)
+        self.root.after(PREFETCH_POLL_MS, self.wait_for_full_image, index, future)
+        return None
+
+    def wait_for_full_image(self, image_index, future):
+        """Swap in the full-resolution decode when it finishes, if it is still the image being viewed."""
+        if self.full_image_index != image_index:
+            return
+        if not future.done():
+            self.root.after(PREFETCH_POLL_MS, self.wait_for_full_image, image_index, future)
+            return
+        try:
+            self.full_pyramid = future.result()
+        except Exception as e:
+            print(f"Error decoding full image {self.image_files[image_index]}: {e}")
+            return
+        if image_index == self.current_image_index and self.scale_factor > 1:
+            self.update_canvas_image(self.rendered_filter)
 
     def resize_image(self, image, max_width, max_height):
         """Resize image while preserving the aspect ratio."""
@@ -205,12 +770,12 @@ class ImageViewer:
     def zoom_in(self, event=None):
         """Zoom in the image."""
         self.scale_factor *= 1.1  # Increase the zoom scale by 10%
-        self.update_canvas_image()
+        self.render_interactive()
 
     def zoom_out(self, event=None):
         """Zoom out the image."""
         self.scale_factor /= 1.1  # Decrease the zoom scale by 10%
-        self.update_canvas_image()
+        self.render_interactive()
 
     def reset_view(self, event=None):
         """Reset the zoom and panning to the default values."""
@@ -232,8 +797,15 @@ class ImageViewer:
         self.image_origin_x += delta_x
         self.image_origin_y += delta_y
 
-        # Update the image position
-        self.update_canvas_image()
+        # Move the rendered tile; only resample once the pan uncovers something it does not hold
+        if self.canvas_image is not None and self.rendered_region is not None:
+            self.canvas.move(self.canvas_image, delta_x, delta_y)
+            left, top, right, bottom = self.rendered_region
+            self.rendered_region = (left + delta_x, top + delta_y, right + delta_x, bottom + delta_y)
+        if not self.rendered_region_covers_view():
+            self.render_interactive()
+        elif self.rendered_filter != Image.LANCZOS:
+            self.schedule_settled_render()
 
         # Update the drag data for the next movement
         self.drag_data["x"] = event.x
@@ -260,69 +832,156 @@ class ImageViewer:
 
 
     def pick_image(self, event=None):
-        """Create a symlink in the 'selects' folder for the current image."""
-        file_name, _ = self.get_image_data(self.current_image_index)
+        """Create a symlink (or a hardlink, reflink or copy) in the 'selects' folder for the current image."""
+        file_name = self.image_files[self.current_image_index] if self.total_images else None
         if file_name:
             link_path = os.path.join(self.selects_folder, file_name)
             source_path = os.path.join(self.image_folder, file_name)
 
-            if not os.path.exists(link_path):
+            if file_name in self.pending_picks:
+                print(f"{file_name} is still being selected.")
+            elif not os.path.exists(link_path):
+                if self.link_mode != 'symlink':
+                    future = self.select_executor.submit(self.materialize_select, file_name, link_path)
+                    self.pending_picks[file_name] = future
+                    self.root.after(PREFETCH_POLL_MS, self.wait_for_pick, file_name, future)
+                    return
                 try:
                     os.symlink(source_path, link_path)
                     print(f"Selected: {file_name}")
-                    if self.current_image_index not in self.selected_files:
-                        self.selected_files.append(self.current_image_index)
+                    self.add_selection(self.current_image_index)
                     self.update_sidebar()
                 except Exception as e:
                     print(f"Error selecting image {file_name}: {e}")
             else:
                 print(f"{file_name} is already selected.")
 
-        
-    def update_sidebar(self):
-        """Update the sidebar with the selected images, displaying their actual index."""
-        self.listbox.delete(0, tk.END)
-        
-        for index in self.selected_files:
-            file_name = self.image_files[index]
-            display_text = f"{index + 1} - {file_name}"  # Index is 1-based for display purposes
-            self.listbox.insert(tk.END, display_text)
-            
-            # If the current image is selected, highlight it in yellow
-            if index == self.current_image_index:
-                self.listbox.itemconfig(tk.END, {'bg': 'yellow'})
-                self.listbox.see(tk.END)  # Scroll to this item
-            else:
-                self.listbox.itemconfig(tk.END, {'bg': 'white'})
+    def materialize_select(self, file_name, link_path):
+        """Hardlink, reflink or copy an image into the selects folder. Runs on the select thread.
+
+        Copies are checked against the content hash the viewer already knows, if any.
+        """
+        file_hash, hash_algorithm = self.content_hashes.get(file_name, (None, DEFAULT_HASH_ALGORITHM))
+        # The image folder is usually organizer output, so materialize the file its symlink points at
+        source = os.path.realpath(os.path.join(self.image_folder, file_name))
+        materialize(source, link_path, self.link_mode, file_hash, hash_algorithm)
+
+    def wait_for_pick(self, file_name, future):
+        """Add a materialized pick to the selection once its file is in place, or report why it failed.
+
+        Picks are tracked by file name, as positions change when the full listing replaces its first batch.
+        """
+        if not future.done():
+            self.root.after(PREFETCH_POLL_MS, self.wait_for_pick, file_name, future)
+            return
+        if self.pending_picks.get(file_name) is not future:
+            # Removed while it was being materialized; the removal is queued behind it
+            return
+        del self.pending_picks[file_name]
+        try:
+            future.result()
+        except Exception as e:
+            print(f"Error selecting image {file_name}: {e}")
+            return
+        print(f"Selected: {file_name}")
+        if file_name in self.image_indexes:
+            self.add_selection(self.image_indexes[file_name])
+            self.update_sidebar()
 
+    def remove_select(self, link_path):
+        """Remove an image's entry from the selects folder."""
+        if os.path.lexists(link_path):
+            try:
+                os.unlink(link_path)
+                print(f"Unselected and removed {os.path.basename(link_path)}")
+            except Exception as e:
+                print(f"Error removing {os.path.basename(link_path)}: {e}")
+
+    def sidebar_text(self, index):
+        return f"{index + 1} - {self.image_files[index]}"  # Index is 1-based for display purposes
+
+    def add_selection(self, index):
+        """Add an image to the selection and insert its sidebar row in index order."""
+        if index in self.selected_files:
+            return
+        self.selected_files.add(index)
+        row = bisect_left(self.selected_order, index)
+        self.selected_order.insert(row, index)
+        self.listbox.insert(row, self.sidebar_text(index))
+
+    def remove_selection(self, index):
+        """Remove an image from the selection and delete its sidebar row."""
+        if index not in self.selected_files:
+            return
+        self.selected_files.discard(index)
+        row = bisect_left(self.selected_order, index)
+        del self.selected_order[row]
+        self.listbox.delete(row)
+        if self.highlighted_index == index:
+            self.highlighted_index = None
+
+    def update_sidebar(self):
+        """Highlight the current image in the sidebar if it is selected, touching only the rows that change."""
+        if self.highlighted_index == self.current_image_index:
+            return
+        if self.highlighted_index is not None:
+            self.listbox.itemconfig(bisect_left(self.selected_order, self.highlighted_index), {'bg': 'white'})
+            self.highlighted_index = None
+        # If the current image is selected, highlight it in yellow
+        if self.current_image_index in self.selected_files:
+            row = bisect_left(self.selected_order, self.current_image_index)
+            self.listbox.itemconfig(row, {'bg': 'yellow'})
+            self.listbox.see(row)  # Scroll to this item
+            self.highlighted_index = self.current_image_index
 
     def load_selected_images(self):
         """Load the already selected images from the selects folder."""
         if os.path.exists(self.selects_folder):
-            selected_files = [f for f in sorted(os.listdir(self.selects_folder)) if f.lower().endswith(('.png', '.jpg', '.jpeg', '.bmp'))]
-            for selected_file in selected_files:
-                if selected_file in self.image_files:
-                    index = self.image_files.index(selected_file)
-                    if index not in self.selected_files:
-                        self.selected_files.append(index)
+            selected_files = [f for f in os.listdir(self.selects_folder) if f.lower().endswith(VIEWER_EXTENSIONS)]
+            self.selected_files.update(self.image_indexes[f] for f in selected_files if f in self.image_indexes)
+            self.selected_order = sorted(self.selected_files)
+            self.listbox.delete(0, tk.END)
+            self.highlighted_index = None
+            if self.selected_order:
+                self.listbox.insert(tk.END, *(self.sidebar_text(index) for index in self.selected_order))
             self.update_sidebar()
 
     def on_sidebar_select(self, event):
         """Navigate to the image when a file is selected in the sidebar."""
         selected_index = self.listbox.curselection()
         if selected_index:
-            display_text = self.listbox.get(selected_index[0])
-            index_str, file_name = display_text.split(' - ', 1)
-            self.current_image_index = int(index_str) - 1  # Adjust back to 0-based index
+            self.current_image_index = self.selected_order[selected_index[0]]
             self.show_image()
 
+    def toggle_filmstrip(self, event=None):
+        """Show or hide the thumbnail filmstrip."""
+        if self.filmstrip.frame.winfo_ismapped():
+            self.filmstrip.frame.pack_forget()
+        else:
+            self.filmstrip.frame.pack(fill=tk.X, side=tk.BOTTOM, before=self.canvas)
+        # The canvas changes size, so the fitted images have to be redone
+        self.root.after_idle(self.show_image)
+
     def update_image_counter(self):
         """Update the image counter label in the top-right corner."""
-        self.image_counter_label.config(text=f"{self.current_image_index + 1}/{self.total_images}")
+        # A "+" while only the first batch of a large folder is listed
+        text = f"{self.current_image_index + 1}/{self.total_images}{'' if self.listing_complete else '+'}"
+        group = self.similar_groups.get(self.current_image_index)
+        if group:
+            text += f"  (similar {group.index(self.current_image_index) + 1}/{len(group)})"
+        self.image_counter_label.config(text=text)
 
     def exit_fullscreen(self, event=None):
         """Exit full screen and close the application."""
         self.root.attributes('-fullscreen', False)
+        self.prefetcher.shutdown()
+        self.filmstrip.shutdown()
+        # Let selects still being copied finish
+        self.select_executor.shutdown(wait=False)
+        with self.file_cache_lock:
+            if self.file_cache is not None:
+                self.file_cache.close()
+                self.file_cache = None
         self.root.quit()
 
     def jump_to_image(self, image_index):
@@ -362,18 +1021,13 @@ class ImageViewer:
 
     def show_previous_selected_image(self, event=None):
         """Go to the closest previous selected image from the current index."""
-        if not self.selected_files:
+        if not self.selected_order:
             return  # No selected files
 
         # Find the closest previous selected image
-        prev_index = None
-        for idx in reversed(self.selected_files):
-            if idx < self.current_image_index:
-                prev_index = idx
-                break
-
-        if prev_index is not None:
-            self.current_image_index = prev_index
+        position = bisect_left(self.selected_order, self.current_image_index)
+        if position > 0:
+            self.current_image_index = self.selected_order[position - 1]
             self.show_image()
         else:
             print("No previous selected image.")
@@ -382,47 +1036,66 @@ class ImageViewer:
 
     def show_next_selected_image(self, event=None):
         """Go to the closest next selected image from the current index."""
-        if not self.selected_files:
+        if not self.selected_order:
             return  # No selected files
 
         # Find the closest next selected image
-        next_index = None
-        for idx in self.selected_files:
-            if idx > self.current_image_index:
-                next_index = idx
-                break
-
-        if next_index is not None:
-            self.current_image_index = next_index
+        position = bisect_right(self.selected_order, self.current_image_index)
+        if position < len(self.selected_order):
+            self.current_image_index = self.selected_order[position]
             self.show_image()
         else:
             print("No next selected image.")
         self.update_sidebar()  # Update sidebar after navigation
 
+    def show_previous_similar_image(self, event=None):
+        """Go to the previous image in the current image's group of near-duplicates, wrapping around."""
+        group = self.similar_groups.get(self.current_image_index)
+        if not group:
+            print("No similar images.")
+            return
+        self.current_image_index = group[group.index(self.current_image_index) - 1]
+        self.show_image()
+        self.update_sidebar()
+
+    def show_next_similar_image(self, event=None):
+        """Go to the next image in the current image's group of near-duplicates, wrapping around."""
+        group = self.similar_groups.get(self.current_image_index)
+        if not group:
+            print("No similar images.")
+            return
+        self.current_image_index = group[(group.index(self.current_image_index) + 1) % len(group)]
+        self.show_image()
+        self.update_sidebar()
+
     def remove_image(self, event=None):
         """Remove the current image from the selected list and delete the symlink."""
-        if self.current_image_index in self.selected_files:
-            # Get the filename and symlink path
-            file_name = self.image_files[self.current_image_index]
+        file_name = self.image_files[self.current_image_index] if self.total_images else None
+        if file_name in self.pending_picks:
+            # Drop the pick once it is materialized, behind it on the select thread
+            del self.pending_picks[file_name]
+            self.select_executor.submit(self.remove_select, os.path.join(self.selects_folder, file_name))
+        elif self.current_image_index in self.selected_files:
             link_path = os.path.join(self.selects_folder, file_name)
 
-            # Remove the symlink if it exists
-            if os.path.exists(link_path):
-                try:
-                    os.unlink(link_path)
-                    print(f"Unselected and removed symlink for: {file_name}")
-                except Exception as e:
-                    print(f"Error removing symlink for {file_name}: {e}")
-            
-            # Remove the image from the selected files list
-            self.selected_files.remove(self.current_image_index)
-            
-            # Update the sidebar to reflect the change
-            self.update_sidebar()
+            if self.link_mode == 'symlink':
+                self.remove_select(link_path)
+            else:
+                # Queued behind any copy of the same image that is still running
+                self.select_executor.submit(self.remove_select, link_path)
+
+            # Remove the image from the selected files and its sidebar row
+            self.remove_selection(self.current_image_index)
         else:
             print("Image is not in the selected list.")
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Browse a folder of images and pick selects.")
+    parser.add_argument('--link-mode', default=DEFAULT_LINK_MODE, choices=LINK_MODES,
+                        help="How picks appear in the selects folder: symlinks, hardlinks, reflinks or verified copies.")
+    parser.add_argument('--cache-db', default=DEFAULT_CACHE_PATH, help="Path of the SQLite file cache the organizer wrote (default: file_cache.db in the working directory).")
+    parser.add_argument('--preview-dir', default=DEFAULT_PREVIEW_DIR, help="Folder of the preview cache (default: previews in the working directory).")
+    args = parser.parse_args()
     root = tk.Tk()
 
     # Load the last session if available
@@ -449,5 +1122,6 @@ if __name__ == "__main__":
         save_session(image_folder, selects_folder)
 
         # Initialize the viewer with the selected folders
-        viewer = ImageViewer(root, image_folder, selects_folder)
+        viewer = ImageViewer(root, image_folder, selects_folder, cache_path=args.cache_db, preview_dir=args.preview_dir,
+                             link_mode=args.link_mode)
         root.mainloop()